@@ -1,15 +1,16 @@
 import logging
 from functools import wraps
-from typing import Dict, Optional, Callable, Any
+from typing import Dict, Optional, Callable, Any, Awaitable, List, Tuple
 
 import openai
 from openai._exceptions import OpenAIError
 
-from config import client
-from config import GPT_MODEL, MAX_TOKENS, TEMPERATURE
-from config import PROMPT_SYS, PROMPT_USER_STRUCTURE, PROMPT_USER_FILE_ANALYZE
+from scheduler import openai_scheduler
+from json_stream import JSONFieldParser
+from config import STAGE_SETTINGS, DEFAULT_TOTAL_MAX_TOKENS, STREAM_ENABLED, STREAM_EARLY_STOP
+from config import PROMPT_SYS, PROMPT_USER_STRUCTURE, PROMPT_USER_FILE_ANALYZE, PROMPT_USER_FILES_ANALYZE
 from config import PROMPT_USER_SUMMARY_TASK, PROMPT_USER_SUMMARY_SOLUTIONS
-from config import PROMPT_USER_SUMMARY_SKILLS, PROMPT_USER_SUMMARY_RATING
+from config import PROMPT_USER_SUMMARY_SKILLS, PROMPT_USER_SUMMARY_RATING, PROMPT_USER_REVIEW_TASK
 from config import PROMPT_USER_REDUCE_TASK, PROMPT_USER_REDUCE_SOLUTIONS
 from config import PROMPT_USER_REDUCE_SKILLS, PROMPT_USER_REDUCE_RATING
 
@@ -32,6 +33,53 @@ def handle_api_errors(func: Callable) -> Callable:
     return wrapper
 
 
+# Receives the top-level fields of a JSON completion as they complete: await on_field(name, value)
+FieldCallback = Callable[[str, Any], Awaitable[None]]
+
+
+async def complete(stage: str, request: dict, on_field: Optional[FieldCallback] = None,
+                   early_stop: bool = False) -> str:
+    """
+    Sends a chat completion request through `openai_scheduler` and returns the stripped text of the response.
+
+    Args:
+        stage (str): The review stage of the request.
+        request (dict): The `chat.completions.create` arguments.
+        on_field (Optional[FieldCallback]): Receives every top-level field of a JSON object response once.
+        early_stop (bool): Stop a streamed response as soon as a whole JSON object has arrived.
+
+    Notes:
+    - With `STREAM_ENABLED` the response is streamed and parsed incrementally, `on_field` is called as soon as
+      each field completes. Otherwise `on_field` is called for all fields once the response is received.
+    """
+    parser = JSONFieldParser()
+
+    async def on_text(text: str) -> bool:
+        for name, value in parser.update(text):
+            if on_field is not None:
+                await on_field(name, value)
+        return early_stop and STREAM_EARLY_STOP and parser.complete
+
+    if STREAM_ENABLED:
+        completion = await openai_scheduler.stream(stage=stage, on_text=on_text, **request)
+        if completion.stopped:
+            logger.info(f"Streamed {stage} response stopped after the JSON object")
+        return completion.text.strip()
+
+    response = await openai_scheduler.create(stage=stage, **request)
+    text = response.choices[0].message.content
+    if on_field is not None:
+        await on_text(text)
+    return text.strip()
+
+
+def stage_options(stage: str) -> dict:
+    """
+    Returns the model, max_tokens and temperature of the requests of a stage (`STAGE_SETTINGS`).
+    """
+    return dict(STAGE_SETTINGS[stage])
+
+
 @handle_api_errors
 async def analyze_structure(files: Dict[str, Optional[str]], description: str) -> str:
     """
@@ -57,8 +105,7 @@ async def analyze_structure(files: Dict[str, Optional[str]], description: str) -
     """
     structure = ", ".join(files.keys())
     try:
-        response = await client.chat.completions.create(
-            model=GPT_MODEL,
+        return await complete("structure", dict(
             messages=[
                 {
                     "role": "system",
@@ -69,19 +116,60 @@ async def analyze_structure(files: Dict[str, Optional[str]], description: str) -
                     "content": f"Project structure:{structure}\n{PROMPT_USER_STRUCTURE}"
                 }
             ],
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE
-        )
-
-        return response.choices[0].message.content.strip()
+            **stage_options("structure")
+        ))
 
     except OpenAIError as e:
         logger.error(f"OpenAI API error: {e}")
         raise
 
 
+def file_analysis_request(name: str, content: str, level: str, description: str,
+                          model: Optional[str] = None) -> dict:
+    """
+    Builds the `chat.completions.create` arguments of a file analysis (`analyze_file_content`).
+    The offline batch mode sends the same arguments as the body of a batch request.
+    `model` overrides the model of the map stage (the cascade escalation).
+    """
+    options = stage_options("map")
+    if model:
+        options["model"] = model
+    return dict(
+        messages=[
+            {"role": "system",
+             "content": f"{PROMPT_SYS}{description}"
+             },
+            {"role": "user",
+             "content": f"File name: {name}\n{content}\n{PROMPT_USER_FILE_ANALYZE}{level}"
+             }
+        ],
+        **options
+    )
+
+
+def files_pack_request(files: List[Tuple[str, str]], level: str, description: str) -> dict:
+    """
+    Builds the `chat.completions.create` arguments of a packed analysis of several files (`analyze_files_pack`).
+    """
+    files_text = "".join(f"File name: {name}\n{content}\n" for name, content in files)
+    options = stage_options("map")
+    options["max_tokens"] = min(options["max_tokens"] * len(files), DEFAULT_TOTAL_MAX_TOKENS)
+    return dict(
+        messages=[
+            {"role": "system",
+             "content": f"{PROMPT_SYS}{description}"
+             },
+            {"role": "user",
+             "content": f"{files_text}{PROMPT_USER_FILES_ANALYZE}{level}"
+             }
+        ],
+        **options
+    )
+
+
 @handle_api_errors
-async def analyze_file_content(name: str, content: str, level: str, description: str) -> str:
+async def analyze_file_content(name: str, content: str, level: str, description: str,
+                               model: Optional[str] = None) -> str:
     """
     Analyzes the content of a file by making a request to the OpenAI API.
 
@@ -90,6 +178,7 @@ async def analyze_file_content(name: str, content: str, level: str, description:
         content (str): The content of the file to be analyzed.
         level (str): The development level or context for the analysis.
         description (str): Additional description or context for the analysis.
+        model (Optional[str]): Overrides the model of the map stage, e.g. `CASCADE_MODEL`.
 
     Returns:
         str: A response string from the OpenAI API containing the analysis result.
@@ -99,20 +188,9 @@ async def analyze_file_content(name: str, content: str, level: str, description:
         Exception: For any other errors encountered during execution.
     """
     try:
-        response = await client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
-                {"role": "system",
-                 "content": f"{PROMPT_SYS}{description}"
-                 },
-                {"role": "user",
-                 "content": f"File name: {name}\n{content}\n{PROMPT_USER_FILE_ANALYZE}{level}"
-                 }
-            ],
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE
+        return await complete(
+            "map", file_analysis_request(name, content, level, description, model), early_stop=True
         )
-        return response.choices[0].message.content.strip()
 
     except openai.OpenAIError as e:
         logger.error(f"OpenAI API error: {e}")
@@ -120,7 +198,34 @@ async def analyze_file_content(name: str, content: str, level: str, description:
 
 
 @handle_api_errors
-async def analyze_summary(analysis: list, results_structure: str, dev_level: str, description: str) -> str:
+async def analyze_files_pack(files: List[Tuple[str, str]], level: str, description: str) -> str:
+    """
+    Analyzes several small files in a single request to the OpenAI API.
+
+    Args:
+        files (List[Tuple[str, str]]): (file name, content) pairs to be analyzed.
+        level (str): The development level or context for the analysis.
+        description (str): Additional description or context for the analysis.
+
+    Returns:
+        str: A JSON object string from the OpenAI API, keyed by file name with one analysis per file.
+        The completion limit is the map stage max_tokens per file, capped at `DEFAULT_TOTAL_MAX_TOKENS`.
+
+    Raises:
+        openai.error.OpenAIError: If an error occurs during the API request.
+        Exception: For any other errors encountered during execution.
+    """
+    try:
+        return await complete("map", files_pack_request(files, level, description), early_stop=True)
+
+    except openai.OpenAIError as e:
+        logger.error(f"OpenAI API error: {e}")
+        raise
+
+
+@handle_api_errors
+async def analyze_summary(analysis: list, results_structure: str, dev_level: str, description: str,
+                          on_field: Optional[FieldCallback] = None) -> str:
     """
     Generates a summary review based on provided analysis results, developer level, and description.
 
@@ -129,6 +234,7 @@ async def analyze_summary(analysis: list, results_structure: str, dev_level: str
     results_structure (str): A string representing the structure analysis result.
     dev_level (str): The developer's level, used to customize the summary and rating.
     description (str): Additional context or description to guide the summary process.
+    on_field (Optional[FieldCallback]): Receives the fields of the summary JSON as they complete.
 
     Returns:
     str: A structured summary generated from the input data, formatted as a string.
@@ -151,8 +257,7 @@ async def analyze_summary(analysis: list, results_structure: str, dev_level: str
     {PROMPT_USER_SUMMARY_SOLUTIONS}\n{PROMPT_USER_SUMMARY_SKILLS}
     {PROMPT_USER_SUMMARY_RATING}{dev_level}
     """
-    response = await client.chat.completions.create(
-        model=GPT_MODEL,
+    return await complete("summary", dict(
         messages=[
             {"role": "system",
              "content": f"{PROMPT_SYS}{description}"
@@ -161,14 +266,13 @@ async def analyze_summary(analysis: list, results_structure: str, dev_level: str
              "content": prompt
              }
         ],
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE
-    )
-    return response.choices[0].message.content.strip()
+        **stage_options("summary")
+    ), on_field)
 
 
 @handle_api_errors
-async def analyze_reduce(analysis_butch: list, dev_level: str, description: str) -> str:
+async def analyze_reduce(analysis_butch: list, dev_level: str, description: str,
+                         on_field: Optional[FieldCallback] = None) -> str:
     """
     Generate a summary review based on the analysis of multiple files, the results structure,
     developer level, and a provided description.
@@ -178,6 +282,8 @@ async def analyze_reduce(analysis_butch: list, dev_level: str, description: str)
     results_structure (str): A structured result summarizing the analysis of the project's overall architecture.
     dev_level (str): The developer's experience level (e.g., "Junior", "Intermediate", "Senior").
     description (str): Additional contextual information to customize the analysis and summary.
+    on_field (Optional[FieldCallback]): Receives the fields of the review JSON as they complete (the final
+    reduction only).
 
     Returns:
     str: A string containing the summarized review, including comments, skill evaluation,
@@ -199,8 +305,7 @@ async def analyze_reduce(analysis_butch: list, dev_level: str, description: str)
     {PROMPT_USER_REDUCE_SOLUTIONS}\n{PROMPT_USER_REDUCE_SKILLS}
     {PROMPT_USER_REDUCE_RATING}{dev_level}
     """
-    response = await client.chat.completions.create(
-        model=GPT_MODEL,
+    return await complete("reduce", dict(
         messages=[
             {"role": "system",
              "content": f"{PROMPT_SYS}{description}"
@@ -209,8 +314,54 @@ async def analyze_reduce(analysis_butch: list, dev_level: str, description: str)
              "content": prompt
              }
         ],
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE
+        **stage_options("reduce")
+    ), on_field)
+
+
+def repository_review_request(files: Dict[str, str], paths: List[str], metrics: str, level: str,
+                              description: str) -> dict:
+    """
+    Builds the `chat.completions.create` arguments of a single-request review of a small repository
+    (`analyze_repository`).
+    """
+    files_text = "".join(f"File name: {name}\n{content}\n" for name, content in files.items())
+    prompt = f"""Project structure:{", ".join(paths)}\n{files_text}{metrics}\n{PROMPT_USER_REVIEW_TASK}
+    {PROMPT_USER_SUMMARY_SOLUTIONS}\n{PROMPT_USER_SUMMARY_SKILLS}
+    {PROMPT_USER_SUMMARY_RATING}{level}
+    """
+    return dict(
+        messages=[
+            {"role": "system",
+             "content": f"{PROMPT_SYS}{description}"
+             },
+            {"role": "user",
+             "content": prompt
+             }
+        ],
+        **stage_options("review")
     )
 
-    return response.choices[0].message.content.strip()
+
+@handle_api_errors
+async def analyze_repository(files: Dict[str, str], paths: List[str], metrics: str, level: str,
+                             description: str, on_field: Optional[FieldCallback] = None) -> str:
+    """
+    Reviews a small repository with one request: the structure and the content of all files are sent together
+    and the model returns the final review JSON, as `analyze_summary` does.
+
+    Args:
+        files (Dict[str, str]): File name to content of the files to review.
+        paths (List[str]): All paths of the repository (the project structure).
+        metrics (str): The static analysis report of the Python files, may be empty.
+        level (str): The development level or context for the analysis.
+        description (str): Additional description or context for the analysis.
+        on_field (Optional[FieldCallback]): Receives the fields of the review JSON as they complete.
+
+    Returns:
+        str: The review JSON string from the OpenAI API.
+
+    Raises:
+        openai.error.OpenAIError: If an error occurs during the API request.
+        Exception: For any other errors encountered during execution.
+    """
+    return await complete("review", repository_review_request(files, paths, metrics, level, description), on_field)
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from config import BATCH_CONCURRENCY, DEBUG_LEVEL
+from http_client import start_http_client, close_http_client
+from offline import run_offline_batch
+from review import run_review
+from schemas import BatchReviewItem, ReviewRequest
+
+logger = logging.getLogger(__name__)
+
+
+class BatchLimiter:
+    """
+    Process-wide budget of batch reviews in flight, shared by all batches.
+
+    Args:
+    concurrency (int): Max number of batch reviews running at the same time.
+
+    Notes:
+    - Waiters are served in arrival order and every batch waits for one slot at a time, so concurrent batches
+      take turns instead of the first one occupying all slots until it is finished.
+    - OpenAI requests of the reviews are additionally paced by the process-wide `openai_scheduler`, so the
+      throughput of a batch is bounded by the API quota.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily inside the running event loop
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self.in_flight = 0
+        return self._semaphore
+
+    async def acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        Returns the concurrency budget, batch reviews in flight and batches waiting for a slot.
+        """
+        return {"concurrency": self.concurrency, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+async def run_batch(requests: List[ReviewRequest], ids: Optional[List[Optional[str]]] = None) -> AsyncIterator[dict]:
+    """
+    Reviews many repositories under the shared `batch_limiter` budget.
+
+    Args:
+    requests (List[ReviewRequest]): The reviews to run.
+    ids (Optional[List[Optional[str]]]): Caller ids of the reviews, returned with their results.
+
+    Yields:
+    dict: One result per request in completion order: "index" (position in `requests`), "id", "git_url",
+    "dev_level", "status" ("done" or "failed"), "seconds", and either "result" (the `/review` payload) or
+    "error" (`status_code` and `detail`).
+
+    Notes:
+    - A failed review does not stop the batch.
+    - When the generator is closed early (e.g. the client disconnects), running reviews are cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    def finished(task: asyncio.Task) -> None:
+        # A done callback also runs for a task cancelled before it started, so the slot is never lost
+        tasks.discard(task)
+        batch_limiter.release()
+        if not task.cancelled():
+            queue.put_nowait(task.result())
+
+    async def feed() -> None:
+        for index, request in enumerate(requests):
+            await batch_limiter.acquire()
+            task = asyncio.create_task(_review_item(index, request, ids[index] if ids else None))
+            tasks.add(task)
+            task.add_done_callback(finished)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        for _ in requests:
+            yield await queue.get()
+    finally:
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+async def _review_item(index: int, request: ReviewRequest, item_id: Optional[str]) -> dict:
+    item = {"index": index, "id": item_id, "git_url": request.git_url, "dev_level": request.dev_level}
+    start_time = time.perf_counter()
+    try:
+        item.update(status="done", result=await run_review(request))
+    except HTTPException as e:
+        item.update(status="failed", error={"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.exception(f"Batch review of {request.git_url} failed: {e}")
+        item.update(status="failed", error={"status_code": 500, "detail": "Internal Server Error"})
+    item["seconds"] = round(time.perf_counter() - start_time, 3)
+    logger.info(f"Batch review {index} of {request.git_url} {item['status']} in {item['seconds']}s")
+    return item
+
+
+async def stream_batch(requests: List[ReviewRequest], ids: Optional[List[Optional[str]]] = None
+                       ) -> AsyncIterator[str]:
+    """
+    Runs `run_batch` and yields its results as newline-delimited JSON.
+    """
+    async for item in run_batch(requests, ids):
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+async def run_batch_file(input_path: Path,
+                         output_path: Path,
+                         description: str = "",
+                         dev_level: str = "junior",
+                         offline: bool = False
+                         ) -> dict:
+    """
+    Reviews the repositories of a JSONL file and writes one JSONL result per repository.
+
+    Args:
+    input_path (Path): One JSON object per line with "git_url" and optional "id", "description" and "dev_level".
+    output_path (Path): Results are appended line by line as reviews finish, each with the "line" number
+    of its request.
+    description (str): Shared description of requests without their own.
+    dev_level (str): Shared dev_level of requests without their own.
+    offline (bool): Send the map stage of all reviews as one OpenAI Batch API job (`run_offline_batch`).
+
+    Returns:
+    dict: Numbers of "done" and "failed" reviews.
+
+    Notes:
+    - Invalid lines are reported as failed results with status code 422, the other lines are still reviewed.
+    """
+    requests, ids, lines = [], [], []
+    counts = {"done": 0, "failed": 0}
+    with open(output_path, "w", encoding="utf-8") as output:
+
+        def write(item: dict) -> None:
+            counts[item["status"]] += 1
+            output.write(json.dumps(item, ensure_ascii=False) + "\n")
+            output.flush()
+
+        with open(input_path, encoding="utf-8") as source:
+            for number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = BatchReviewItem.model_validate_json(line)
+                except ValidationError as e:
+                    write({"line": number, "status": "failed", "error": {"status_code": 422, "detail": str(e)}})
+                    continue
+                requests.append(ReviewRequest(
+                    git_url=item.git_url,
+                    description=description if item.description is None else item.description,
+                    dev_level=item.dev_level or dev_level,
+                ))
+                ids.append(item.id)
+                lines.append(number)
+
+        logger.info(f"Batch of {len(requests)} reviews from {input_path}")
+        await start_http_client()
+        try:
+            if offline:
+                results = run_offline_batch(requests, ids, concurrency=batch_limiter.concurrency)
+            else:
+                results = run_batch(requests, ids)
+            async for result in results:
+                write({"line": lines[result["index"]], **result})
+        finally:
+            await close_http_client()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Review the repositories of a JSONL file")
+    parser.add_argument("input", type=Path, help="JSONL file, one {\"git_url\", \"id\", \"description\", "
+                                                 "\"dev_level\"} object per line")
+    parser.add_argument("--output", type=Path, default=Path("results.jsonl"), help="JSONL file of the results")
+    parser.add_argument("--description", default="", help="shared description of requests without their own")
+    parser.add_argument("--dev-level", default="junior", choices=["junior", "middle", "strong"])
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="reviews in flight")
+    parser.add_argument("--offline", action="store_true",
+                        help="analyze files with the OpenAI Batch API: cheaper, but results may take up to 24h")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=DEBUG_LEVEL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    batch_limiter.concurrency = args.concurrency
+    start_time = time.time()
+    counts = asyncio.run(run_batch_file(args.input, args.output, args.description, args.dev_level, args.offline))
+    logger.info(f"Batch finished in {time.time() - start_time:.2f}s: {counts}, results in {args.output}")
+
+
+batch_limiter = BatchLimiter(BATCH_CONCURRENCY)
+
+
+if __name__ == "__main__":
+    main()
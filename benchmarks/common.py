@@ -0,0 +1,99 @@
+import hashlib
+import math
+import random
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass
+class Latency:
+    """
+    Latency distribution of a fake server.
+
+    Attributes:
+    kind (str): "fixed" (a - milliseconds), "uniform" (a..b milliseconds) or "lognormal" (a - median
+    milliseconds, b - sigma).
+    a (float): First parameter.
+    b (float): Second parameter.
+    """
+    kind: str
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self) -> float:
+        """
+        Returns one latency in seconds.
+        """
+        if self.kind == "uniform":
+            return random.uniform(self.a, self.b) / 1000
+        if self.kind == "lognormal":
+            return random.lognormvariate(math.log(max(self.a, 0.001)), self.b) / 1000
+        return self.a / 1000
+
+
+def parse_latency(spec: str) -> Latency:
+    """
+    Parses a latency spec: "50" or "fixed:50", "uniform:20:200", "lognormal:150:0.5" (all in milliseconds).
+    """
+    parts = spec.strip().split(":")
+    if len(parts) == 1:
+        return Latency("fixed", float(parts[0]))
+    kind, params = parts[0], [float(part) for part in parts[1:]]
+    if kind not in ("fixed", "uniform", "lognormal") or not 1 <= len(params) <= 2:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    return Latency(kind, *params)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Returns the p-th percentile (0-100) of values with linear interpolation, 0.0 for no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def synthetic_directories(dirs: int, depth: int = 1) -> List[str]:
+    """
+    Returns `dirs` directory paths nested in chains of `depth` levels: d0, d0/d1, ..., d{depth}, ...
+    """
+    paths = []
+    for i in range(dirs):
+        parent = paths[-1] if i % depth and paths else ""
+        paths.append(f"{parent}/d{i}" if parent else f"d{i}")
+    return paths
+
+
+def synthetic_repository(name: str, files: int, dirs: int, depth: int = 1, file_size: int = 2000) -> Dict[str, str]:
+    """
+    Builds a deterministic synthetic repository.
+
+    Args:
+    name (str): Repository name, it seeds the content so that different repositories never share analyses.
+    files (int): Number of files, spread round-robin over the root and the directories.
+    dirs (int): Number of directories.
+    depth (int): Nesting depth of the directories (see `synthetic_directories`).
+    file_size (int): Approximate size of a file in bytes.
+
+    Returns:
+    Dict[str, str]: File path to content. Every 5th file is Markdown, every 7th has an ignored extension.
+    """
+    folders = [""] + synthetic_directories(dirs, depth)
+    seed = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+    repository = {}
+    for i in range(files):
+        folder = folders[i % len(folders)]
+        if i % 7 == 6:
+            file_name, line = f"data_{i}.txt", f"{seed} {i} sample data\n"
+        elif i % 5 == 4:
+            file_name, line = f"notes_{i}.md", f"- {seed} note {i}: describe the module\n"
+        else:
+            file_name = f"module_{i}.py"
+            line = f"def function_{seed}_{i}(value):\n    return value * {i}\n\n\n"
+        content = line * max(1, file_size // len(line))
+        repository[f"{folder}/{file_name}" if folder else file_name] = content
+    return repository
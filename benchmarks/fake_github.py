@@ -0,0 +1,157 @@
+"""
+Local stand-in for the GitHub API endpoints used by the review service.
+
+Run: python -m benchmarks.fake_github --port 8101 --files 40 --dirs 5 --latency lognormal:50:0.5
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import random
+import tarfile
+from collections import Counter
+from functools import lru_cache
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from benchmarks.common import Latency, parse_latency, synthetic_repository
+
+
+def create_app(files: int = 40,
+               dirs: int = 5,
+               depth: int = 1,
+               file_size: int = 2000,
+               latency: Latency = Latency("fixed"),
+               rate_limit_ratio: float = 0.0
+               ) -> FastAPI:
+    """
+    Creates the fake GitHub API app.
+
+    Args:
+    files (int): Files per synthetic repository.
+    dirs (int): Directories per synthetic repository.
+    depth (int): Nesting depth of the directories.
+    file_size (int): Approximate file size in bytes.
+    latency (Latency): Latency added to every response.
+    rate_limit_ratio (float): Share of requests answered with 429 and `Retry-After`.
+
+    Notes:
+    - Every owner/repo exists, its content is seeded by the repository name.
+    - `GET /stats` returns request counters by endpoint, `POST /reset` clears them.
+    """
+    app = FastAPI()
+    counters: Counter = Counter()
+
+    @lru_cache(maxsize=256)
+    def repository(owner: str, repo: str) -> Dict[str, str]:
+        return synthetic_repository(f"{owner}/{repo}", files, dirs, depth, file_size)
+
+    @app.middleware("http")
+    async def simulate(request: Request, call_next):
+        if request.url.path in ("/stats", "/reset"):
+            return await call_next(request)
+        counters["requests"] += 1
+        await asyncio.sleep(latency.sample())
+        if rate_limit_ratio and random.random() < rate_limit_ratio:
+            counters["rate_limited"] += 1
+            return JSONResponse(status_code=429, content={"message": "API rate limit exceeded"},
+                                headers={"Retry-After": "1"})
+        return await call_next(request)
+
+    @app.get("/repos/{owner}/{repo}/contents")
+    @app.get("/repos/{owner}/{repo}/contents/{path:path}")
+    async def contents(owner: str, repo: str, request: Request, path: str = "") -> JSONResponse:
+        counters["contents"] += 1
+        base = str(request.base_url).rstrip("/")
+        prefix = f"{path}/" if path else ""
+        entries = {}
+        for file_path in repository(owner, repo):
+            if not file_path.startswith(prefix):
+                continue
+            name = file_path[len(prefix):].split("/", 1)[0]
+            child = f"{prefix}{name}"
+            if child == file_path:
+                entries[name] = {"type": "file", "name": name, "path": child,
+                                 "download_url": f"{base}/raw/{owner}/{repo}/{child}"}
+            else:
+                entries[name] = {"type": "dir", "name": name, "path": child,
+                                 "_links": {"self": f"{base}/repos/{owner}/{repo}/contents/{child}"}}
+        if not entries:
+            return JSONResponse(status_code=404, content={"message": "Not Found"})
+        return JSONResponse(content=list(entries.values()))
+
+    @app.get("/raw/{owner}/{repo}/{path:path}")
+    async def raw(owner: str, repo: str, path: str) -> Response:
+        counters["raw"] += 1
+        content = repository(owner, repo).get(path)
+        if content is None:
+            return PlainTextResponse("404: Not Found", status_code=404)
+        return PlainTextResponse(content)
+
+    @app.get("/repos/{owner}/{repo}/commits/HEAD")
+    async def head_commit(owner: str, repo: str) -> Response:
+        counters["commits"] += 1
+        return PlainTextResponse(hashlib.sha1(f"{owner}/{repo}".encode("utf-8")).hexdigest())
+
+    @app.get("/repos/{owner}/{repo}/git/trees/HEAD")
+    async def tree(owner: str, repo: str) -> JSONResponse:
+        counters["trees"] += 1
+        paths = repository(owner, repo)
+        folders = {path.rsplit("/", 1)[0] for path in paths if "/" in path}
+        items = [{"path": folder, "type": "tree"} for folder in sorted(folders)]
+        items += [{"path": path, "type": "blob"} for path in paths]
+        return JSONResponse(content={"sha": "HEAD", "truncated": False, "tree": items})
+
+    @app.get("/repos/{owner}/{repo}/tarball/HEAD")
+    async def tarball(owner: str, repo: str) -> Response:
+        counters["tarball"] += 1
+        return Response(content=_tarball(repository(owner, repo), f"{owner}-{repo}-HEAD"),
+                        media_type="application/x-gzip")
+
+    @app.get("/stats")
+    async def stats() -> JSONResponse:
+        return JSONResponse(content=dict(counters))
+
+    @app.post("/reset")
+    async def reset() -> JSONResponse:
+        counters.clear()
+        return JSONResponse(content={})
+
+    return app
+
+
+def _tarball(files: Dict[str, str], root: str) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for path, content in files.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(f"{root}/{path}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake GitHub API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--dirs", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--file-size", type=int, default=2000)
+    parser.add_argument("--latency", default="lognormal:50:0.5",
+                        help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(args.files, args.dirs, args.depth, args.file_size, parse_latency(args.latency),
+                     args.rate_limit_ratio)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
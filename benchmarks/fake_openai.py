@@ -0,0 +1,251 @@
+"""
+Local stand-in for the OpenAI chat completions API and the Batch API (files and batches).
+
+Run: python -m benchmarks.fake_openai --port 8102 --latency lognormal:800:0.4 --rate-limit-ratio 0.05
+The review service is pointed to it with OPENAI_BASE_URL=http://127.0.0.1:8102/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from benchmarks.common import Latency, parse_latency
+
+FILE_NAME = re.compile(r"^File name: (.+)$", re.MULTILINE)
+REVIEW = {"Solutions": "Fake solutions of the benchmark.", "Skills": "Fake skills.", "Rating": 3}
+STREAM_CHUNK_CHARS = 8
+
+
+def create_app(latency: Latency = Latency("fixed"),
+               rate_limit_ratio: float = 0.0,
+               requests_per_minute: int = 0,
+               completion_tokens: int = 120,
+               batch_delay: float = 0.0
+               ) -> FastAPI:
+    """
+    Creates the fake OpenAI API app.
+
+    Args:
+    latency (Latency): Latency of a completion.
+    rate_limit_ratio (float): Share of requests answered with 429 and `retry-after-ms`.
+    requests_per_minute (int): Requests over this limit within a sliding minute get 429, 0 - unlimited.
+    completion_tokens (int): Reported completion tokens of every response.
+    batch_delay (float): Seconds a batch stays "in_progress" before it is completed.
+
+    Notes:
+    - A request with several "File name:" entries (a packed map request) gets a JSON object keyed by file name,
+      every other request gets a valid review JSON with the "Solutions", "Skills" and "Rating" keys.
+    - A request with `"stream": true` gets the same content as Server-Sent Events chunks of a few characters,
+      followed by a usage chunk if `stream_options.include_usage` is set.
+    - Batch API: `POST /v1/files` stores an uploaded JSONL file, `POST /v1/batches` answers every line of it
+      like a chat completion (no latency or rate limits) after `batch_delay`, `GET /v1/batches/{id}` returns
+      the batch and `GET /v1/files/{id}/content` the output file.
+    - `GET /stats` returns request counters by kind (structure, file, pack, summary, batch, streamed), `POST /reset`
+      clears them.
+    """
+    app = FastAPI()
+    counters: Counter = Counter()
+    recent: deque = deque()
+    files: dict = {}
+    batches: dict = {}
+    tasks: set = set()
+
+    def throttled() -> bool:
+        if rate_limit_ratio and random.random() < rate_limit_ratio:
+            return True
+        if requests_per_minute:
+            now = time.monotonic()
+            while recent and now - recent[0] > 60:
+                recent.popleft()
+            if len(recent) >= requests_per_minute:
+                return True
+            recent.append(now)
+        return False
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> JSONResponse:
+        body = await request.json()
+        counters["requests"] += 1
+        if throttled():
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "requests",
+                                   "code": "rate_limit_exceeded", "param": None}},
+                headers={"retry-after-ms": "500"},
+            )
+        await asyncio.sleep(latency.sample())
+        completion = complete(body)
+        if body.get("stream"):
+            counters["streamed"] += 1
+            return StreamingResponse(stream_chunks(completion, body), media_type="text/event-stream")
+        return JSONResponse(content=completion)
+
+    async def stream_chunks(completion: dict, body: dict):
+        content = completion["choices"][0]["message"]["content"]
+        chunk = {key: completion[key] for key in ("id", "created", "model")}
+        chunk["object"] = "chat.completion.chunk"
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            delta = {"content": content[start:start + STREAM_CHUNK_CHARS]}
+            yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': delta}]})}\n\n"
+            await asyncio.sleep(0)
+        yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({**chunk, 'choices': [], 'usage': completion['usage']})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def complete(body: dict) -> dict:
+        prompt = body["messages"][-1]["content"]
+        names = FILE_NAME.findall(prompt)
+        if prompt.startswith("Project structure:") and names:
+            kind, content = "review", json.dumps(REVIEW)
+        elif prompt.startswith("Project structure:"):
+            kind, content = "structure", "Fake structure analysis."
+        elif len(names) > 1:
+            kind, content = "pack", json.dumps({name: f"Fake analysis of {name}." for name in names})
+        elif names:
+            kind, content = "file", f"Fake analysis of {names[0]}."
+        else:
+            kind, content = "summary", json.dumps(REVIEW)
+        counters[kind] += 1
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        counters["prompt_tokens"] += prompt_tokens
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.post("/v1/files")
+    async def upload_file(request: Request) -> JSONResponse:
+        # Multipart form parsed with the standard library, python-multipart is not a dependency
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode() + await request.body()
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        upload = fields["file"]
+        file = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": 0,
+            "created_at": int(time.time()),
+            "filename": upload.get_filename() or "upload.jsonl",
+            "purpose": fields["purpose"].get_content().strip(),
+            "status": "processed",
+        }
+        files[file["id"]] = (file, upload.get_payload(decode=True))
+        file["bytes"] = len(files[file["id"]][1])
+        return JSONResponse(content=file)
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str) -> Response:
+        if file_id not in files:
+            return JSONResponse(status_code=404, content={"error": {"message": "No such file", "type": "invalid"}})
+        return Response(content=files[file_id][1], media_type="application/octet-stream")
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request) -> JSONResponse:
+        body = await request.json()
+        if body.get("input_file_id") not in files:
+            return JSONResponse(status_code=400, content={"error": {"message": "No such file", "type": "invalid"}})
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        batches[batch["id"]] = batch
+        counters["batches"] += 1
+        task = asyncio.create_task(run_batch(batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return JSONResponse(content=batch)
+
+    async def run_batch(batch: dict) -> None:
+        await asyncio.sleep(batch_delay)
+        if batch["status"] == "cancelled":
+            return
+        lines = [json.loads(line) for line in files[batch["input_file_id"]][1].decode().splitlines() if line.strip()]
+        output = []
+        for line in lines:
+            counters["batch_requests"] += 1
+            output.append({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": complete(line["body"])},
+                "error": None,
+            })
+        file = {"id": f"file-{uuid.uuid4().hex}", "object": "file", "created_at": int(time.time()),
+                "filename": "batch_output.jsonl", "purpose": "batch_output", "status": "processed"}
+        content = "".join(json.dumps(item) + "\n" for item in output).encode()
+        files[file["id"]] = ({**file, "bytes": len(content)}, content)
+        batch.update(status="completed", output_file_id=file["id"], completed_at=int(time.time()),
+                     request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str) -> JSONResponse:
+        if batch_id not in batches:
+            return JSONResponse(status_code=404, content={"error": {"message": "No such batch", "type": "invalid"}})
+        if batches[batch_id]["status"] not in ("completed", "failed", "expired"):
+            batches[batch_id]["status"] = "cancelled"
+        return JSONResponse(content=batches[batch_id])
+
+    @app.get("/v1/batches/{batch_id}")
+    async def get_batch(batch_id: str) -> JSONResponse:
+        if batch_id not in batches:
+            return JSONResponse(status_code=404, content={"error": {"message": "No such batch", "type": "invalid"}})
+        return JSONResponse(content=batches[batch_id])
+
+    @app.get("/stats")
+    async def stats() -> JSONResponse:
+        return JSONResponse(content=dict(counters))
+
+    @app.post("/reset")
+    async def reset() -> JSONResponse:
+        counters.clear()
+        return JSONResponse(content={})
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--latency", default="lognormal:800:0.4",
+                        help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=int, default=0)
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="seconds until a batch is completed")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(parse_latency(args.latency), args.rate_limit_ratio, args.requests_per_minute,
+                     batch_delay=args.batch_delay)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+End-to-end load test of the review service against local fake GitHub and OpenAI servers.
+
+Run from the project root:
+    python -m benchmarks.load_test --reviews 50 --concurrency 10 --files 40 --dirs 5
+
+The driver starts both fakes and the service (uvicorn main:app) as subprocesses, sends concurrent /review
+requests and reports latency percentiles, throughput and upstream calls per review.
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def start_process(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env={**os.environ, **(env or {})})
+
+
+def wait_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 30.0) -> None:
+    """
+    Polls `url` until it answers or raises `RuntimeError` after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before {url} was ready")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} is not ready after {timeout}s")
+
+
+def write_config(path: Path, github_url: str, args: argparse.Namespace) -> None:
+    """
+    Writes a copy of config.ini that points the service to the fake GitHub API.
+    """
+    config = configparser.ConfigParser()
+    config.read(ROOT / "config.ini")
+    config.set("general", "debug", "WARNING")
+    config.set("services", "github_api_url", github_url)
+    config.set("services", "fetch_mode", args.fetch_mode)
+    if not args.keep_caches:
+        for section in ("cache", "http_cache", "snapshots"):
+            if config.has_section(section):
+                config.set(section, "enabled", "false")
+    with open(path, "w") as config_file:
+        config.write(config_file)
+
+
+async def run_load(app_url: str, endpoint: str, reviews: int, concurrency: int, repeat_repo: bool) -> dict:
+    """
+    Sends `reviews` requests with at most `concurrency` in flight and returns latencies and status counts.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def review(client: httpx.AsyncClient, number: int) -> None:
+        repo = "repo0" if repeat_repo else f"repo{number}"
+        payload = {"git_url": f"https://github.com/bench/{repo}", "dev_level": "junior", "description": "benchmark"}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{app_url}{endpoint}", json=payload)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = e.__class__.__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[review(client, number) for number in range(reviews)])
+        elapsed = time.perf_counter() - start
+
+    return {"latencies": latencies, "statuses": statuses, "elapsed": elapsed}
+
+
+def build_report(load: dict, github: dict, openai: dict, reviews: int) -> dict:
+    latencies = load["latencies"]
+    return {
+        "reviews": reviews,
+        "statuses": load["statuses"],
+        "elapsed_s": round(load["elapsed"], 3),
+        "requests_per_second": round(reviews / load["elapsed"], 3) if load["elapsed"] else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "github": github,
+        "openai": openai,
+        "github_calls_per_review": round(github.get("requests", 0) / reviews, 2),
+        "openai_calls_per_review": round(openai.get("requests", 0) / reviews, 2),
+    }
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_s"]
+    print(f"Reviews: {report['reviews']}  statuses: {report['statuses']}  elapsed: {report['elapsed_s']}s")
+    print(f"Throughput: {report['requests_per_second']} reviews/s")
+    print(f"Latency: p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"GitHub calls per review: {report['github_calls_per_review']}  {report['github']}")
+    print(f"OpenAI calls per review: {report['openai_calls_per_review']}  {report['openai']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of /review against fake GitHub and OpenAI servers")
+    parser.add_argument("--reviews", type=int, default=20, help="total number of reviews")
+    parser.add_argument("--concurrency", type=int, default=5, help="reviews in flight")
+    parser.add_argument("--endpoint", default="/review")
+    parser.add_argument("--files", type=int, default=40, help="files per synthetic repository")
+    parser.add_argument("--dirs", type=int, default=5, help="directories per synthetic repository")
+    parser.add_argument("--depth", type=int, default=1, help="nesting depth of the directories")
+    parser.add_argument("--file-size", type=int, default=2000, help="approximate file size in bytes")
+    parser.add_argument("--fetch-mode", default="contents", choices=["contents", "archive"])
+    parser.add_argument("--github-latency", default="lognormal:50:0.5")
+    parser.add_argument("--github-rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--openai-latency", default="lognormal:800:0.4")
+    parser.add_argument("--openai-rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--openai-requests-per-minute", type=int, default=0)
+    parser.add_argument("--repeat-repo", action="store_true", help="review the same repository every time")
+    parser.add_argument("--keep-caches", action="store_true", help="keep analysis/HTTP caches and snapshots on")
+    parser.add_argument("--port", type=int, default=8100, help="service port, fakes use the next two ports")
+    parser.add_argument("--app-url", help="use an already running service (it must point to the fakes)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    github_url = f"http://127.0.0.1:{args.port + 1}"
+    openai_url = f"http://127.0.0.1:{args.port + 2}"
+    app_url = args.app_url or f"http://127.0.0.1:{args.port}"
+    processes = []
+    try:
+        processes.append(start_process([
+            "-m", "benchmarks.fake_github", "--port", str(args.port + 1), "--files", str(args.files),
+            "--dirs", str(args.dirs), "--depth", str(args.depth), "--file-size", str(args.file_size),
+            "--latency", args.github_latency, "--rate-limit-ratio", str(args.github_rate_limit_ratio),
+        ]))
+        processes.append(start_process([
+            "-m", "benchmarks.fake_openai", "--port", str(args.port + 2), "--latency", args.openai_latency,
+            "--rate-limit-ratio", str(args.openai_rate_limit_ratio),
+            "--requests-per-minute", str(args.openai_requests_per_minute),
+        ]))
+        wait_ready(f"{github_url}/stats", processes[0])
+        wait_ready(f"{openai_url}/stats", processes[1])
+
+        with tempfile.TemporaryDirectory() as directory:
+            if not args.app_url:
+                config_path = Path(directory) / "config.ini"
+                write_config(config_path, github_url, args)
+                processes.append(start_process(
+                    ["-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+                    env={"CONFIG_FILE": str(config_path), "OPENAI_BASE_URL": f"{openai_url}/v1",
+                         "OPENAI_API_KEY": "benchmark"},
+                ))
+                wait_ready(f"{app_url}/stats/cache", processes[-1])
+
+            httpx.post(f"{github_url}/reset")
+            httpx.post(f"{openai_url}/reset")
+            load = asyncio.run(run_load(app_url, args.endpoint, args.reviews, args.concurrency, args.repeat_repo))
+            github = httpx.get(f"{github_url}/stats").json()
+            openai = httpx.get(f"{openai_url}/stats").json()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    report = build_report(load, github, openai, args.reviews)
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Microbenchmarks of the fetch, map and reduce stages against in-process fakes.
+
+Run from the project root:
+    python -m benchmarks.microbench --output bench.json
+    python -m benchmarks.microbench --baseline bench.json --threshold 0.2
+
+Every case reports upstream calls, median wall time over `--repeat` runs and the tracemalloc peak of one run.
+With `--baseline`, cases slower, more memory hungry or making more calls than the baseline by more than
+`--threshold` are reported and the exit code is 1.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+from unittest.mock import Mock, patch
+
+import httpx
+
+from benchmarks import fake_github
+from benchmarks.common import Latency, synthetic_repository
+
+FETCH_CASES = [
+    # (files, dirs, depth)
+    (50, 0, 1),
+    (200, 20, 1),
+    (200, 20, 5),
+    (500, 50, 2),
+]
+ANALYSIS_CASES = [10, 50, 200]  # files
+REDUCE_CASES = [
+    # (results, reduce token budget, result size in characters)
+    (50, 1000, 500),
+    (50, 12000, 500),
+    (200, 3000, 2000),
+    (200, 12000, 2000),
+]
+
+
+@dataclass
+class Case:
+    """
+    One benchmark case: `run` performs the measured work and returns the number of upstream calls.
+    """
+    name: str
+    run: Callable[[], Awaitable[int]]
+    params: Dict = field(default_factory=dict)
+
+
+class FakeCompletions:
+    """
+    In-process stand-in for `client.chat.completions.create` with a fixed latency.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, **kwargs) -> Mock:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        prompt = kwargs["messages"][-1]["content"]
+        # Summaries and the single request review of a small repository (project structure with the files) get
+        # a review, map requests get a free text analysis
+        if "File name:" not in prompt or prompt.startswith("Project structure:"):
+            content = '{"Solutions": "Fake", "Skills": "Fake", "Rating": 3}'
+        else:
+            content = "Fake"
+        return Mock(choices=[Mock(message=Mock(content=content))], usage=None)
+
+
+def fetch_case(files: int, dirs: int, depth: int, latency: float) -> Case:
+    from services import get_all_files
+
+    app = fake_github.create_app(files=files, dirs=dirs, depth=depth, latency=Latency("fixed", latency * 1000))
+
+    async def run() -> int:
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://github.fake") as client:
+            await client.post("/reset")
+            result = await get_all_files("http://github.fake/repos/bench/repo/contents", client)
+            assert result is not None and len(result) == files
+            return (await client.get("/stats")).json()["requests"]
+
+    return Case(f"get_all_files[files={files},dirs={dirs},depth={depth}]", run,
+                {"files": files, "dirs": dirs, "depth": depth})
+
+
+def analysis_case(files: int, latency: float) -> Case:
+    from services import perform_analysis
+
+    repository = {
+        path: content for path, content in synthetic_repository("bench/repo", files, files // 10).items()
+        if not path.endswith(".txt")
+    }
+
+    async def run() -> None:
+        await perform_analysis(dict(repository), "junior", "benchmark")
+
+    return Case(f"perform_analysis[files={files}]", _with_fake_openai(run, latency), {"files": files})
+
+
+def reduce_case(results: int, budget: int, result_size: int, latency: float) -> Case:
+    from services import summarize_analysis
+
+    analyses = [(f"Analysis {i}: " + "x" * result_size)[:result_size] for i in range(results)]
+
+    async def run() -> None:
+        with patch("services.REDUCE_TOKEN_BUDGET", budget):
+            await summarize_analysis(list(analyses), "Structure", "junior", "benchmark")
+
+    return Case(f"summarize_analysis[results={results},budget={budget},result_size={result_size}]",
+                _with_fake_openai(run, latency),
+                {"results": results, "budget": budget, "result_size": result_size})
+
+
+def _with_fake_openai(run: Callable[[], Awaitable[None]], latency: float) -> Callable[[], Awaitable[int]]:
+    """
+    Runs a case with a fake OpenAI client, an unthrottled scheduler and the analysis cache disabled.
+    Returns the number of completion calls.
+    """
+    from scheduler import OpenAIScheduler
+
+    async def wrapped() -> int:
+        completions = FakeCompletions(latency)
+        scheduler = OpenAIScheduler(10 ** 6, 10 ** 9, max_concurrency=1000)
+        with patch("config.client.chat.completions.create", completions.create), \
+                patch("api_requests.openai_scheduler", scheduler), \
+                patch("services.CACHE_ENABLED", False):
+            await run()
+        return completions.calls
+
+    return wrapped
+
+
+async def measure(case: Case, repeat: int) -> dict:
+    """
+    Runs a case once under tracemalloc (calls and peak memory) and `repeat` times without it (wall time).
+    """
+    tracemalloc.start()
+    try:
+        calls = await case.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await case.run()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        **case.params,
+        "calls": calls,
+        "wall_s": round(statistics.median(timings), 6),
+        "wall_min_s": round(min(timings), 6),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def build_cases(github_latency: float, openai_latency: float) -> List[Case]:
+    cases = [fetch_case(files, dirs, depth, github_latency) for files, dirs, depth in FETCH_CASES]
+    cases += [analysis_case(files, openai_latency) for files in ANALYSIS_CASES]
+    cases += [reduce_case(results, budget, size, openai_latency) for results, budget, size in REDUCE_CASES]
+    return cases
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    Returns regressions: metrics (wall time, peak memory, calls) over the baseline by more than `threshold`.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("wall_s", "peak_kb", "calls"):
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > _NOISE_FLOOR[metric]:
+                change = f"+{(new / old - 1) * 100:.0f}%" if old else "new"
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change})")
+    return regressions
+
+
+# Absolute differences below these are ignored (timer and allocator noise)
+_NOISE_FLOOR = {"wall_s": 0.002, "peak_kb": 64, "calls": 0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the fetch, map and reduce stages")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case, the median is reported")
+    parser.add_argument("--filter", default="", help="run only cases whose name contains this text")
+    parser.add_argument("--github-latency", type=float, default=0.001, help="fake GitHub latency in seconds")
+    parser.add_argument("--openai-latency", type=float, default=0.005, help="fake OpenAI latency in seconds")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    results = {}
+    for case in build_cases(args.github_latency, args.openai_latency):
+        if args.filter not in case.name:
+            continue
+        results[case.name] = asyncio.run(measure(case, args.repeat))
+        result = results[case.name]
+        print(f"{case.name:<75} calls {result['calls']:>5}  wall {result['wall_s'] * 1000:>9.2f} ms  "
+              f"peak {result['peak_kb']:>9.1f} KiB")
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat,
+                 "github_latency": args.github_latency, "openai_latency": args.openai_latency},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from config import CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_SQLITE_PATH, CACHE_MAX_DISK_ENTRIES
+from config import STAGE_SETTINGS, PROMPT_SYS, PROMPT_USER_FILE_ANALYZE, PROMPT_USER_FILES_ANALYZE
+
+logger = logging.getLogger(__name__)
+
+
+class DiskWriter:
+    """
+    Write-behind of an SQLite cache tier: rows stored while the event loop runs are queued and written in
+    a worker thread, all rows queued meanwhile in one transaction with one eviction pass and one commit.
+
+    Args:
+    db (sqlite3.Connection): The database, opened with `check_same_thread=False`.
+    write (Callable[[sqlite3.Connection, List[tuple]], None]): Inserts a batch of rows and evicts the entries
+    over the limits of the tier, the writer commits.
+    name (str): Name of the cache in log messages.
+
+    Notes:
+    - Without a running event loop (scripts, tests) a row is written at once.
+    - `lock` serializes the connection between the worker thread and reads on the event loop.
+    - Rows queued before `discard` are not written.
+    """
+
+    def __init__(self, db: sqlite3.Connection, write: Callable[[sqlite3.Connection, List[tuple]], None], name: str):
+        self.db = db
+        self.lock = threading.Lock()
+        self._write = write
+        self._name = name
+        self._pending: Dict[str, tuple] = {}
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, key: str, row: tuple) -> None:
+        """
+        Queues a row, a later row of the same key replaces it.
+        """
+        self._pending[key] = row
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_batch(self._generation, self._take())
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._drain())
+
+    async def flush(self) -> None:
+        """
+        Waits until the queued rows are written.
+        """
+        task = self._task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            await task
+        await self._drain()
+
+    def discard(self) -> None:
+        """
+        Drops the queued rows and the batch being written, e.g. before the table is cleared.
+        """
+        self._pending.clear()
+        self._generation += 1
+
+    def _take(self) -> List[tuple]:
+        rows, self._pending = list(self._pending.values()), {}
+        return rows
+
+    async def _drain(self) -> None:
+        while self._pending:
+            await asyncio.to_thread(self._write_batch, self._generation, self._take())
+
+    def _write_batch(self, generation: int, rows: List[tuple]) -> None:
+        with self.lock:
+            if generation != self._generation:
+                return
+            try:
+                self._write(self.db, rows)
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"{self._name} database write failed: {e}")
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of analysis results: an in-memory LRU and an optional on-disk SQLite store.
+
+    Args:
+    max_entries (int): Max number of entries in the in-memory tier, least recently used are evicted first.
+    ttl (int): Time to live of an entry in seconds, 0 - entries never expire.
+    sqlite_path (str): Path to the SQLite database file. Empty string disables the disk tier.
+    max_disk_entries (int): Max number of entries in the disk tier, oldest are evicted first.
+
+    Notes:
+    - A miss in memory falls through to the disk tier, a disk hit is promoted back to memory.
+    - Disk writes go through a `DiskWriter`, so storing results does not block the event loop on disk I/O.
+    - Hit, miss and eviction counters are available via `stats()`.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, sqlite_path: str = "", max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, tuple] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[DiskWriter] = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created)")
+                self._db.commit()
+                self._writer = DiskWriter(self._db, self._write_rows, "Cache")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open cache database {sqlite_path}: {e}. Disk cache is disabled.")
+                self._db = None
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns a cached value or `None` on a miss.
+        """
+        return self.get_any([key])
+
+    def get_any(self, keys: List[str]) -> Optional[str]:
+        """
+        Returns the value of the first of `keys` that is cached, or `None` on a miss. Counted as one lookup.
+        """
+        for key in keys:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+        self.counters["misses"] += 1
+        return None
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, created = entry
+            if not self._expired(created):
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return value
+            del self._memory[key]
+            self.counters["evictions"] += 1
+
+        if self._db is not None:
+            try:
+                with self._writer.lock:
+                    row = self._db.execute("SELECT value, created FROM analyses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Cache database read failed: {e}")
+                row = None
+            if row is not None and not self._expired(row[1]):
+                self._set_memory(key, row[0], row[1])
+                self.counters["disk_hits"] += 1
+                return row[0]
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a value in memory and queues it for the disk tier.
+        """
+        created = time.time()
+        self._set_memory(key, value, created)
+        if self._writer is not None:
+            self._writer.add(key, (key, value, created))
+
+    def _write_rows(self, db: sqlite3.Connection, rows: List[tuple]) -> None:
+        """
+        Stores a batch of rows in the disk tier and evicts expired entries and entries over the size limit.
+        """
+        db.executemany("INSERT OR REPLACE INTO analyses (key, value, created) VALUES (?, ?, ?)", rows)
+        if self.ttl > 0:
+            db.execute("DELETE FROM analyses WHERE created < ?", (time.time() - self.ttl,))
+        db.execute(
+            "DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+    async def flush(self) -> None:
+        """
+        Waits until the values stored so far are written to the disk tier.
+        """
+        if self._writer is not None:
+            await self._writer.flush()
+
+    def _set_memory(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries from both tiers and resets the counters.
+        """
+        self._memory.clear()
+        if self._writer is not None:
+            self._writer.discard()
+            with self._writer.lock:
+                self._db.execute("DELETE FROM analyses")
+                self._db.commit()
+        self.counters = dict.fromkeys(self.counters, 0)
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters and the current size of the cache.
+        """
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": self._db is not None,
+        }
+
+
+# User prompt of every kind of planned map request
+MAP_PROMPTS = {"single": PROMPT_USER_FILE_ANALYZE, "pack": PROMPT_USER_FILES_ANALYZE, "chunk": PROMPT_USER_FILE_ANALYZE}
+
+
+def file_analysis_key(name: str, content: str, level: str, description: str, kind: str = "single") -> str:
+    """
+    Builds a content-addressed cache key of a file analysis.
+
+    The key is a SHA-256 over everything that affects the OpenAI response: the file name and content,
+    the kind of the map request that produced the analysis with its prompt, the system prompt, the map stage
+    model and temperature, the developer level and the description.
+    An analysis escalated to `CASCADE_MODEL` is stored under this key too: it replaces the invalid analysis of
+    the map stage model, so the same file is not escalated again.
+    """
+    settings = STAGE_SETTINGS["map"]
+    digest = hashlib.sha256()
+    for part in (name, content, kind, PROMPT_SYS, MAP_PROMPTS[kind], settings["model"], str(settings["temperature"]),
+                 level, description):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_analysis_keys(name: str, content: str, level: str, description: str) -> List[str]:
+    """
+    Returns the cache keys of a file analysis produced by every kind of map request, for `get_any`.
+    The kind a file is planned into depends on the other files of its batch, an analysis of any kind serves it.
+    """
+    return [file_analysis_key(name, content, level, description, kind) for kind in MAP_PROMPTS]
+
+
+analysis_cache = AnalysisCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_SQLITE_PATH, CACHE_MAX_DISK_ENTRIES)
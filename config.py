@@ -9,8 +9,8 @@ from openai import AsyncOpenAI
 load_dotenv()
 config = configparser.ConfigParser()
 
-# Path to config.ini
-config_file = Path("config.ini")
+# Path to config.ini, CONFIG_FILE overrides it (e.g. benchmarks against local fake servers)
+config_file = Path(os.environ.get("CONFIG_FILE", "config.ini"))
 if not config_file.exists():
     raise FileNotFoundError(f"Configuration file not found: {config_file}")
 
@@ -18,13 +18,82 @@ if not config_file.exists():
 config.read(config_file)
 logger = logging.getLogger(__name__)
 
+
+def get_int_option(section: str, option: str, default: int, min_max: tuple) -> int:
+    """
+    Reads an integer option from config.ini and validates it against an inclusive range.
+
+    Args:
+    section (str): The config.ini section name.
+    option (str): The option name inside the section.
+    default (int): The value used when the option is missing or invalid.
+    min_max (tuple): Inclusive (min, max) bounds for the value.
+
+    Returns:
+    int: The validated option value or `default`.
+    """
+    try:
+        value = config.getint(section, option, fallback=default)
+    except ValueError:
+        logging.error("Invalid %s in config.ini. Using default: %s", option, default)
+        return default
+    if value < min_max[0] or value > min_max[1]:
+        logging.error("Invalid %s in config.ini: %s. Using default: %s", option, value, default)
+        return default
+    return value
+
+
+def get_float_option(section: str, option: str, default: float, min_max: tuple) -> float:
+    """
+    Reads a float option from config.ini and validates it against an inclusive range.
+
+    Args:
+    section (str): The config.ini section name.
+    option (str): The option name inside the section.
+    default (float): The value used when the option is missing or invalid.
+    min_max (tuple): Inclusive (min, max) bounds for the value.
+
+    Returns:
+    float: The validated option value or `default`.
+    """
+    try:
+        value = config.getfloat(section, option, fallback=default)
+    except ValueError:
+        logging.error("Invalid %s in config.ini. Using default: %s", option, default)
+        return default
+    if value < min_max[0] or value > min_max[1]:
+        logging.error("Invalid %s in config.ini: %s. Using default: %s", option, value, default)
+        return default
+    return value
+
+
+def get_bool_option(section: str, option: str, default: bool) -> bool:
+    """
+    Reads a boolean option (true/false, yes/no, on/off, 1/0) from config.ini.
+
+    Args:
+    section (str): The config.ini section name.
+    option (str): The option name inside the section.
+    default (bool): The value used when the option is missing or invalid.
+
+    Returns:
+    bool: The option value or `default`.
+    """
+    try:
+        return config.getboolean(section, option, fallback=default)
+    except ValueError:
+        logging.error("Invalid %s in config.ini. Using default: %s", option, default)
+        return default
+
+
 # OPENAI API KEY
 try:
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("Environment variable 'OPENAI_API_KEY' is not set or is empty.")
 
-    client = AsyncOpenAI(api_key=api_key)
+    # Retries of rate limited and failed requests are done by scheduler.py
+    client = AsyncOpenAI(api_key=api_key, max_retries=0)
 
 except ValueError as ve:
     logger.error(f"Configuration error: {ve}")
@@ -52,24 +121,6 @@ DEBUG_LEVEL = LOG_LEVELS.get(debug_level.upper(), logging.INFO)
 GITHUB_ROOT = config.get("services", "github_root", fallback="https://github.com/")
 GITHUB_API_URL = config.get("services", "github_api_url", fallback="https://api.github.com")
 
-# BATCH_SIZE = config.getint("services", "butch_size", fallback=7)
-DEFAULT_BATCH_SIZE = 7
-DEFAULT_MIN_MAX_BATCH_SIZE = (2, 100)
-try:
-    batch_size = config.getint("services", "butch_size", fallback=DEFAULT_BATCH_SIZE)
-    if batch_size < DEFAULT_MIN_MAX_BATCH_SIZE[0] or batch_size > DEFAULT_MIN_MAX_BATCH_SIZE[1]:
-        logging.error("Invalid batch_size in config.ini: %s. Using default: ", DEFAULT_BATCH_SIZE)
-        BATCH_SIZE = DEFAULT_BATCH_SIZE
-    else:
-        BATCH_SIZE = batch_size
-except configparser.NoSectionError:
-    logging.error("Config section 'services' not found in config.ini. Using default: ", DEFAULT_BATCH_SIZE)
-    BATCH_SIZE = DEFAULT_BATCH_SIZE
-except configparser.NoOptionError:
-    logging.error("Option 'batch_size' not found in section 'services'. Using default: ", DEFAULT_BATCH_SIZE)
-    BATCH_SIZE = DEFAULT_BATCH_SIZE
-
-
 DEFAULT_VALID_EXTENSIONS = {".py", ".md", ".ini"}  # Default valid file extensions
 try:
     file_extensions = set(config.get("services", "valid_extensions").split(","))
@@ -89,11 +140,52 @@ except configparser.NoOptionError:
     logging.error("Option 'valid_extensions' not found in section 'services'. Using default VALID_EXTENSIONS.")
     VALID_EXTENSIONS = DEFAULT_VALID_EXTENSIONS
 
+# Max number of simultaneous GitHub requests while crawling one repository
+DEFAULT_FETCH_CONCURRENCY = 10
+FETCH_CONCURRENCY = get_int_option("services", "fetch_concurrency", DEFAULT_FETCH_CONCURRENCY, (1, 100))
+
+# Repository fetch mode:
+# "contents" - recursive crawl of the contents API, one request per directory and per file
+# "archive" - one recursive Git Trees request for the file list and one streamed tarball for the file bodies
+DEFAULT_VALID_FETCH_MODES = ["contents", "archive"]
+DEFAULT_FETCH_MODE = "contents"
+fetch_mode = config.get("services", "fetch_mode", fallback=DEFAULT_FETCH_MODE).lower().strip()
+if fetch_mode not in DEFAULT_VALID_FETCH_MODES:
+    logging.error(
+        "Invalid fetch_mode in config.ini: %s. Using default: %s. Valid fetch modes: %s",
+        fetch_mode, DEFAULT_FETCH_MODE, ", ".join(DEFAULT_VALID_FETCH_MODES)
+    )
+    FETCH_MODE = DEFAULT_FETCH_MODE
+else:
+    FETCH_MODE = fetch_mode
+
+
+# http_client.py
+# Shared httpx.AsyncClient for GitHub traffic
+HTTP_MAX_CONNECTIONS = get_int_option("http_client", "max_connections", 100, (1, 1000))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = get_int_option("http_client", "max_keepalive_connections", 20, (0, 1000))
+HTTP_KEEPALIVE_EXPIRY = get_float_option("http_client", "keepalive_expiry", 30.0, (0, 3600))
+HTTP2 = get_bool_option("http_client", "http2", False)
+HTTP_CONNECT_TIMEOUT = get_float_option("http_client", "connect_timeout", 5.0, (0.1, 300))
+HTTP_READ_TIMEOUT = get_float_option("http_client", "read_timeout", 30.0, (0.1, 600))
+HTTP_WRITE_TIMEOUT = get_float_option("http_client", "write_timeout", 30.0, (0.1, 600))
+HTTP_POOL_TIMEOUT = get_float_option("http_client", "pool_timeout", 10.0, (0.1, 600))
+
+# http_cache.py
+# Conditional request cache (ETag / Last-Modified) for GitHub traffic
+HTTP_CACHE_ENABLED = get_bool_option("http_cache", "enabled", True)
+HTTP_CACHE_MAX_BYTES = get_int_option("http_cache", "max_bytes", 50 * 1024 * 1024, (0, 10 * 1024 ** 3))
+HTTP_CACHE_MAX_ENTRY_BYTES = get_int_option("http_cache", "max_entry_bytes", 1024 * 1024, (0, 1024 ** 3))
+# Empty path disables the on-disk SQLite tier
+HTTP_CACHE_SQLITE_PATH = config.get("http_cache", "sqlite_path", fallback="").strip()
+HTTP_CACHE_MAX_DISK_BYTES = get_int_option("http_cache", "max_disk_bytes", 500 * 1024 * 1024, (0, 100 * 1024 ** 3))
 
 # api_requests.py
 # GPT_MODEL = config.get("api_requests", "model", fallback="gpt-3.5-turbo").lower().strip()
 DEFAULT_VALID_MODELS = ["gpt-3.5-turbo", "gpt-4o-mini", "gpt-4-turbo"]
 DEFAULT_GPT_MODEL = 'gpt-3.5-turbo'
+# Context windows of the valid models, tokens
+MODEL_CONTEXT_WINDOWS = {"gpt-3.5-turbo": 16385, "gpt-4o-mini": 128000, "gpt-4-turbo": 128000}
 try:
     gpt_model = config.get("api_requests", "model", fallback=DEFAULT_GPT_MODEL).lower().strip()
     if gpt_model not in DEFAULT_VALID_MODELS:
@@ -122,10 +214,6 @@ try:
     elif max_tokens > DEFAULT_TOTAL_MAX_TOKENS:
         logging.error("More than 4000. Invalid max_tokens in config.ini: %s. Using default '400'.")
         MAX_TOKENS = DEFAULT_MAX_TOKENS
-    elif DEFAULT_TOTAL_MAX_TOKENS // BATCH_SIZE < max_tokens:
-        max_tokens = DEFAULT_TOTAL_MAX_TOKENS // BATCH_SIZE
-        logging.error("More than max tokens in batch_size. Invalid max_tokens in config.ini: %s. Using: ", max_tokens)
-        MAX_TOKENS = max_tokens
     else:
         MAX_TOKENS = max_tokens
 except configparser.NoSectionError:
@@ -152,6 +240,38 @@ except configparser.NoOptionError:
     logging.error("Option 'temperature' not found in section 'api_requests'. Using default: ", DEFAULT_TEMPERATURE)
     TEMPERATURE = DEFAULT_TEMPERATURE
 
+
+def get_model_option(section: str, option: str, default: str) -> str:
+    """
+    Reads a model name from config.ini and validates it against `DEFAULT_VALID_MODELS`.
+    Returns `default` when the option is missing, empty or invalid.
+    """
+    model = config.get(section, option, fallback="").lower().strip()
+    if not model:
+        return default
+    if model not in DEFAULT_VALID_MODELS:
+        logging.error("Invalid %s in config.ini: %s. Using default: %s", option, model, default or "none")
+        return default
+    return model
+
+
+# Per-stage settings of the requests: "<stage>_model", "<stage>_max_tokens" and "<stage>_temperature"
+# in [api_requests], the global model, max_tokens and temperature by default.
+# Stages: structure, map (file analyses), summary, reduce, review (single-request review of small repositories)
+API_STAGES = ("structure", "map", "summary", "reduce", "review")
+STAGE_SETTINGS = {
+    stage: {
+        "model": get_model_option("api_requests", f"{stage}_model", GPT_MODEL),
+        "max_tokens": get_int_option("api_requests", f"{stage}_max_tokens", MAX_TOKENS, (40, DEFAULT_TOTAL_MAX_TOKENS)),
+        "temperature": get_float_option("api_requests", f"{stage}_temperature", TEMPERATURE,
+                                        DEFAULT_MIN_MAX_TEMPERATURE),
+    }
+    for stage in API_STAGES
+}
+# A file analysis that is not a valid JSON review is repeated once with this model, empty - no cascade.
+# The escalated analysis is cached under the key of the map model, in place of the invalid one.
+CASCADE_MODEL = get_model_option("api_requests", "cascade_model", "")
+
 # Prompt
 DEFAULT_PROMPT_USER_STRUCTURE = """
 Identifying weaknesses, issues and good solutions code structure in 3 sentences. Make conclusion in 1 sentences.
@@ -160,6 +280,11 @@ DEFAULT_PROMPT_USER_FILE_ANALYZE = """
 Identifying weaknesses, issues and good solutions in 2-3 sentences. 
 Write a brief comment on the developer’s skills in 1 sentence for developer level: 
 """
+DEFAULT_PROMPT_USER_FILES_ANALYZE = """
+Analyze each file above separately. Respond with one JSON object where every key is a file name and every value
+is the JSON structure for that file. Identifying weaknesses, issues and good solutions in 2-3 sentences per file.
+Write a brief comment on the developer’s skills in 1 sentence for developer level: 
+"""
 DEFAULT_PROMPT_USER_TASK = "Make summary review according preview analyze:"
 DEFAULT_PROMPT_SOLUTIONS = "Solutions: identifying weaknesses and good solutions in 2-3 sentences."
 DEFAULT_PROMPT_SKILLS = "Skills: write a brief comment on the developer’s skills in 1-2 sentence."
@@ -182,6 +307,10 @@ PROMPT_USER_STRUCTURE = config.get("api_requests", "prompt_user_structure",
 PROMPT_USER_FILE_ANALYZE = config.get("api_requests", "prompt_user_file_analyze",
                                       fallback=DEFAULT_PROMPT_USER_FILE_ANALYZE)
 
+# f"File name: {name}\n{content}\n...File name: {name}\n{content}\n{PROMPT...}{level}"
+PROMPT_USER_FILES_ANALYZE = config.get("api_requests", "prompt_user_files_analyze",
+                                       fallback=DEFAULT_PROMPT_USER_FILES_ANALYZE)
+
 # f"{..SUMMARY_TASK}{summaries_text}{..SUMMARY_SOLUTIONS}\n{..SUMMARY_SKILLS}{..SUMMARY_RATING}{dev_level}"
 PROMPT_USER_SUMMARY_TASK = config.get("api_requests", "prompt_user_summary_task",
                                       fallback=DEFAULT_PROMPT_USER_TASK)
@@ -192,6 +321,11 @@ PROMPT_USER_SUMMARY_SKILLS = config.get("api_requests", "prompt_user_summary_ski
 PROMPT_USER_SUMMARY_RATING = config.get("api_requests", "prompt_user_summary_rating",
                                         fallback=DEFAULT_PROMPT_RATING)
 
+# f"Project structure:{structure}\n{files_text}{metrics}\n{..REVIEW_TASK}\n{..SUMMARY_SOLUTIONS}..."
+DEFAULT_PROMPT_USER_REVIEW_TASK = "Make a review of the whole project: its structure and all files above."
+PROMPT_USER_REVIEW_TASK = config.get("api_requests", "prompt_user_review_task",
+                                     fallback=DEFAULT_PROMPT_USER_REVIEW_TASK)
+
 # f"{..REDUCE_TASK}{summaries_text}{..REDUCE_SOLUTIONS}\n{..REDUCE_SKILLS}{..REDUCE_RATING}{dev_level}"
 PROMPT_USER_REDUCE_TASK = config.get("api_requests", "prompt_user_reduce_task",
                                      fallback=DEFAULT_PROMPT_USER_TASK)
@@ -201,3 +335,117 @@ PROMPT_USER_REDUCE_SKILLS = config.get("api_requests", "prompt_user_reduce_skill
                                        fallback=DEFAULT_PROMPT_SKILLS)
 PROMPT_USER_REDUCE_RATING = config.get("api_requests", "prompt_user_reduce_rating",
                                        fallback=DEFAULT_PROMPT_RATING)
+
+# cache.py
+# Cache of per-file analyses, keyed by file content, prompts, model and review parameters
+CACHE_ENABLED = get_bool_option("cache", "enabled", True)
+CACHE_MAX_ENTRIES = get_int_option("cache", "max_entries", 1000, (1, 1000000))
+CACHE_TTL = get_int_option("cache", "ttl_seconds", 86400, (0, 31536000))
+# Empty path disables the on-disk SQLite tier
+CACHE_SQLITE_PATH = config.get("cache", "sqlite_path", fallback="").strip()
+CACHE_MAX_DISK_ENTRIES = get_int_option("cache", "max_disk_entries", 100000, (1, 100000000))
+
+# snapshots.py
+# Per-repository snapshots (commit SHA, blob SHAs, per-file analyses) for incremental re-reviews
+SNAPSHOTS_ENABLED = get_bool_option("snapshots", "enabled", True)
+SNAPSHOTS_MAX_REPOSITORIES = get_int_option("snapshots", "max_repositories", 1000, (1, 1000000))
+
+# planner.py
+# Token-budgeted packing of small files and splitting of large files in the map stage
+PLANNER_ENABLED = get_bool_option("planner", "enabled", True)
+# Rough token estimate: characters per token
+CHARS_PER_TOKEN = get_int_option("planner", "chars_per_token", 4, (1, 10))
+# Max estimated input tokens of file content per map request
+MAP_TOKEN_BUDGET = get_int_option("planner", "map_token_budget", 3000, (100, 100000))
+# Files up to this size are packed together into shared requests
+PACK_FILE_TOKENS = get_int_option("planner", "pack_file_tokens", 300, (0, 100000))
+MAX_FILES_PER_PACK = get_int_option("planner", "max_files_per_pack", 8, (1, 100))
+# Max estimated input tokens of one reduce request, 0 - derived from the context windows of the reduce and
+# summary models: the context less max_tokens of completion, of which REDUCE_CONTEXT_SHARE is used (the rest is left
+# for the prompt and the error of the estimate)
+REDUCE_CONTEXT_SHARE = 0.75
+REDUCE_TOKEN_BUDGET = (
+    get_int_option("planner", "reduce_token_budget", 0, (0, 1000000))
+    or min(
+        int((MODEL_CONTEXT_WINDOWS[STAGE_SETTINGS[stage]["model"]] - STAGE_SETTINGS[stage]["max_tokens"])
+            * REDUCE_CONTEXT_SHARE)
+        for stage in ("reduce", "summary")
+    )
+)
+# Share of REDUCE_TOKEN_BUDGET that starts an intermediate reduce while the map stage is running, 1 - only full
+# requests. Early batches overlap the reduce stage with the map stage, at the cost of a possible extra level.
+REDUCE_EARLY_SHARE = get_float_option("planner", "reduce_early_share", 0.25, (0.01, 1.0))
+
+# scheduler.py
+# Process-wide rate limits, concurrency and retries of all OpenAI requests
+SCHEDULER_REQUESTS_PER_MINUTE = get_int_option("scheduler", "requests_per_minute", 500, (1, 1000000))
+SCHEDULER_TOKENS_PER_MINUTE = get_int_option("scheduler", "tokens_per_minute", 200000, (1000, 100000000))
+SCHEDULER_MAX_CONCURRENCY = get_int_option("scheduler", "max_concurrency", 20, (1, 1000))
+SCHEDULER_MIN_CONCURRENCY = get_int_option("scheduler", "min_concurrency", 1, (1, 1000))
+SCHEDULER_MAX_RETRIES = get_int_option("scheduler", "max_retries", 5, (0, 20))
+SCHEDULER_BACKOFF_BASE = get_float_option("scheduler", "backoff_base", 1.0, (0, 60))
+SCHEDULER_BACKOFF_MAX = get_float_option("scheduler", "backoff_max", 60.0, (0, 3600))
+
+# jobs.py
+# Asynchronous review jobs run by a pool of in-process workers
+JOB_WORKERS = get_int_option("jobs", "workers", 4, (1, 256))
+JOB_QUEUE_SIZE = get_int_option("jobs", "queue_size", 100, (1, 100000))
+JOB_RETENTION = get_int_option("jobs", "retention_seconds", 3600, (1, 604800))
+
+# batch.py
+# Bulk reviews (POST /review/batch and the batch CLI) share one budget of reviews in flight
+BATCH_CONCURRENCY = get_int_option("batch", "concurrency", 8, (1, 256))
+BATCH_MAX_REVIEWS = get_int_option("batch", "max_reviews", 500, (1, 100000))
+
+# offline.py
+# Offline mode: map-stage requests of a batch of reviews are sent as one OpenAI Batch API job
+OFFLINE_POLL_INTERVAL = get_float_option("offline", "poll_interval", 60.0, (0.01, 3600))
+OFFLINE_MAX_WAIT = get_float_option("offline", "max_wait_seconds", 86400.0, (1, 604800))
+
+# filters.py
+# Files skipped between the fetch and the analysis
+FILTERS_ENABLED = get_bool_option("filters", "enabled", True)
+DEFAULT_FILTER_DENY = (
+    "venv/,.venv/,env/,virtualenv/,site-packages/,node_modules/,bower_components/,vendor/,third_party/,"
+    "__pycache__/,.git/,.tox/,.nox/,.mypy_cache/,.pytest_cache/,build/,dist/,*.egg-info/,.idea/,.vscode/,"
+    "migrations/,*_pb2.py,*_pb2_grpc.py,*.min.js,*.min.css,package-lock.json,yarn.lock,poetry.lock,Pipfile.lock"
+)
+FILTER_DENY = [
+    pattern.strip()
+    for pattern in config.get("filters", "deny", fallback=DEFAULT_FILTER_DENY).split(",")
+    if pattern.strip()
+]
+FILTER_MAX_FILE_BYTES = get_int_option("filters", "max_file_bytes", 200000, (0, 100000000))
+FILTER_MAX_LINE_LENGTH = get_int_option("filters", "max_average_line_length", 300, (0, 1000000))
+FILTER_DUPLICATES = get_bool_option("filters", "skip_duplicates", True)
+
+# static_analysis.py
+# Local AST analysis of Python files before the map stage
+STATIC_ANALYSIS_ENABLED = get_bool_option("static_analysis", "enabled", True)
+STATIC_WORKERS = get_int_option("static_analysis", "workers", 0, (0, 256))
+STATIC_SKELETON_MIN_BYTES = get_int_option("static_analysis", "skeleton_min_bytes", 12000, (0, 100000000))
+STATIC_HOTSPOT_COMPLEXITY = get_int_option("static_analysis", "hotspot_complexity", 10, (1, 1000))
+STATIC_MAX_HOTSPOTS = get_int_option("static_analysis", "max_hotspots", 5, (0, 1000))
+STATIC_LONG_FUNCTION_LINES = get_int_option("static_analysis", "long_function_lines", 50, (1, 100000))
+STATIC_DUPLICATE_MIN_LINES = get_int_option("static_analysis", "duplicate_min_lines", 6, (1, 100000))
+
+# services.py
+# Single-request review of small repositories, instead of the structure, map and summary requests
+FAST_PATH_ENABLED = get_bool_option("fast_path", "enabled", True)
+# The fast path is tried if the listing selects at most max_files files...
+FAST_PATH_MAX_FILES = get_int_option("fast_path", "max_files", 10, (1, 1000))
+# ...and taken if the files and the structure fit into token_budget estimated tokens
+FAST_PATH_TOKEN_BUDGET = get_int_option("fast_path", "token_budget", 6000, (100, 1000000))
+
+# api_requests.py
+# Streamed completions: the fields of the final review are sent as they complete ("field" events)
+STREAM_ENABLED = get_bool_option("streaming", "enabled", False)
+# A streamed file analysis is stopped as soon as a whole JSON object has arrived
+STREAM_EARLY_STOP = get_bool_option("streaming", "early_stop", True)
+
+# review.py
+# Time budget of a review in seconds, 0 - no deadline. Requests may set their own in the X-Review-Timeout header
+REVIEW_TIMEOUT = get_float_option("deadlines", "timeout", 600.0, (0.0, 86400.0))
+REVIEW_MAX_TIMEOUT = get_float_option("deadlines", "max_timeout", 1800.0, (1.0, 86400.0))
+# Seconds before the deadline the download, map and reduce stages stop to summarize the completed analyses
+DEADLINE_SUMMARY_RESERVE = get_float_option("deadlines", "summary_reserve", 30.0, (0.0, 3600.0))
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """
+    The review deadline passed before any file analysis was completed, there is nothing to summarize.
+    """
+
+
+class Deadline:
+    """
+    Time budget of one review, shared by all of its stages.
+
+    Args:
+    timeout (float): Seconds the review may take, 0 - no deadline.
+    reserve (float): Seconds kept for the final summary. The download, map and reduce stages stop `reserve`
+    seconds before the deadline (at the latest half way through the budget) and the analyses completed
+    by then are summarized.
+
+    Attributes:
+    expires (Optional[float]): Event loop time of the deadline, `None` without a deadline.
+    cutoff (Optional[float]): Event loop time the download, map and reduce stages stop at.
+    partial (bool): Set when a stage was cut short, the review covers only some of the files.
+    """
+
+    def __init__(self, timeout: float, reserve: float = 0.0):
+        now = asyncio.get_running_loop().time()
+        self.expires: Optional[float] = now + timeout if timeout else None
+        self.cutoff: Optional[float] = self.expires - min(reserve, timeout / 2) if timeout else None
+        self.partial = False
+
+    def until_cutoff(self) -> Optional[float]:
+        """
+        Returns the seconds left until the cutoff (0 once it has passed), `None` without a deadline.
+        """
+        if self.cutoff is None:
+            return None
+        return max(0.0, self.cutoff - asyncio.get_running_loop().time())
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the seconds left until the deadline (0 once it has passed), `None` without a deadline.
+        """
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - asyncio.get_running_loop().time())
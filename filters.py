@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import FILTER_DENY, FILTER_MAX_FILE_BYTES, FILTER_MAX_LINE_LENGTH, FILTER_DUPLICATES
+
+logger = logging.getLogger(__name__)
+
+# Linguist attributes of .gitattributes that exclude a file from the analysis
+LINGUIST_ATTRIBUTES = ("linguist-generated", "linguist-vendored")
+
+# Git treats a file with a NUL byte in its first 8000 bytes as binary
+BINARY_SNIFF_BYTES = 8000
+
+# Reasons a file is skipped. Excluded files are dropped from the listing as well, the content of skipped
+# files is not analysed but their paths remain part of the project structure
+EXCLUDED = "excluded"
+GENERATED = "generated"
+VENDORED = "vendored"
+TOO_LARGE = "too_large"
+BINARY = "binary"
+MINIFIED = "minified"
+DUPLICATE = "duplicate"
+
+
+class GlobPattern:
+    """
+    A gitignore-style pattern matched against paths relative to the repository root.
+
+    Args:
+    pattern (str): "name/" matches a directory at any depth, a pattern without "/" matches a file or directory
+    name at any depth, a pattern with "/" is anchored to the root. "*" and "?" do not cross "/", "**" does.
+
+    Notes:
+    - A path also matches if one of its parent directories matches, so files of a denied directory are denied.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        regex = _translate(pattern.lstrip("/"))
+        self.regex = re.compile(regex if anchored else f"(?:.*/)?{regex}")
+
+    def match(self, path: str) -> bool:
+        parts = path.split("/")
+        candidates = ["/".join(parts[:i]) for i in range(1, len(parts))]
+        if not self.directory_only:
+            candidates.append(path)
+        return any(self.regex.fullmatch(candidate) for candidate in candidates)
+
+    def match_directory(self, path: str) -> bool:
+        """
+        Returns True if everything inside the directory matches, so the directory need not be crawled.
+        """
+        # A placeholder child matches "dir/**" style patterns and the parent directories of the path
+        return self.match(f"{path}/\0")
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translates a glob pattern into a regular expression.
+    """
+    regex, i = "", 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+def parse_gitattributes(text: str) -> List[Tuple[GlobPattern, Dict[str, bool]]]:
+    """
+    Parses the linguist attributes of a .gitattributes file.
+
+    Args:
+    text (str): The .gitattributes content.
+
+    Returns:
+    List[Tuple[GlobPattern, Dict[str, bool]]]: Rules in file order with the attributes they set (`True`)
+    or unset (`False`): "attr" and "attr=true" set, "-attr", "attr=false" and "!attr" unset.
+    """
+    rules = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        attributes = {}
+        for field in fields[1:]:
+            name, _, value = field.lstrip("-!").partition("=")
+            if name in LINGUIST_ATTRIBUTES:
+                attributes[name] = not field.startswith(("-", "!")) and value.lower() not in ("false", "0")
+        if attributes:
+            rules.append((GlobPattern(fields[0]), attributes))
+    return rules
+
+
+class FileFilter:
+    """
+    Decides which repository files are sent to the analysis. One filter is used per fetch of a repository.
+
+    Args:
+    deny (Sequence[str]): Glob patterns of denied files and directories (`GlobPattern`).
+    max_file_bytes (int): Larger files are skipped, 0 - no limit.
+    max_line_length (int): Files with a longer average line (minified, data) are skipped, 0 - no limit.
+    skip_duplicates (bool): Skip byte-identical copies of an already accepted file.
+    gitattributes (str): Content of the root .gitattributes file, see `add_gitattributes`.
+
+    Notes:
+    - `skip_path` and `skip_directory` work on the listing, so denied directories are not crawled and
+      denied or oversized files are not downloaded. `skip_content` checks a downloaded file.
+    - The reason of every skipped path is kept in `skipped`, duplicates are recorded in `duplicates`.
+    - Copies are resolved from the git blob SHAs of the listing once it is complete (`resolve_duplicates`):
+      the lexicographically smallest path is kept, whatever order the files are downloaded in. Without blob SHAs
+      (archive fetch) `skip_content` keeps the first copy it checks.
+    """
+
+    def __init__(self,
+                 deny: Sequence[str] = FILTER_DENY,
+                 max_file_bytes: int = FILTER_MAX_FILE_BYTES,
+                 max_line_length: int = FILTER_MAX_LINE_LENGTH,
+                 skip_duplicates: bool = FILTER_DUPLICATES,
+                 gitattributes: str = ""):
+        self.deny = [GlobPattern(pattern) for pattern in deny]
+        self.max_file_bytes = max_file_bytes
+        self.max_line_length = max_line_length
+        self.skip_duplicates = skip_duplicates
+        self.attributes: List[Tuple[GlobPattern, Dict[str, bool]]] = []
+        self.skipped: Dict[str, str] = {}
+        self.duplicates: Dict[str, str] = {}
+        self._hashes: Dict[str, str] = {}
+        self._blobs: Dict[str, str] = {}
+        self.resolved = asyncio.Event()
+        self.add_gitattributes(gitattributes)
+
+    def add_gitattributes(self, text: str) -> None:
+        """
+        Adds the `linguist-generated` and `linguist-vendored` rules of a .gitattributes file.
+        """
+        self.attributes.extend(parse_gitattributes(text))
+
+    def _linguist(self, match) -> Optional[str]:
+        state = {}
+        for pattern, attributes in self.attributes:
+            if match(pattern):
+                state.update(attributes)
+        if state.get("linguist-generated"):
+            return GENERATED
+        if state.get("linguist-vendored"):
+            return VENDORED
+        return None
+
+    def skip_directory(self, path: str) -> Optional[str]:
+        """
+        Returns the reason to skip a whole directory, or `None` if it has to be crawled.
+        """
+        if any(pattern.match_directory(path) for pattern in self.deny):
+            reason = EXCLUDED
+        else:
+            reason = self._linguist(lambda pattern: pattern.match_directory(path))
+        if reason is not None:
+            self.skipped[f"{path}/"] = reason
+        return reason
+
+    def skip_path(self, path: str, size: Optional[int] = None) -> Optional[str]:
+        """
+        Returns the reason to skip a listed file by its path and size (if known), or `None`.
+
+        Excluded, generated and vendored files are left out of the listing, too large files stay in the
+        listing but are not downloaded.
+        """
+        if any(pattern.match(path) for pattern in self.deny):
+            reason = EXCLUDED
+        else:
+            reason = self._linguist(lambda pattern: pattern.match(path))
+        if reason is None and size is not None and self.max_file_bytes and size > self.max_file_bytes:
+            reason = TOO_LARGE
+        if reason is not None:
+            self.skipped[path] = reason
+        return reason
+
+    def skip_content(self, path: str, data: bytes) -> Optional[str]:
+        """
+        Returns the reason to skip a downloaded file by its content, or `None` if it is analysed.
+
+        Checks the size, binary content (a NUL byte), minified or data content (average line length)
+        and byte-identical copies of an accepted file.
+        """
+        reason = None
+        if self.max_file_bytes and len(data) > self.max_file_bytes:
+            reason = TOO_LARGE
+        elif b"\0" in data[:BINARY_SNIFF_BYTES]:
+            reason = BINARY
+        elif self.max_line_length and len(data) > self.max_line_length * 4 \
+                and len(data) / (data.count(b"\n") + 1) > self.max_line_length:
+            reason = MINIFIED
+        elif self.skip_duplicates:
+            digest = hashlib.sha256(data).hexdigest()
+            original = self._hashes.setdefault(digest, path)
+            if original != path:
+                self.duplicates[path] = original
+                reason = DUPLICATE
+        if reason is not None:
+            self.skipped[path] = reason
+        return reason
+
+    def add_blobs(self, blobs: Dict[str, str]) -> None:
+        """
+        Records the git blob SHAs of listed files by path.
+        """
+        self._blobs.update(blobs)
+
+    def resolve_duplicates(self) -> None:
+        """
+        Marks listed files with equal blob SHAs (byte-identical content) as duplicates of the lexicographically
+        smallest of their paths, and sets `resolved`. Called once the whole tree is listed.
+        """
+        if self.skip_duplicates:
+            kept: Dict[str, str] = {}
+            for path in sorted(self._blobs):
+                original = kept.setdefault(self._blobs[path], path)
+                if original != path:
+                    self.duplicates[path] = original
+                    self.skipped[path] = DUPLICATE
+        self.resolved.set()
+
+    def excludes(self, path: str) -> bool:
+        """
+        Returns True if a path was left out of the listing (excluded, generated, vendored or in such a directory).
+        """
+        return self.skipped.get(path) in (EXCLUDED, GENERATED, VENDORED)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of skipped files and directories by reason.
+        """
+        return dict(Counter(self.skipped.values()))
+
+    def log_summary(self, url: str) -> None:
+        if self.skipped:
+            logger.info(f"Filtered {len(self.skipped)} paths of {url}: {self.stats()}")
+            for path, original in self.duplicates.items():
+                logger.info(f"Duplicate file {path} of {original} is analysed once")
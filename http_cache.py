@@ -0,0 +1,264 @@
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+
+from cache import DiskWriter
+from config import HTTP_CACHE_MAX_BYTES, HTTP_CACHE_MAX_ENTRY_BYTES
+from config import HTTP_CACHE_SQLITE_PATH, HTTP_CACHE_MAX_DISK_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    """
+    A stored response with its validators.
+
+    Attributes:
+    status_code (int): Status code of the original response.
+    headers (List[Tuple[str, str]]): Original response headers, including `Content-Encoding`.
+    body (bytes): Raw (not decoded) response body.
+    etag (Optional[str]): The `ETag` validator.
+    last_modified (Optional[str]): The `Last-Modified` validator.
+    """
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HttpCache:
+    """
+    Response store bounded by the total size of bodies: an in-memory LRU and an optional on-disk SQLite tier.
+
+    Args:
+    max_bytes (int): Max total size of bodies in memory, least recently used are evicted first.
+    sqlite_path (str): Path to the SQLite database file. Empty string disables the disk tier.
+    max_disk_bytes (int): Max total size of bodies on disk, least recently stored are evicted first.
+
+    Notes:
+    - Disk writes go through a `DiskWriter`, so storing responses does not block the event loop on disk I/O.
+    """
+
+    def __init__(self, max_bytes: int, sqlite_path: str = "", max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[DiskWriter] = None
+        self.counters = {"hits": 0, "misses": 0, "stored": 0, "evictions": 0}
+
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, body BLOB, "
+                    "etag TEXT, last_modified TEXT, size INTEGER, created REAL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+                self._db.commit()
+                self._writer = DiskWriter(self._db, self._write_rows, "HTTP cache")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open HTTP cache database {sqlite_path}: {e}. Disk cache is disabled.")
+                self._db = None
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Returns the stored response or `None`. A disk hit is promoted to memory.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        if self._db is not None:
+            try:
+                with self._writer.lock:
+                    row = self._db.execute(
+                        "SELECT status_code, headers, body, etag, last_modified FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"HTTP cache database read failed: {e}")
+                row = None
+            if row is not None:
+                headers = [tuple(header) for header in json.loads(row[1])]
+                entry = CachedResponse(row[0], headers, row[2], row[3], row[4])
+                self._set_memory(key, entry)
+                return entry
+        return None
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        """
+        Stores a response in memory and queues it for the disk tier.
+        """
+        self._set_memory(key, entry)
+        self.counters["stored"] += 1
+        if self._writer is not None:
+            self._writer.add(key, (key, entry.status_code, json.dumps(entry.headers), entry.body,
+                                   entry.etag, entry.last_modified, len(entry.body), time.time()))
+
+    def _write_rows(self, db: sqlite3.Connection, rows: List[tuple]) -> None:
+        """
+        Stores a batch of responses in the disk tier and evicts the oldest ones over the size limit.
+        """
+        db.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        # Drop the oldest rows once the running total of newer rows exceeds the disk limit
+        db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(size) OVER (ORDER BY created DESC) AS total FROM responses) WHERE total > ?)",
+            (self.max_disk_bytes,)
+        )
+
+    async def flush(self) -> None:
+        """
+        Waits until the responses stored so far are written to the disk tier.
+        """
+        if self._writer is not None:
+            await self._writer.flush()
+
+    def _set_memory(self, key: str, entry: CachedResponse) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        self._memory[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self.size -= len(evicted.body)
+            self.counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries from both tiers and resets the counters.
+        """
+        self._memory.clear()
+        self.size = 0
+        if self._writer is not None:
+            self._writer.discard()
+            with self._writer.lock:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+        self.counters = dict.fromkeys(self.counters, 0)
+
+    def stats(self) -> dict:
+        """
+        Returns counters of conditional hits (304), misses and stored responses and the cache size.
+        """
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.size,
+            "disk_enabled": self._db is not None,
+        }
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that turns repeated GET requests into conditional requests.
+
+    Args:
+    transport (httpx.AsyncBaseTransport): The wrapped transport that performs the network requests.
+    cache (HttpCache): The response store.
+    max_entry_bytes (int): Larger responses (e.g. archives) are streamed through uncached.
+
+    Workflow:
+    1. For a GET with a stored response, adds `If-None-Match` / `If-Modified-Since` from its validators.
+    2. On `304 Not Modified` returns the stored response instead.
+    3. Stores `200` responses that carry an `ETag` or `Last-Modified` header.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache: HttpCache, max_entry_bytes: int):
+        self.transport = transport
+        self.cache = cache
+        self.max_entry_bytes = max_entry_bytes
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET" or "range" in request.headers:
+            return await self.transport.handle_async_request(request)
+
+        # Different Accept headers return different representations of the same URL
+        key = f"{request.url}\0{request.headers.get('accept', '')}"
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.etag and "if-none-match" not in request.headers:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified and "if-modified-since" not in request.headers:
+                request.headers["If-Modified-Since"] = entry.last_modified
+
+        response = await self.transport.handle_async_request(request)
+
+        if response.status_code == 304 and entry is not None:
+            await response.aclose()
+            self.cache.counters["hits"] += 1
+            return httpx.Response(
+                status_code=entry.status_code, headers=entry.headers, content=entry.body,
+                request=request, extensions=response.extensions
+            )
+        self.cache.counters["misses"] += 1
+
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        try:
+            content_length = int(response.headers.get("content-length", 0))
+        except ValueError:
+            # A malformed length: the response is passed through uncached
+            logger.warning(f"Invalid Content-Length of {request.url}: {response.headers['content-length']}")
+            return response
+        if response.status_code != 200 or not (etag or last_modified) or content_length > self.max_entry_bytes:
+            return response
+
+        # Read the raw (still encoded) body; stop buffering and stream the rest through if it is too large
+        chunks, size = [], 0
+        stream = response.stream.__aiter__()
+        async for chunk in stream:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_entry_bytes:
+                return httpx.Response(
+                    status_code=response.status_code, headers=response.headers,
+                    stream=_ReplayStream(chunks, stream, response), request=request, extensions=response.extensions
+                )
+        await response.aclose()
+
+        body = b"".join(chunks)
+        headers = list(response.headers.multi_items())
+        self.cache.set(key, CachedResponse(response.status_code, headers, body, etag, last_modified))
+        return httpx.Response(
+            status_code=response.status_code, headers=headers, content=body,
+            request=request, extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """
+    Response stream that yields already read chunks first and then the rest of the original stream.
+    """
+
+    def __init__(self, chunks: List[bytes], rest: AsyncIterator[bytes], response: httpx.Response):
+        self.chunks = chunks
+        self.rest = rest
+        self.response = response
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for chunk in self.chunks:
+            yield chunk
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.response.aclose()
+
+
+http_cache = HttpCache(HTTP_CACHE_MAX_BYTES, HTTP_CACHE_SQLITE_PATH, HTTP_CACHE_MAX_DISK_BYTES)
@@ -0,0 +1,216 @@
+import logging
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP2
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT, HTTP_POOL_TIMEOUT
+from config import HTTP_CACHE_ENABLED, HTTP_CACHE_MAX_ENTRY_BYTES
+from http_cache import CachingTransport, http_cache
+from metrics import InstrumentedTransport
+
+logger = logging.getLogger(__name__)
+
+# Process-wide client, created by `start_http_client` in the application lifespan
+_client: Optional[httpx.AsyncClient] = None
+# Counting transport of the shared client, read by `get_pool_stats`
+_pool_transport: Optional["PoolStatsTransport"] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Creates an `httpx.AsyncClient` with pool limits, keep-alive expiry, timeouts and HTTP/2 from config.ini.
+    If enabled, GET requests go through the conditional request cache (`CachingTransport`).
+    Requests that reach the network are counted by `InstrumentedTransport` for the `/metrics` endpoint
+    and by `PoolStatsTransport` for the `/stats/http_pool` endpoint.
+
+    Returns:
+    httpx.AsyncClient: A new client. The caller is responsible for closing it.
+
+    Notes:
+    - HTTP/2 needs the optional `h2` package. If it is not installed the client falls back to HTTP/1.1.
+    """
+    return _build_http_client()[0]
+
+
+def _build_http_client() -> Tuple[httpx.AsyncClient, "PoolStatsTransport"]:
+    """
+    Builds the client of `create_http_client` and returns it with its `PoolStatsTransport`.
+    """
+    http2 = HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 is enabled in config.ini but package 'h2' is not installed. Using HTTP/1.1.")
+            http2 = False
+
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+    pool_transport = PoolStatsTransport(transport)
+    transport = InstrumentedTransport(pool_transport)
+    if HTTP_CACHE_ENABLED:
+        transport = CachingTransport(transport, http_cache, HTTP_CACHE_MAX_ENTRY_BYTES)
+
+    client = httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_WRITE_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+    )
+    return client, pool_transport
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    Creates the shared client. Called once on application startup.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_shared_client()
+        logger.info(
+            f"HTTP client started (max_connections: {HTTP_MAX_CONNECTIONS}, "
+            f"max_keepalive: {HTTP_MAX_KEEPALIVE_CONNECTIONS}, http2: {HTTP2})"
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """
+    Closes the shared client and all pooled connections. Called once on application shutdown.
+    """
+    global _client, _pool_transport
+    if _client is not None:
+        await _client.aclose()
+        logger.info("HTTP client closed")
+    _client = None
+    _pool_transport = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client, creating it lazily when used outside the application lifespan (scripts, tests).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_shared_client()
+    return _client
+
+
+def _create_shared_client() -> httpx.AsyncClient:
+    """
+    Creates the shared client and remembers its counting transport for `get_pool_stats`.
+    """
+    global _pool_transport
+    client, _pool_transport = _build_http_client()
+    return client
+
+
+def get_pool_stats() -> dict:
+    """
+    Returns a snapshot of the shared connection pool for monitoring.
+
+    Returns:
+    dict: Configured limits and, if the client is running, the number of requests in flight,
+    requests sent, connections opened and requests answered over HTTP/2.
+
+    Notes:
+    - httpx does not expose pool state publicly, the values are counted by `PoolStatsTransport`.
+    - Connections closed by the pool are not reported, `connections_opened` only grows.
+      `requests_total - connections_opened` is roughly the number of requests that reused a connection.
+    """
+    stats = {
+        "running": _client is not None and not _client.is_closed,
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        "http2": HTTP2,
+    }
+    if stats["running"] and _pool_transport is not None:
+        stats.update(_pool_transport.stats())
+    return stats
+
+
+class PoolStatsTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that counts requests in flight and connections opened by the wrapped pool.
+
+    Args:
+    transport (httpx.AsyncBaseTransport): The wrapped transport that performs the network requests.
+
+    Notes:
+    - A request is in flight until its response stream is closed.
+    - New connections are seen through the public `trace` request extension (`connection.connect_tcp.complete`).
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.requests_in_flight = 0
+        self.requests_total = 0
+        self.connections_opened = 0
+        self.http2_requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.requests_in_flight += 1
+        self.requests_total += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.requests_in_flight -= 1
+            raise
+        if response.extensions.get("http_version") == b"HTTP/2":
+            self.http2_requests += 1
+        return httpx.Response(
+            status_code=response.status_code, headers=response.headers,
+            stream=_TrackedStream(response, self), request=request, extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "requests_in_flight": self.requests_in_flight,
+            "requests_total": self.requests_total,
+            "connections_opened": self.connections_opened,
+            "http2_requests": self.http2_requests,
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """
+    Response stream that ends the request of a `PoolStatsTransport` when it is closed.
+    """
+
+    def __init__(self, response: httpx.Response, transport: PoolStatsTransport):
+        self.response = response
+        self.transport = transport
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.response.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.transport.requests_in_flight -= 1
+        await self.response.aclose()
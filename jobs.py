@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RETENTION
+from review import run_review
+from schemas import ReviewRequest
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED_STATUSES = {JOB_DONE, JOB_FAILED, JOB_CANCELLED}
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the job queue is full."""
+
+
+@dataclass
+class ReviewJob:
+    """
+    A review submitted through the job API.
+
+    Attributes:
+    id (str): Job id.
+    request (ReviewRequest): The review parameters.
+    status (str): One of "queued", "running", "done", "failed", "cancelled".
+    progress (dict): Current stage, number of files to analyze and analyzed files, reduction level.
+    result (Optional[List[dict]]): The `/review` payload once the job is done.
+    error (Optional[dict]): `status_code` and `detail` of a failed job.
+    """
+    id: str
+    request: ReviewRequest
+    status: str = JOB_QUEUED
+    progress: dict = field(default_factory=lambda: {"stage": JOB_QUEUED, "files_total": 0, "files_done": 0})
+    result: Optional[List[dict]] = None
+    error: Optional[dict] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    Bounded queue of review jobs and a pool of asyncio workers that run them.
+
+    Args:
+    workers (int): Number of worker tasks, i.e. max number of reviews running at once.
+    queue_size (int): Max number of queued jobs, `submit` raises `JobQueueFull` beyond it.
+    retention (int): Seconds a finished job and its result are kept.
+    """
+
+    def __init__(self, workers: int, queue_size: int, retention: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self.jobs: Dict[str, ReviewJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Starts the worker pool. Called on application startup.
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Job workers started: {self.workers}, queue size: {self.queue_size}")
+
+    async def stop(self) -> None:
+        """
+        Cancels running jobs and stops the worker pool. Called on application shutdown.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self.jobs.values():
+            if job.status not in JOB_FINISHED_STATUSES:
+                self._finish(job, JOB_CANCELLED)
+
+    def submit(self, request: ReviewRequest) -> ReviewJob:
+        """
+        Queues a review job.
+
+        Raises:
+        JobQueueFull: If the queue is full (backpressure, the client should retry later).
+        RuntimeError: If the worker pool is not started.
+        """
+        if self._queue is None:
+            raise RuntimeError("Job workers are not started")
+        self._prune()
+        job = ReviewJob(id=uuid.uuid4().hex, request=request)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} jobs)")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[ReviewJob]:
+        """
+        Cancels a queued or running job. Finished jobs are returned unchanged.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in JOB_FINISHED_STATUSES:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        self._finish(job, JOB_CANCELLED)
+        return job
+
+    def stats(self) -> dict:
+        statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            **{status: statuses.count(status) for status in (JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED)},
+        }
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == JOB_QUEUED:
+                    await self._run(job)
+            except Exception as e:
+                logger.exception(f"Job worker {number} failed on job {job.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ReviewJob) -> None:
+        job.status = JOB_RUNNING
+        job.started = time.time()
+        job.progress["stage"] = "fetch"
+
+        async def on_event(event: str, data: dict) -> None:
+            if event == "files":
+                job.progress.update(stage="structure", files_total=len(data["analyzed"]))
+            elif event == "structure":
+                job.progress["stage"] = "map"
+            elif event == "file":
+                job.progress["files_done"] += 1
+            elif event == "reduce":
+                job.progress.update(stage="reduce", reduce_level=data["level"])
+
+        job.task = asyncio.create_task(run_review(job.request, on_event))
+        try:
+            job.result = await job.task
+            self._finish(job, JOB_DONE)
+        except asyncio.CancelledError:
+            if not job.task.cancelled():
+                raise  # The worker itself is being stopped
+            self._finish(job, JOB_CANCELLED)
+        except HTTPException as e:
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            self._finish(job, JOB_FAILED)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed: {e}")
+            job.error = {"status_code": 500, "detail": "Internal Server Error"}
+            self._finish(job, JOB_FAILED)
+        finally:
+            job.task = None
+
+    def _finish(self, job: ReviewJob, status: str) -> None:
+        if job.status in JOB_FINISHED_STATUSES:
+            return
+        job.status = status
+        job.progress["stage"] = status
+        job.finished = time.time()
+        logger.info(f"Job {job.id} {status}")
+
+    def _prune(self) -> None:
+        """
+        Removes finished jobs older than the retention period.
+        """
+        expired_before = time.time() - self.retention
+        for job_id in [
+            job.id for job in self.jobs.values()
+            if job.status in JOB_FINISHED_STATUSES and job.finished < expired_before
+        ]:
+            del self.jobs[job_id]
+
+
+job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RETENTION)
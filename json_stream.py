@@ -0,0 +1,124 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class JSONFieldParser:
+    """
+    Incremental parser of a JSON object that arrives as a streamed completion.
+
+    The text received so far is passed to `update` after every chunk. Every top-level field is returned once,
+    as soon as its value is complete, and `complete` is set when the closing brace of the object arrives.
+
+    Attributes:
+    fields (Dict[str, Any]): The top-level fields parsed so far.
+    complete (bool): The whole object has arrived, the rest of the completion can be dropped.
+    is_object (Optional[bool]): Whether the completion is a JSON object, `None` until its first character.
+
+    Notes:
+    - Leading whitespace and a Markdown code fence (```json) are skipped, a completion that starts with anything
+      else is free text and is not parsed.
+    - Only the characters added since the previous call are scanned. If the text does not continue the previous
+      one (the request was retried), parsing starts over, but the fields already returned are not returned again.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._reset("")
+
+    def _reset(self, text: str) -> None:
+        self.text = text
+        self.is_object: Optional[bool] = None
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+
+    def update(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Parses the completion text received so far.
+
+        Args:
+        text (str): The whole text of the completion so far.
+
+        Returns:
+        List[Tuple[str, Any]]: (name, value) of the fields completed since the previous call, in order.
+        """
+        if not text.startswith(self.text):
+            self._reset("")
+        self.text = text
+        if self.is_object is None:
+            self._find_object()
+        if not self.is_object or self.complete:
+            return []
+
+        completed = []
+        text, pos = self.text, self._pos
+        while pos < len(text):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed += self._member(pos)
+                    self.complete = True
+                    pos += 1
+                    break
+            elif char == "," and self._depth == 1:
+                completed += self._member(pos)
+                self._member_start = pos + 1
+            pos += 1
+        self._pos = pos
+        return completed
+
+    def _find_object(self) -> None:
+        """
+        Skips leading whitespace and a code fence, and checks if the completion starts with an object.
+        """
+        start = len(self.text) - len(self.text.lstrip())
+        rest = self.text[start:]
+        if rest.startswith("```"):
+            newline = rest.find("\n")
+            if newline < 0:
+                return
+            start += newline + 1
+            rest = self.text[start:]
+            start += len(rest) - len(rest.lstrip())
+            rest = self.text[start:]
+        elif "```".startswith(rest):
+            return  # Possibly the beginning of a code fence
+        if not rest:
+            return
+        self.is_object = rest.startswith("{")
+        if self.is_object:
+            self._depth = 1
+            self._pos = self._member_start = start + 1
+
+    def _member(self, end: int) -> List[Tuple[str, Any]]:
+        """
+        Parses the member `"name": value` that ends before `end` and returns it unless it was returned before.
+        """
+        member = self.text[self._member_start:end]
+        if not member.strip():
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+        completed = []
+        for name, value in parsed.items():
+            if name not in self.fields:
+                self.fields[name] = value
+                completed.append((name, value))
+        return completed
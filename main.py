@@ -1,26 +1,141 @@
-import os
-import time
+import asyncio
 import logging
-import json
+from contextlib import asynccontextmanager
+from typing import Awaitable, Optional, TypeVar
 
-import httpx
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from config import APP_NAME, DEBUG_LEVEL, RESPONSE_REQUIRED_KEYS
-from schemas import ReviewRequest
-from services import repo_url_to_git_api_url, get_all_files, perform_analysis
+from config import DEBUG_LEVEL
+from batch import batch_limiter, stream_batch
+from cache import analysis_cache
+from http_cache import http_cache
+from http_client import start_http_client, close_http_client, get_pool_stats
+from jobs import job_manager, JobQueueFull
+from metrics import registry, CONTENT_TYPE
+from review import run_review_shared, stream_review, review_timeout
+from scheduler import openai_scheduler
+from schemas import ReviewRequest, BatchReviewRequest
+from static_analysis import static_analyzer
 
 logging.basicConfig(level=DEBUG_LEVEL)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the shared HTTP client and starts the job workers on startup,
+    stops the workers, writes the queued cache entries to disk, closes the connection pool and the static
+    analysis pool on shutdown.
+    """
+    await start_http_client()
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    await analysis_cache.flush()
+    await http_cache.flush()
+    await close_http_client()
+    static_analyzer.close()
+
+
 # Initialization FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/stats/http_pool")
+async def http_pool_stats() -> JSONResponse:
+    """
+    Returns connection pool statistics of the shared GitHub HTTP client for monitoring.
+    """
+    return JSONResponse(content=get_pool_stats())
+
+
+@app.get("/stats/cache")
+async def cache_stats() -> JSONResponse:
+    """
+    Returns hit/miss counters and size of the per-file analysis cache.
+    """
+    return JSONResponse(content=analysis_cache.stats())
+
+
+@app.get("/stats/http_cache")
+async def http_cache_stats() -> JSONResponse:
+    """
+    Returns conditional hit (304), miss and size counters of the GitHub response cache.
+    """
+    return JSONResponse(content=http_cache.stats())
+
+
+@app.get("/stats/scheduler")
+async def scheduler_stats() -> JSONResponse:
+    """
+    Returns request/retry/throttling counters, the adaptive concurrency limit and budgets of the OpenAI scheduler.
+    """
+    return JSONResponse(content=openai_scheduler.stats())
+
+
+@app.get("/stats/jobs")
+async def jobs_stats() -> JSONResponse:
+    """
+    Returns the number of job workers, queued jobs and jobs by status.
+    """
+    return JSONResponse(content=job_manager.stats())
+
+
+@app.get("/stats/batch")
+async def batch_stats() -> JSONResponse:
+    """
+    Returns the batch concurrency budget, batch reviews in flight and batches waiting for a slot.
+    """
+    return JSONResponse(content=batch_limiter.stats())
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """
+    Returns metrics in the Prometheus text exposition format: stage latency histograms, GitHub and OpenAI
+    request counters, OpenAI token counters by model and stage, errors by type and in-flight gauges.
+    """
+    return PlainTextResponse(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+async def _cancel_on_disconnect(http_request: Request, work: Awaitable[T]) -> T:
+    """
+    Awaits `work` and cancels it if the client disconnects first.
+
+    Raises:
+    HTTPException:
+    - 499: The client disconnected (the response is not delivered).
+    """
+    task = asyncio.ensure_future(work)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        logger.info("Client disconnected, cancelling the review")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        disconnected.cancel()
+        task.cancel()
+
+
+async def _wait_for_disconnect(http_request: Request) -> None:
+    # The body is already read, the next ASGI message is the disconnect
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
 
 
 @app.post("/review")
-async def review(request: ReviewRequest) -> JSONResponse:
+async def review(request: ReviewRequest,
+                 http_request: Request,
+                 x_review_timeout: Optional[float] = Header(default=None)) -> JSONResponse:
     """
     Endpoint to review and analyze a Git repository.
 
@@ -32,12 +147,15 @@ async def review(request: ReviewRequest) -> JSONResponse:
     - git_url (str): URL of the Git repository to analyze.
     - dev_level (str): The developer's proficiency level for contextual analysis.
     - description (str): Description or context for the analysis.
+    x_review_timeout (Optional[float]): The X-Review-Timeout header, the time budget of the review in seconds
+    (up to `max_timeout` of [deadlines] in config.ini, `timeout` by default).
 
     Returns:
     JSONResponse: A JSON object with the analyzed results containing keys:
     - "Comment" (str): General comments about the repository and developer's code.
     - "Skills" (str): Observations on the developer's skills.
     - "Rating" (int): A numeric rating (1-5) for the developer's performance.
+    - "Partial" (bool): Only in a review cut short by its deadline, that summarizes the files analysed in time.
 
     Raises:
     HTTPException:
@@ -45,101 +163,126 @@ async def review(request: ReviewRequest) -> JSONResponse:
     - 422: Validation error if missing required keys during file analyze.
     - 500: For errors in processing, such as invalid JSON, missing required keys, or unhandled exceptions.
     - 503: HTTP request files downloading failed.
-    - 504: Repository request files downloading timeout.
+    - 504: Repository request files downloading timeout, or the deadline passed before any file was analysed.
 
     Process:
     1. Validate the Git repository URL and retrieve the repository's API URL.
-    2. Fetch all files from the repository.
-    3. Perform an analysis on the retrieved files using the OpenAI API.
-    4. Parse and validate the analysis result to ensure required keys are present.
-    5. Return the validated result as a structured JSON response.
+    2. Start fetching files from the repository in the background and resolve the HEAD commit meanwhile.
+       If it matches the stored snapshot, cancel the fetch and reuse the stored result.
+    3. Wait for the file listing.
+    4. Perform an analysis on the files using the OpenAI API while they are downloaded. Analyses of files
+       unchanged since the previous snapshot are reused, so only added or modified files are analysed.
+    5. Parse and validate the analysis result to ensure required keys are present.
+    6. Store a new snapshot and return the validated result as a structured JSON response.
+    Identical requests (same repository, dev_level and description) arriving while a review is in progress
+    share it and receive its result or error. If all of them disconnect, the review is cancelled.
 
     Logging:
     - Logs significant steps, including start/end times, errors, and validation results, for monitoring and debugging.
     """
 
-    logger.info(f"Start {APP_NAME}")
-    start_time = time.time()
-    git_api_url = repo_url_to_git_api_url(request.git_url)
+    final_response = await _cancel_on_disconnect(
+        http_request, run_review_shared(request, review_timeout(x_review_timeout))
+    )
+    return JSONResponse(content=final_response)
+
+
+@app.post("/review/stream")
+async def review_stream(request: ReviewRequest,
+                        x_review_timeout: Optional[float] = Header(default=None)) -> StreamingResponse:
+    """
+    Streaming variant of `/review` that reports progress as Server-Sent Events (text/event-stream).
+    The X-Review-Timeout header sets the time budget as in `/review`, a disconnect cancels the review.
+
+    Events:
+    - "files": fetched files and the files selected for analysis.
+    - "structure": the project structure analysis.
+    - "file": one file analysis, sent in completion order.
+    - "reduce": one finished reduce request, with its level.
+    - "field": one field ("name" and "value") of the final review as soon as it is complete, before the whole
+      result; with [streaming] enabled it arrives while the rest of the review is still being generated.
+    - "result": the same Solutions/Skills/Rating payload as `/review`.
+    - "error": `status_code` and `detail` of a failed review.
+    """
+    return StreamingResponse(
+        stream_review(request, review_timeout(x_review_timeout)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    if not git_api_url:
-        raise HTTPException(status_code=404, detail="Incorrect repository url")
+@app.post("/review/batch")
+async def review_batch(request: BatchReviewRequest) -> StreamingResponse:
+    """
+    Reviews many repositories (e.g. all submissions of one assignment) in one call.
+
+    Args:
+    request (BatchReviewRequest): The shared description and dev_level, and the list of reviews. Each review has
+    a "git_url" and optional "id", "description" and "dev_level" that override the shared ones.
+
+    Returns:
+    StreamingResponse: Newline-delimited JSON (application/x-ndjson), one line per repository as soon as its
+    review finishes: "index", "id", "git_url", "dev_level", "status" ("done" or "failed"), "seconds" and
+    either "result" (the `/review` payload) or "error" (`status_code` and `detail`).
+
+    Notes:
+    - Reviews of all batches share one concurrency budget ([batch] in config.ini), concurrent batches take
+      turns, and their OpenAI requests share the scheduler budgets.
+    - Files shared by many submissions (e.g. assignment templates) are analysed once thanks to the
+      content-addressed analysis cache, as all reviews use the same description.
+    - If the client disconnects, the reviews still running are cancelled.
+    """
+    return StreamingResponse(
+        stream_batch(request.review_requests(), [item.id for item in request.reviews]),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/reviews", status_code=202)
+async def create_review_job(request: ReviewRequest) -> JSONResponse:
+    """
+    Submits a review to the background workers and returns immediately with the job id.
 
+    Returns:
+    JSONResponse: 202 with the job "id" and "status". Poll `GET /reviews/{id}` for progress and the result.
+
+    Raises:
+    HTTPException:
+    - 429: If the job queue is full, the client should retry later.
+    """
     try:
-        # Files downloading
-        async with httpx.AsyncClient() as client:
-            try:
-                # Files downloading
-                files = await get_all_files(git_api_url, client)
-                if not files:
-                    raise HTTPException(status_code=404, detail="Repository, branch or valid files not found.")
-            except httpx.TimeoutException as e:
-                logger.error(f"HTTP request timed out: {e}")
-                raise HTTPException(status_code=504, detail="Repository request timeout.")
-            except httpx.RequestError as e:
-                logger.error(f"HTTP request failed: {e}")
-                raise HTTPException(status_code=503, detail="Error communicating with Git repository.")
-
-        # Analyze
-        try:
-            # Perform analysis
-            analysis_result = await perform_analysis(files, request.dev_level, request.description)
-
-            # Validate and parse response
-            logger.info(f"Parsing and validating analysis result")
-            response_data = json.loads(analysis_result)
-
-            # Ensure required keys exist
-            required_keys = RESPONSE_REQUIRED_KEYS
-            missing_keys = required_keys - response_data.keys()
-
-            # if missing_keys:
-            #     logger.error(f"Final response is missing required keys: {missing_keys}")
-            #     raise HTTPException(status_code=422, detail=f"Missing required keys: {missing_keys}")
-
-            if isinstance(response_data, dict):
-
-                if missing_keys:
-                    logger.warning(f"Final response is missing required keys: {missing_keys}")
-                    # if missing_keys save data as "Solutions"
-                    final_response = [{
-                        "Solutions": json.dumps(response_data, ensure_ascii=False),
-                        "Skills": None,
-                        "Rating": None
-                    }]
-                else:
-                    # if no missing_keys save as is
-                    final_response = [{
-                        "Solutions": response_data["Solutions"],
-                        "Skills": response_data["Skills"],
-                        "Rating": response_data["Rating"]
-                    }]
-            else:
-                # if response_data is row, save as "Solutions"
-                logger.warning(f"Final response is missing required keys: {missing_keys}")
-                final_response = [{
-                    "Solutions": response_data,
-                    "Skills": None,
-                    "Rating": None
-                }]
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON format in analysis result: {e}")
-            raise HTTPException(status_code=500, detail="Invalid JSON format in response from analysis.")
-        except ValueError as e:
-            logger.error(f"Validation error: {e}")
-            raise HTTPException(status_code=422, detail=str(e))
-        except Exception as e:
-            logger.exception(f"Unhandled error occurred during analysis: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
-
-        # Return the validated response as JSON
-        logger.info(f"Review finished in {time.time() - start_time:.2f}s")
-        return JSONResponse(content=final_response)
-        # return JSONResponse(content=response_data)
-    except HTTPException as http_err:
-        logger.error(f"HTTP error: {http_err.detail}")
-        raise
-    except Exception as e:
-        logger.exception(f"Unhandled error occurred during review: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+        job = job_manager.submit(request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return JSONResponse(status_code=202, content={"id": job.id, "status": job.status})
+
+
+@app.get("/reviews/{job_id}")
+async def get_review_job(job_id: str) -> JSONResponse:
+    """
+    Returns the status, progress and, once done, the result (the `/review` payload) or the error of a job.
+
+    Raises:
+    HTTPException:
+    - 404: If the job is unknown or expired.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.to_dict())
+
+
+@app.delete("/reviews/{job_id}")
+async def cancel_review_job(job_id: str) -> JSONResponse:
+    """
+    Cancels a queued or running job.
+
+    Raises:
+    HTTPException:
+    - 404: If the job is unknown or expired.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.to_dict())
@@ -0,0 +1,284 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets in seconds, from a cached file analysis to a review of a large repository
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """
+    Base class of a metric family with a fixed set of label names.
+
+    Args:
+    name (str): Metric name in the Prometheus format (e.g. "codereview_reviews_in_flight").
+    documentation (str): The `# HELP` text.
+    labelnames (Sequence[str]): Label names, every sample is keyed by their values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.clear()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        """
+        Returns the current value of a sample, 0 if it was never updated.
+        """
+        return self._values.get(self._key(labels), 0.0)
+
+    def clear(self) -> None:
+        self._values.clear()
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        for key, value in sorted(self._values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+    def render(self) -> List[str]:
+        """
+        Returns the metric family in the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {self.name} {_escape_help(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value.
+    """
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g. the number of requests in flight.
+    """
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = float(value)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        """
+        Increases the gauge for the duration of the block.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets, with their sum and count.
+
+    Args:
+    buckets (Sequence[float]): Upper bounds of the buckets, `+Inf` is added automatically.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._observations: Dict[Tuple[str, ...], List[float]] = {}
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # Per bucket counts followed by the sum and the count of observations
+        observations = self._observations.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                observations[i] += 1
+                break
+        observations[-2] += value
+        observations[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Observes the duration of the block in seconds, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        observations = self._observations.get(self._key(labels))
+        return int(observations[-1]) if observations else 0
+
+    def sum(self, **labels) -> float:
+        observations = self._observations.get(self._key(labels))
+        return observations[-2] if observations else 0.0
+
+    def clear(self) -> None:
+        self._observations.clear()
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        for key, observations in sorted(self._observations.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, observations):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), observations[-1]
+            yield f"{self.name}_sum", labels, observations[-2]
+            yield f"{self.name}_count", labels, observations[-1]
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families rendered together by the `/metrics` endpoint.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """
+        Resets all metrics to zero (tests, benchmarks).
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that counts requests to GitHub by method and status code, and transport errors by type.
+
+    Args:
+    transport (httpx.AsyncBaseTransport): The wrapped transport that performs the network requests.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.HTTPError as e:
+            GITHUB_REQUESTS.inc(method=request.method, status="error")
+            ERRORS.inc(source="github", type=e.__class__.__name__)
+            raise
+        GITHUB_REQUESTS.inc(method=request.method, status=str(response.status_code))
+        if response.status_code >= 400:
+            ERRORS.inc(source="github", type=f"http_{response.status_code}")
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def record_openai_usage(response, model: str, stage: str) -> None:
+    """
+    Adds prompt and completion tokens of an OpenAI response (`response.usage`) to the token counter.
+    """
+    usage = getattr(response, "usage", None)
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if isinstance(tokens, int):
+            OPENAI_TOKENS.inc(tokens, model=model, stage=stage, kind=kind)
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "codereview_stage_duration_seconds",
+    "Duration of review stages: fetch, structure, map, reduce (after the last file analysis) and total.",
+    ["stage"],
+))
+GITHUB_REQUESTS = registry.register(Counter(
+    "codereview_github_requests_total", "Requests sent to GitHub by method and status code.", ["method", "status"]
+))
+OPENAI_REQUESTS = registry.register(Counter(
+    "codereview_openai_requests_total",
+    "OpenAI chat completion requests (including retries) by model, stage and status.",
+    ["model", "stage", "status"],
+))
+OPENAI_SECONDS = registry.register(Histogram(
+    "codereview_openai_request_duration_seconds", "Duration of OpenAI requests by model and stage.",
+    ["model", "stage"],
+))
+OPENAI_TOKENS = registry.register(Counter(
+    "codereview_openai_tokens_total", "OpenAI tokens by model, stage and kind (prompt, completion).",
+    ["model", "stage", "kind"],
+))
+ERRORS = registry.register(Counter(
+    "codereview_errors_total", "Errors by source (github, openai, review) and type.", ["source", "type"]
+))
+REVIEWS_IN_FLIGHT = registry.register(Gauge(
+    "codereview_reviews_in_flight", "Reviews currently running."
+))
+OPENAI_IN_FLIGHT = registry.register(Gauge(
+    "codereview_openai_requests_in_flight", "OpenAI requests currently waiting for a response."
+))
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+
+import config
+from config import CACHE_ENABLED, PLANNER_ENABLED, BATCH_CONCURRENCY, OFFLINE_POLL_INTERVAL, OFFLINE_MAX_WAIT
+from config import STATIC_ANALYSIS_ENABLED
+from cache import analysis_cache, file_analysis_key, file_analysis_keys
+from http_client import get_http_client
+from metrics import OPENAI_REQUESTS, OPENAI_TOKENS
+from planner import MapRequest, plan_map_requests
+from review import build_review_response
+from schemas import ReviewRequest
+from services import FileStream, repo_url_to_git_api_url, get_repository_files, perform_analysis
+from services import map_request_arguments, unpack_analyses
+from static_analysis import FileMetrics, static_analyzer, apply_skeletons
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Max requests in one input file of the Batch API, larger batches are split into several jobs
+BATCH_MAX_REQUESTS = 50000
+
+
+@dataclass
+class OfflineReview:
+    """
+    One review of an offline batch.
+
+    Attributes:
+    index (int): Position of the review in the batch.
+    request (ReviewRequest): The review parameters.
+    id (Optional[str]): Caller id of the review.
+    files (Dict[str, Optional[str]]): Fetched repository files.
+    analyses (Dict[str, str]): Per-file analyses from the analysis cache and the batch job.
+    metrics (Dict[str, FileMetrics]): Static analysis metrics of the Python files, their skeletons are sent
+    instead of the content of large files.
+    result (Optional[List[dict]]): The `/review` payload once the review is done.
+    error (Optional[dict]): `status_code` and `detail` of a failed review.
+    """
+    index: int
+    request: ReviewRequest
+    id: Optional[str] = None
+    files: Dict[str, Optional[str]] = field(default_factory=dict)
+    analyses: Dict[str, str] = field(default_factory=dict)
+    metrics: Dict[str, FileMetrics] = field(default_factory=dict)
+    result: Optional[List[dict]] = None
+    error: Optional[dict] = None
+
+
+async def run_offline_batch(requests: List[ReviewRequest],
+                            ids: Optional[List[Optional[str]]] = None,
+                            openai_client: Optional[openai.AsyncOpenAI] = None,
+                            concurrency: int = BATCH_CONCURRENCY
+                            ) -> AsyncIterator[dict]:
+    """
+    Reviews many repositories with the map stage sent as one asynchronous OpenAI Batch API job.
+
+    Args:
+    requests (List[ReviewRequest]): The reviews to run.
+    ids (Optional[List[Optional[str]]]): Caller ids of the reviews, returned with their results.
+    openai_client (Optional[openai.AsyncOpenAI]): Client of the Batch API, `config.client` by default.
+    concurrency (int): Max number of repositories fetched or reduced at the same time.
+
+    Yields:
+    dict: One result per request, in the same format as `batch.run_batch`.
+
+    Workflow:
+    1. Fetches the files of all repositories.
+    2. Plans the map requests of every review like the online mode (`plan_map_requests`, skeletons of large
+       Python files), files with cached analyses are skipped, and writes them with the same prompts to
+       a JSONL batch input file.
+    3. Uploads the file, creates the batch job and polls it until it is finished.
+    4. Joins the results back to reviews and files by `custom_id` and stores them in `analysis_cache`.
+    5. Runs the structure analysis and the reduce stage of every review online with `perform_analysis`, with
+       the static analysis metrics of step 2.
+
+    Notes:
+    - Requests missing from the batch output (failed, expired or timed out job, failed lines) are sent
+      online in step 5, so a review never fails because of the batch job.
+    - The batch job trades latency (up to the 24h completion window) for the lower price and the separate
+      quota of the Batch API.
+    """
+    client = openai_client or config.client
+    start_time = time.perf_counter()
+    reviews = [OfflineReview(index, request, ids[index] if ids else None) for index, request in enumerate(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(review: OfflineReview) -> None:
+        async with semaphore:
+            await _fetch_files(review)
+        if review.error is None and STATIC_ANALYSIS_ENABLED:
+            files = {name: content for name, content in review.files.items() if content is not None}
+            review.metrics = await static_analyzer.analyze(files)
+
+    await asyncio.gather(*(fetch(review) for review in reviews))
+    for review in reviews:
+        if review.error is not None:
+            yield _result(review, start_time)
+
+    lines, plan = build_batch_requests(reviews)
+    if lines:
+        try:
+            batches = await asyncio.gather(*(
+                _run_batch_job(lines[i:i + BATCH_MAX_REQUESTS], client)
+                for i in range(0, len(lines), BATCH_MAX_REQUESTS)
+            ))
+            results = {custom_id: result for batch in batches for custom_id, result in batch.items()}
+        except (openai.OpenAIError, TimeoutError) as e:
+            logger.error(f"Batch job failed, map requests are sent online: {e}")
+            results = {}
+        join_batch_results(plan, results)
+        logger.info(f"Batch results: {len(results)} of {len(lines)} map requests")
+
+    async def finish(review: OfflineReview) -> dict:
+        async with semaphore:
+            await _reduce(review)
+        return _result(review, start_time)
+
+    tasks = [asyncio.create_task(finish(review)) for review in reviews if review.error is None]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _fetch_files(review: OfflineReview) -> None:
+    git_api_url = repo_url_to_git_api_url(review.request.git_url)
+    if not git_api_url:
+        review.error = {"status_code": 404, "detail": "Incorrect repository url"}
+        return
+    try:
+        files = await get_repository_files(git_api_url, get_http_client())
+    except httpx.TimeoutException as e:
+        logger.error(f"HTTP request timed out: {e}")
+        review.error = {"status_code": 504, "detail": "Repository request timeout."}
+        return
+    except httpx.RequestError as e:
+        logger.error(f"HTTP request failed: {e}")
+        review.error = {"status_code": 503, "detail": "Error communicating with Git repository."}
+        return
+    if not files:
+        review.error = {"status_code": 404, "detail": "Repository, branch or valid files not found."}
+        return
+    review.files = files
+
+
+def build_batch_requests(reviews: List[OfflineReview]
+                         ) -> Tuple[List[dict], Dict[str, Tuple[OfflineReview, MapRequest]]]:
+    """
+    Plans the map requests of the reviews as lines of a Batch API input file.
+
+    Returns:
+    Tuple[List[dict], Dict[str, Tuple[OfflineReview, MapRequest]]]: The input file lines, and the review and
+    planned request of every `custom_id`. Cached analyses are added to `OfflineReview.analyses` instead.
+    """
+    lines, plan = [], {}
+    for review in reviews:
+        if review.error is not None:
+            continue
+        dev_level, description = review.request.dev_level, review.request.description
+        misses = {}
+        for name, content in review.files.items():
+            if content is None:
+                continue
+            stored = None
+            if CACHE_ENABLED:
+                stored = analysis_cache.get_any(file_analysis_keys(name, content, dev_level, description))
+            if stored is not None:
+                review.analyses[name] = stored
+            else:
+                misses[name] = content
+
+        misses = apply_skeletons(misses, review.metrics)
+        if PLANNER_ENABLED:
+            requests = plan_map_requests(misses)
+        else:
+            requests = [MapRequest("single", [(name, content)]) for name, content in misses.items()]
+        for number, request in enumerate(requests):
+            custom_id = f"review-{review.index}-{number}"
+            lines.append({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": map_request_arguments(request, dev_level, description),
+            })
+            plan[custom_id] = (review, request)
+    return lines, plan
+
+
+async def _run_batch_job(lines: List[dict], client: openai.AsyncOpenAI) -> Dict[str, str]:
+    """
+    Submits one batch job, waits for it and returns the analysis text of every successful line by `custom_id`.
+    """
+    data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+    file = await client.files.create(file=("map_requests.jsonl", data), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW
+    )
+    logger.info(f"Batch {batch.id} created with {len(lines)} map requests")
+    batch = await wait_for_batch(batch, client)
+    return await download_batch_results(batch, client)
+
+
+async def wait_for_batch(batch, client: openai.AsyncOpenAI,
+                         poll_interval: Optional[float] = None, max_wait: Optional[float] = None):
+    """
+    Polls a batch job every `poll_interval` seconds (`[offline] poll_interval`) until it is finished.
+
+    Raises:
+    TimeoutError: If the job is not finished within `max_wait` seconds (`[offline] max_wait_seconds`).
+    The job is cancelled.
+    """
+    poll_interval = OFFLINE_POLL_INTERVAL if poll_interval is None else poll_interval
+    max_wait = OFFLINE_MAX_WAIT if max_wait is None else max_wait
+    deadline = time.monotonic() + max_wait
+    while batch.status not in BATCH_FINISHED_STATUSES:
+        if time.monotonic() >= deadline:
+            logger.error(f"Batch {batch.id} is not finished in {max_wait}s, cancelling it")
+            await client.batches.cancel(batch.id)
+            raise TimeoutError(f"Batch {batch.id} is not finished in {max_wait}s")
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+        logger.info(f"Batch {batch.id}: {batch.status}, {batch.request_counts}")
+    return batch
+
+
+async def download_batch_results(batch, client: openai.AsyncOpenAI) -> Dict[str, str]:
+    """
+    Reads the output file of a finished batch job. Failed lines are left out.
+    """
+    if batch.status != "completed":
+        logger.warning(f"Batch {batch.id} is {batch.status}")
+    if not batch.output_file_id:
+        return {}
+
+    content = await client.files.content(batch.output_file_id)
+    results = {}
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        body = response.get("body") or {}
+        model = body.get("model", "")
+        if item.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {item.get('custom_id')} failed: {item.get('error') or body}")
+            OPENAI_REQUESTS.inc(model=model, stage="map_batch", status="error")
+            continue
+        OPENAI_REQUESTS.inc(model=model, stage="map_batch", status="ok")
+        for kind in ("prompt", "completion"):
+            tokens = (body.get("usage") or {}).get(f"{kind}_tokens")
+            if isinstance(tokens, int):
+                OPENAI_TOKENS.inc(tokens, model=model, stage="map_batch", kind=kind)
+        results[item["custom_id"]] = body["choices"][0]["message"]["content"].strip()
+    return results
+
+
+def join_batch_results(plan: Dict[str, Tuple[OfflineReview, MapRequest]], results: Dict[str, str]) -> None:
+    """
+    Maps batch results back to per-file analyses of the reviews and stores them in `analysis_cache`.
+    Chunks of a large file are joined once all of them are present, packs are unpacked by file name.
+    """
+    chunks: Dict[Tuple[int, str], List[Optional[str]]] = {}
+    for custom_id, (review, request) in plan.items():
+        result = results.get(custom_id)
+        if result is None:
+            continue
+        if request.kind == "pack":
+            analyses = unpack_analyses(result, [name for name, _ in request.files])
+        elif request.kind == "single":
+            analyses = {request.files[0][0]: result}
+        else:
+            name = request.files[0][0]
+            part, total = request.part
+            parts = chunks.setdefault((review.index, name), [None] * total)
+            parts[part - 1] = result
+            if None in parts:
+                continue
+            analyses = {name: "\n".join(parts)}
+
+        for name, analysis in analyses.items():
+            review.analyses[name] = analysis
+            if CACHE_ENABLED:
+                key = file_analysis_key(
+                    name, review.files[name], review.request.dev_level, review.request.description, request.kind
+                )
+                analysis_cache.set(key, analysis)
+
+
+async def _reduce(review: OfflineReview) -> None:
+    request = review.request
+    try:
+        analysis_result = await perform_analysis(
+            FileStream.from_files(review.files), request.dev_level, request.description, review.analyses,
+            metrics=review.metrics
+        )
+        review.result = build_review_response(analysis_result)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON format in analysis result: {e}")
+        review.error = {"status_code": 500, "detail": "Invalid JSON format in response from analysis."}
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        review.error = {"status_code": 422, "detail": str(e)}
+    except Exception as e:
+        logger.exception(f"Unhandled error occurred during analysis: {e}")
+        review.error = {"status_code": 500, "detail": "Internal Server Error"}
+
+
+def _result(review: OfflineReview, start_time: float) -> dict:
+    item = {"index": review.index, "id": review.id, "git_url": review.request.git_url,
+            "dev_level": review.request.dev_level}
+    if review.error is None:
+        item.update(status="done", result=review.result)
+    else:
+        item.update(status="failed", error=review.error)
+    item["seconds"] = round(time.perf_counter() - start_time, 3)
+    return item
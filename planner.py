@@ -0,0 +1,152 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from config import CHARS_PER_TOKEN, MAP_TOKEN_BUDGET, PACK_FILE_TOKENS, MAX_FILES_PER_PACK
+
+logger = logging.getLogger(__name__)
+
+# Top-level statements that start a new logical block of a Python file
+PYTHON_BOUNDARY = re.compile(r"^(async\s+def|def|class)\s|^@")
+
+
+@dataclass
+class MapRequest:
+    """
+    One planned OpenAI request of the map stage.
+
+    Attributes:
+    kind (str): "single" - one whole file, "pack" - several small files, "chunk" - one part of a large file.
+    files (List[Tuple[str, str]]): (file name, content) pairs sent in the request.
+    part (Tuple[int, int]): (part number, total parts) of a "chunk" request.
+    """
+    kind: str
+    files: List[Tuple[str, str]] = field(default_factory=list)
+    part: Tuple[int, int] = (1, 1)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text by its length (`CHARS_PER_TOKEN` characters per token).
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_content(name: str, content: str, budget: int = MAP_TOKEN_BUDGET) -> List[str]:
+    """
+    Splits a file into chunks of at most `budget` estimated tokens.
+
+    Args:
+    name (str): The file name, `.py` files are split on top-level function/class boundaries.
+    content (str): The file content.
+    budget (int): Max estimated tokens per chunk.
+
+    Returns:
+    List[str]: Chunks in file order. Blocks are kept whole when they fit into the budget,
+    other files are split on blank lines, oversized blocks on line boundaries.
+    """
+    lines = content.splitlines(keepends=True)
+    blocks, current = [], []
+    for i, line in enumerate(lines):
+        if name.endswith(".py"):
+            is_boundary = PYTHON_BOUNDARY.match(line) and not (i and lines[i - 1].startswith("@"))
+        else:
+            is_boundary = i and not lines[i - 1].strip()
+        if is_boundary and current:
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+
+    chunks, chunk = [], ""
+    for block in blocks:
+        for piece in _split_block(block, budget):
+            if chunk and estimate_tokens(chunk + piece) > budget:
+                chunks.append(chunk)
+                chunk = ""
+            chunk += piece
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _split_block(block: List[str], budget: int) -> List[str]:
+    """
+    Returns a block as one piece, or as several pieces of whole lines if it exceeds the budget.
+    """
+    text = "".join(block)
+    if estimate_tokens(text) <= budget:
+        return [text]
+
+    pieces, piece = [], ""
+    max_chars = (budget - 1) * CHARS_PER_TOKEN
+    for line in block:
+        if piece and estimate_tokens(piece + line) > budget:
+            pieces.append(piece)
+            piece = ""
+        while len(line) > max_chars:  # A single huge line (e.g. minified content)
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        piece += line
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def plan_map_requests(files: Dict[str, str],
+                      budget: int = MAP_TOKEN_BUDGET,
+                      pack_file_tokens: int = PACK_FILE_TOKENS,
+                      max_files_per_pack: int = MAX_FILES_PER_PACK
+                      ) -> List[MapRequest]:
+    """
+    Plans map-stage requests so that each request carries up to `budget` estimated tokens of file content.
+
+    Args:
+    files (Dict[str, str]): File name to content of the files to analyze.
+    budget (int): Max estimated tokens of file content per request.
+    pack_file_tokens (int): Files up to this size are packed together with other small files.
+    max_files_per_pack (int): Max number of files in a packed request.
+
+    Returns:
+    List[MapRequest]: Planned requests. Every file is covered either by one "single" or "pack" request,
+    or by all "chunk" requests of the file.
+
+    Workflow:
+    1. Files over the budget are split by `split_content` into "chunk" requests.
+    2. Small files are packed first-fit in file order into "pack" requests; a pack of one file becomes "single".
+    3. All other files get a "single" request.
+    """
+    requests, pack, pack_tokens = [], [], 0
+
+    def close_pack():
+        if len(pack) == 1:
+            requests.append(MapRequest("single", list(pack)))
+        elif pack:
+            requests.append(MapRequest("pack", list(pack)))
+        pack.clear()
+
+    for name, content in files.items():
+        tokens = estimate_tokens(content)
+        if tokens > budget:
+            chunks = split_content(name, content, budget)
+            requests.extend(
+                MapRequest("chunk", [(name, chunk)], (i, len(chunks))) for i, chunk in enumerate(chunks, start=1)
+            )
+        elif tokens <= pack_file_tokens:
+            if pack and (pack_tokens + tokens > budget or len(pack) >= max_files_per_pack):
+                close_pack()
+                pack_tokens = 0
+            pack.append((name, content))
+            pack_tokens += tokens
+        else:
+            requests.append(MapRequest("single", [(name, content)]))
+    close_pack()
+
+    logger.info(
+        f"Map plan: {len(files)} files in {len(requests)} requests "
+        f"(packs: {sum(request.kind == 'pack' for request in requests)}, "
+        f"chunks: {sum(request.kind == 'chunk' for request in requests)})"
+    )
+    return requests
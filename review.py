@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import time
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from config import APP_NAME, RESPONSE_REQUIRED_KEYS, SNAPSHOTS_ENABLED
+from config import REVIEW_TIMEOUT, REVIEW_MAX_TIMEOUT, DEADLINE_SUMMARY_RESERVE
+from deadline import Deadline, DeadlineExceeded
+from http_client import get_http_client
+from metrics import STAGE_SECONDS, REVIEWS_IN_FLIGHT, ERRORS
+from schemas import ReviewRequest
+from services import repo_url_to_git_api_url, stream_repository_files, get_head_commit_sha, perform_analysis
+from services import EventCallback, emit
+from snapshots import snapshot_store, snapshot_key, reusable_analysis, build_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Reviews in progress shared by identical requests, keyed by (git API url, dev_level, description)
+_inflight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+# Number of callers waiting for each shared review
+_waiters: Dict[asyncio.Task, int] = {}
+
+
+def review_timeout(requested: Optional[float] = None) -> float:
+    """
+    Returns the time budget of a review: `requested` (e.g. the X-Review-Timeout header) capped at
+    `REVIEW_MAX_TIMEOUT`, or `REVIEW_TIMEOUT` if none is requested.
+    """
+    if requested is None or requested <= 0:
+        return REVIEW_TIMEOUT
+    return min(requested, REVIEW_MAX_TIMEOUT)
+
+
+async def run_review(request: ReviewRequest,
+                     on_event: Optional[EventCallback] = None,
+                     timeout: Optional[float] = None) -> List[dict]:
+    """
+    Reviews a Git repository: fetches its files, analyzes them with the OpenAI API and validates the result.
+
+    Args:
+    request (ReviewRequest): The review parameters (git_url, dev_level, description).
+    on_event (Optional[EventCallback]): Receives progress events: "files", "structure", "file", "reduce"
+    and "field".
+    timeout (Optional[float]): The time budget of the review in seconds, `REVIEW_TIMEOUT` by default, 0 - none.
+
+    Returns:
+    List[dict]: A one-element list with the "Solutions", "Skills" and "Rating" keys. A review cut short by
+    its deadline also has "Partial": true, it summarizes only the files analyzed in time.
+
+    Raises:
+    HTTPException:
+    - 404: If the repository URL is invalid or no files are found.
+    - 422: Validation error if missing required keys during file analyze.
+    - 500: For errors in processing, such as invalid JSON, missing required keys, or unhandled exceptions.
+    - 503: HTTP request files downloading failed.
+    - 504: Repository request files downloading timeout, or the deadline passed before any file was analyzed
+      or before the summary was done.
+
+    Process:
+    1. Validate the Git repository URL and retrieve the repository's API URL.
+    2. Start fetching files from the repository in the background and resolve the HEAD commit meanwhile.
+       If it matches the stored snapshot, cancel the fetch and reuse the stored result.
+    3. Wait for the file listing.
+    4. Perform an analysis on the files using the OpenAI API while they are downloaded. Analyses of files
+       unchanged since the previous snapshot are reused, so only added or modified files are analysed.
+       `DEADLINE_SUMMARY_RESERVE` seconds before the deadline the download and the analyses still running are
+       cancelled and the completed ones are summarized.
+    5. Parse and validate the analysis result to ensure required keys are present.
+    6. Store a new snapshot (unless the review is partial) and return the validated result.
+    All GitHub and OpenAI requests still running are cancelled at the deadline or when the review is cancelled.
+    """
+
+    logger.info(f"Start {APP_NAME}")
+    start_time = time.time()
+    git_api_url = repo_url_to_git_api_url(request.git_url)
+
+    if not git_api_url:
+        raise HTTPException(status_code=404, detail="Incorrect repository url")
+
+    stream = None
+    deadline = Deadline(review_timeout() if timeout is None else timeout, DEADLINE_SUMMARY_RESERVE)
+
+    async def review() -> List[dict]:
+        nonlocal stream
+        client = get_http_client()
+
+        # Previous review of the same repository with the same parameters
+        key = snapshot_key(git_api_url, request.dev_level, request.description)
+        previous = snapshot_store.get(key) if SNAPSHOTS_ENABLED else None
+        # Files downloading with the shared pooled client starts together with the HEAD commit request,
+        # the analysis starts as soon as the listing is known
+        stream = stream_repository_files(git_api_url, client)
+        commit_sha = await get_head_commit_sha(git_api_url, client) if SNAPSHOTS_ENABLED else None
+        unchanged = previous is not None and commit_sha is not None and previous.commit_sha == commit_sha
+
+        files, analyses = None, {}
+        if unchanged:
+            logger.info(f"Commit {commit_sha} is already reviewed, reusing the stored result")
+            stream.cancel()
+        else:
+            try:
+                paths = await stream.listing
+                if not paths:
+                    raise HTTPException(status_code=404, detail="Repository, branch or valid files not found.")
+            except httpx.TimeoutException as e:
+                logger.error(f"HTTP request timed out: {e}")
+                raise HTTPException(status_code=504, detail="Repository request timeout.")
+            except httpx.RequestError as e:
+                logger.error(f"HTTP request failed: {e}")
+                raise HTTPException(status_code=503, detail="Error communicating with Git repository.")
+            await emit(on_event, "files", {"files": paths, "analyzed": stream.selected})
+
+        # Analyze
+        try:
+            # Perform analysis, only added or modified files are sent to the OpenAI API
+            if unchanged:
+                analysis_result = previous.result
+            else:
+                analysis_result = await perform_analysis(
+                    stream, request.dev_level, request.description, analyses, on_event,
+                    reuse=partial(reusable_analysis, previous), deadline=deadline
+                )
+                files = stream.files
+
+            # Validate and parse response
+            final_response = build_review_response(analysis_result)
+
+            if deadline.partial:
+                logger.warning(f"Review deadline: partial review of {request.git_url}")
+                ERRORS.inc(source="review", type="deadline_partial")
+                final_response[0]["Partial"] = True
+            elif SNAPSHOTS_ENABLED and not unchanged:
+                snapshot_store.set(key, build_snapshot(commit_sha, files, analyses, analysis_result))
+
+        except DeadlineExceeded as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=504, detail=str(e))
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON format in analysis result: {e}")
+            raise HTTPException(status_code=500, detail="Invalid JSON format in response from analysis.")
+        except ValueError as e:
+            logger.error(f"Validation error: {e}")
+            raise HTTPException(status_code=422, detail=str(e))
+        except Exception as e:
+            logger.exception(f"Unhandled error occurred during analysis: {e}")
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+
+        # Return the validated response
+        logger.info(f"Review finished in {time.time() - start_time:.2f}s")
+        return final_response
+
+    REVIEWS_IN_FLIGHT.inc()
+    try:
+        # The whole review is cancelled when the deadline expires
+        return await asyncio.wait_for(review(), deadline.remaining())
+    except asyncio.TimeoutError:
+        logger.error(f"Review deadline exceeded: {request.git_url}")
+        ERRORS.inc(source="review", type="http_504")
+        raise HTTPException(status_code=504, detail="Review deadline exceeded.")
+    except HTTPException as http_err:
+        logger.error(f"HTTP error: {http_err.detail}")
+        ERRORS.inc(source="review", type=f"http_{http_err.status_code}")
+        raise
+    except Exception as e:
+        logger.exception(f"Unhandled error occurred during review: {e}")
+        ERRORS.inc(source="review", type="http_500")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        REVIEWS_IN_FLIGHT.dec()
+        STAGE_SECONDS.observe(time.time() - start_time, stage="total")
+        if stream is not None:
+            stream.cancel()
+
+
+async def run_review_shared(request: ReviewRequest, timeout: Optional[float] = None) -> List[dict]:
+    """
+    Runs `run_review` once for identical concurrent requests (single-flight).
+
+    Args:
+    request (ReviewRequest): The review parameters (git_url, dev_level, description).
+    timeout (Optional[float]): The time budget of the review, requests joining a review in progress share
+    the deadline of the first one.
+
+    Returns:
+    List[dict]: The result of the shared review.
+
+    Raises:
+    HTTPException: The error of the shared review, raised in every caller.
+
+    Notes:
+    - The first request starts the review in a separate task, requests with the same repository, dev_level and
+      description arriving while it runs wait for the same task and cost no extra GitHub or OpenAI calls.
+    - The task is shielded: a caller that disconnects stops waiting but does not cancel the review for others.
+      When the last waiting caller disconnects, the review is cancelled with all its GitHub and OpenAI requests.
+    - The entry is removed when the review finishes, later requests start a new review (served by snapshots).
+    """
+    key = (repo_url_to_git_api_url(request.git_url) or request.git_url, request.dev_level, request.description)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(run_review(request, timeout=timeout))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    else:
+        logger.info(f"Joining the review in progress of {request.git_url}")
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _waiters[task] == 1 and not task.done():
+            logger.info(f"All callers of the review of {request.git_url} are gone, cancelling it")
+            task.cancel()
+        raise
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
+
+
+def _forget_inflight(key: Tuple[str, str, str], task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception as retrieved in case every caller has disconnected
+    if not task.cancelled():
+        task.exception()
+
+
+def build_review_response(analysis_result: str) -> List[dict]:
+    """
+    Parses the final analysis and shapes it into the review response.
+
+    Args:
+    analysis_result (str): The JSON string returned by `perform_analysis`.
+
+    Returns:
+    List[dict]: A one-element list with the "Solutions", "Skills" and "Rating" keys. If required keys are missing,
+    the whole analysis is returned as "Solutions".
+
+    Raises:
+    json.JSONDecodeError: If the analysis is not valid JSON.
+    """
+    logger.info(f"Parsing and validating analysis result")
+    response_data = json.loads(analysis_result)
+
+    # Ensure required keys exist
+    required_keys = RESPONSE_REQUIRED_KEYS
+    missing_keys = required_keys - response_data.keys()
+
+    # if missing_keys:
+    #     logger.error(f"Final response is missing required keys: {missing_keys}")
+    #     raise HTTPException(status_code=422, detail=f"Missing required keys: {missing_keys}")
+
+    if isinstance(response_data, dict):
+
+        if missing_keys:
+            logger.warning(f"Final response is missing required keys: {missing_keys}")
+            # if missing_keys save data as "Solutions"
+            final_response = [{
+                "Solutions": json.dumps(response_data, ensure_ascii=False),
+                "Skills": None,
+                "Rating": None
+            }]
+        else:
+            # if no missing_keys save as is
+            final_response = [{
+                "Solutions": response_data["Solutions"],
+                "Skills": response_data["Skills"],
+                "Rating": response_data["Rating"]
+            }]
+    else:
+        # if response_data is row, save as "Solutions"
+        logger.warning(f"Final response is missing required keys: {missing_keys}")
+        final_response = [{
+            "Solutions": response_data,
+            "Skills": None,
+            "Rating": None
+        }]
+
+    return final_response
+
+
+def format_sse(event: str, data) -> str:
+    """
+    Formats one Server-Sent Events message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_review(request: ReviewRequest, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Runs `run_review` with the `timeout` budget and yields its progress as Server-Sent Events.
+
+    Yields:
+    str: SSE messages: "files", "structure", "file" (one per file, in completion order), "reduce" (one per
+    reduce request), "field" (one per field of the final review), and finally "result" with the same payload
+    as `/review`, or "error" with `status_code` and `detail`.
+
+    Notes:
+    - If the client disconnects, the generator is closed and the review task is cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_event(event: str, data: dict) -> None:
+        await queue.put((event, data))
+
+    task = asyncio.create_task(run_review(request, on_event, timeout))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (item := await queue.get()) is not None:
+            yield format_sse(*item)
+        try:
+            yield format_sse("result", task.result())
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    finally:
+        if not task.done():
+            task.cancel()
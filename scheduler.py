@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+import config
+from config import SCHEDULER_REQUESTS_PER_MINUTE, SCHEDULER_TOKENS_PER_MINUTE
+from config import SCHEDULER_MAX_CONCURRENCY, SCHEDULER_MIN_CONCURRENCY
+from config import SCHEDULER_MAX_RETRIES, SCHEDULER_BACKOFF_BASE, SCHEDULER_BACKOFF_MAX
+from planner import estimate_tokens
+from metrics import OPENAI_REQUESTS, OPENAI_SECONDS, OPENAI_IN_FLIGHT, ERRORS, record_openai_usage
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` units per second up to `per_minute` units.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: int) -> None:
+        """
+        Waits until `amount` units are available and takes them. Callers are served in arrival order.
+        """
+        amount = min(amount, self.capacity)
+        # The lock is bound to the running event loop (the application may be restarted in a new one)
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate)
+                self._refill()
+            self.available -= amount
+
+    def refund(self, amount: float) -> None:
+        """
+        Returns (or, if negative, takes) units after the actual usage of a request is known.
+        """
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class OpenAIScheduler:
+    """
+    Process-wide scheduler of OpenAI chat completion requests.
+
+    Args:
+    requests_per_minute (int): Requests-per-minute budget.
+    tokens_per_minute (int): Tokens-per-minute budget (estimated prompt tokens + `max_tokens`).
+    max_concurrency (int): Upper limit of requests in flight.
+    min_concurrency (int): Lower limit the concurrency can adapt down to.
+    max_retries (int): Max retries of a request on 429, 5xx, timeouts and connection errors.
+    backoff_base (float): Base delay of the exponential backoff in seconds.
+    backoff_max (float): Max delay between retries in seconds.
+
+    Notes:
+    - The concurrency limit adapts to throttling: it is halved on every 429 and grows by about one
+      request per window of successful requests (AIMD), between `min_concurrency` and `max_concurrency`.
+    - Retry delays honour `Retry-After` / `retry-after-ms` headers, otherwise they use exponential backoff
+      with full jitter.
+    - A 429 caused by an exhausted quota (`insufficient_quota`) is not retried.
+    - The estimated tokens of a failed attempt are returned to the token budget, except after a timeout, so
+      retries under throttling are not charged twice.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int,
+                 tokens_per_minute: int,
+                 max_concurrency: int,
+                 min_concurrency: int = 1,
+                 max_retries: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.counters = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0}
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Created lazily inside the running event loop
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    async def create(self, stage: str = "other", **kwargs) -> Any:
+        """
+        Sends `client.chat.completions.create(**kwargs)` within the budgets and retries transient failures.
+
+        Args:
+        stage (str): The review stage of the request ("structure", "map", "reduce", "summary"), used as
+        a metrics label only, it is not sent to the OpenAI API.
+        **kwargs: Arguments of `chat.completions.create`, passed through unchanged.
+
+        Returns:
+        Any: The OpenAI response.
+
+        Raises:
+        openai.OpenAIError: The last error if the request is not retryable or retries are exhausted.
+        """
+        return await self._send(stage, kwargs, lambda: config.client.chat.completions.create(**kwargs))
+
+    async def stream(self,
+                     stage: str = "other",
+                     on_text: Optional[Callable[[str], Awaitable[bool]]] = None,
+                     **kwargs) -> "StreamedCompletion":
+        """
+        Sends a streamed `client.chat.completions.create(stream=True, **kwargs)` within the same budgets and
+        retries as `create`.
+
+        Args:
+        stage (str): The review stage of the request, used as a metrics label only.
+        on_text (Optional[Callable[[str], Awaitable[bool]]]): Receives the whole text received so far after every
+        chunk, returns `True` to stop the generation early (the stream is closed, the rest is not generated).
+        A retried request starts its text over.
+        **kwargs: Arguments of `chat.completions.create`.
+
+        Returns:
+        StreamedCompletion: The text of the completion and its usage, if reported.
+
+        Raises:
+        openai.OpenAIError: The last error if the request is not retryable or retries are exhausted.
+        """
+        return await self._send(stage, kwargs, lambda: _consume_stream(kwargs, on_text))
+
+    async def _send(self, stage: str, kwargs: dict, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `send` within the request and token budgets and the concurrency limit, retrying transient failures.
+        """
+        estimated = sum(estimate_tokens(str(message.get("content", ""))) for message in kwargs.get("messages", []))
+        estimated += kwargs.get("max_tokens") or 0
+
+        model = kwargs.get("model", "")
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated)
+            await self._enter()
+            start = time.perf_counter()
+            try:
+                self.counters["requests"] += 1
+                with OPENAI_IN_FLIGHT.track_inprogress():
+                    response = await send()
+            except openai.OpenAIError as e:
+                OPENAI_REQUESTS.inc(model=model, stage=stage, status=e.__class__.__name__)
+                ERRORS.inc(source="openai", type=e.__class__.__name__)
+                await self._leave(throttled=_is_rate_limit(e))
+                if not isinstance(e, openai.APITimeoutError):
+                    # Rejected or never delivered, the attempt consumed no tokens (a timed out request may have)
+                    self.tokens.refund(estimated)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self.counters["failed"] += 1
+                    raise
+                attempt += 1
+                self.counters["retries"] += 1
+                logger.warning(f"OpenAI request failed ({e.__class__.__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await self._leave(throttled=False)
+                raise
+
+            await self._leave(throttled=False)
+            OPENAI_REQUESTS.inc(model=model, stage=stage, status="ok")
+            OPENAI_SECONDS.observe(time.perf_counter() - start, model=model, stage=stage)
+            record_openai_usage(response, model, stage)
+            usage = getattr(response, "usage", None)
+            total_tokens = getattr(usage, "total_tokens", None)
+            if isinstance(total_tokens, int):
+                self.tokens.refund(estimated - total_tokens)
+            return response
+
+    async def _enter(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def _leave(self, throttled: bool) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.counters["throttled"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                logger.warning(f"OpenAI throttling, concurrency limit decreased to {int(self.limit)}")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _retry_delay(self, error: openai.OpenAIError, attempt: int) -> Optional[float]:
+        """
+        Returns the delay before the next retry, or `None` if the error must not be retried.
+        """
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return None
+
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after = _parse_retry_after(headers)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self) -> dict:
+        """
+        Returns request/retry counters, the current concurrency limit and the available budgets.
+        """
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "concurrency_limit": int(self.limit),
+            "available_requests": int(self.requests.available),
+            "available_tokens": int(self.tokens.available),
+        }
+
+
+@dataclass
+class StreamedCompletion:
+    """
+    Result of `OpenAIScheduler.stream`: the text and usage (`None` if the stream was stopped before the usage
+    chunk) of a streamed completion.
+    """
+    text: str
+    usage: Any = None
+    stopped: bool = False
+
+
+async def _consume_stream(kwargs: dict, on_text: Optional[Callable[[str], Awaitable[bool]]]) -> StreamedCompletion:
+    stream = await config.client.chat.completions.create(
+        **kwargs, stream=True, stream_options={"include_usage": True}
+    )
+    completion = StreamedCompletion(text="")
+    try:
+        async for chunk in stream:
+            completion.usage = getattr(chunk, "usage", None) or completion.usage
+            delta = "".join(choice.delta.content or "" for choice in chunk.choices)
+            if not delta:
+                continue
+            completion.text += delta
+            if on_text is not None and await on_text(completion.text):
+                completion.stopped = True
+                break
+    finally:
+        await stream.close()
+    return completion
+
+
+def _is_rate_limit(error: openai.OpenAIError) -> bool:
+    return isinstance(error, openai.RateLimitError)
+
+
+def _is_retryable(error: openai.OpenAIError) -> bool:
+    if isinstance(error, openai.RateLimitError):
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """
+    Parses `retry-after-ms` or `retry-after` (seconds or HTTP date) into seconds.
+    """
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+openai_scheduler = OpenAIScheduler(
+    SCHEDULER_REQUESTS_PER_MINUTE,
+    SCHEDULER_TOKENS_PER_MINUTE,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MIN_CONCURRENCY,
+    SCHEDULER_MAX_RETRIES,
+    SCHEDULER_BACKOFF_BASE,
+    SCHEDULER_BACKOFF_MAX,
+)
@@ -1,9 +1,39 @@
-from typing import Literal
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from config import BATCH_MAX_REVIEWS
+
+DevLevel = Literal["junior", "middle", "strong"]
 
 
 class ReviewRequest(BaseModel):
     description: str
     git_url: str = "https://github.com/MaksymBratsiun/CodeReviewAI"
-    dev_level: Literal["junior", "middle", "strong"] = "junior"
+    dev_level: DevLevel = "junior"
+
+
+class BatchReviewItem(BaseModel):
+    git_url: str
+    id: Optional[str] = None
+    description: Optional[str] = None
+    dev_level: Optional[DevLevel] = None
+
+
+class BatchReviewRequest(BaseModel):
+    description: str = ""
+    dev_level: DevLevel = "junior"
+    reviews: List[BatchReviewItem] = Field(min_length=1, max_length=BATCH_MAX_REVIEWS)
+
+    def review_requests(self) -> List[ReviewRequest]:
+        """
+        Returns one `ReviewRequest` per repository, the shared description and dev_level fill in missing values.
+        """
+        return [
+            ReviewRequest(
+                git_url=item.git_url,
+                description=self.description if item.description is None else item.description,
+                dev_level=item.dev_level or self.dev_level,
+            )
+            for item in self.reviews
+        ]
@@ -1,26 +1,163 @@
+import json
 import logging
 import configparser
-from typing import Dict, Optional, List
+import time
+import zlib
+from contextlib import aclosing
+from typing import Dict, Optional, List, AsyncIterator, Awaitable, Callable, Collection, Tuple
 
 import httpx
 import asyncio
 
-from config import GITHUB_ROOT, GITHUB_API_URL, BATCH_SIZE, VALID_EXTENSIONS
+from config import GITHUB_ROOT, GITHUB_API_URL, VALID_EXTENSIONS, FETCH_CONCURRENCY
+from config import FETCH_MODE, FILTERS_ENABLED, STATIC_ANALYSIS_ENABLED
+from config import CACHE_ENABLED, PLANNER_ENABLED, REDUCE_TOKEN_BUDGET, REDUCE_EARLY_SHARE, CASCADE_MODEL
+from config import FAST_PATH_ENABLED, FAST_PATH_MAX_FILES, FAST_PATH_TOKEN_BUDGET, RESPONSE_REQUIRED_KEYS
 from api_requests import analyze_summary, analyze_reduce, analyze_structure, analyze_file_content
+from api_requests import analyze_files_pack, file_analysis_request, files_pack_request, analyze_repository
+from api_requests import FieldCallback
+from cache import analysis_cache, file_analysis_key, file_analysis_keys
+from filters import FileFilter, TOO_LARGE, DUPLICATE
+from planner import MapRequest, plan_map_requests, estimate_tokens
+from metrics import STAGE_SECONDS
+from static_analysis import FileMetrics, static_analyzer, apply_skeletons, metrics_report
+from deadline import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+TAR_BLOCK_SIZE = 512
+TAR_DECOMPRESS_CHUNK = 64 * 1024
+# Sent in place of the structure analysis when the review deadline cancels it
+STRUCTURE_CUT_NOTE = "Project structure analysis: unavailable, it was not finished before the review deadline."
+
+# Progress callback: await on_event(event_name, data)
+EventCallback = Callable[[str, dict], Awaitable[None]]
+
+
+async def emit(on_event: Optional[EventCallback], event: str, data: dict) -> None:
+    """
+    Sends a progress event to the callback, if any.
+    """
+    if on_event is not None:
+        await on_event(event, data)
+
+
+def field_events(on_event: Optional[EventCallback]) -> Optional[FieldCallback]:
+    """
+    Returns a callback that sends the fields of the final review ("Solutions", "Skills", "Rating") as "field"
+    events as soon as each of them is complete, or `None` without a progress callback.
+    """
+    if on_event is None:
+        return None
+
+    async def on_field(name: str, value) -> None:
+        if name in RESPONSE_REQUIRED_KEYS:
+            await emit(on_event, "field", {"name": name, "value": value})
+
+    return on_field
+
+
+class FileStream:
+    """
+    Files of a repository delivered while they are being downloaded.
+
+    Attributes:
+    listing (asyncio.Future): Resolves to the paths of all files as soon as the tree listing is known,
+    or to `None` if the repository could not be listed.
+    selected (List[str]): Paths of the listing selected for analysis (files with valid extensions).
+    files (Dict[str, Optional[str]]): All fetched files in the format of `get_all_files`, set once the last
+    batch is delivered.
+    task (Optional[asyncio.Task]): The task that fetches the files.
+    """
+
+    def __init__(self):
+        self.listing: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.selected: List[str] = []
+        self.files: Dict[str, Optional[str]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.listed: List[str] = []  # Paths listed so far by the contents crawl
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    @classmethod
+    def from_files(cls, files: Dict[str, Optional[str]]) -> "FileStream":
+        """
+        Wraps already fetched files into a finished stream.
+        """
+        stream = cls()
+        for name, content in files.items():
+            if content is not None:
+                stream.put(name, content)
+        stream.finish(files)
+        stream.selected = [name for name, content in files.items() if content is not None]
+        return stream
+
+    def set_listing(self, paths: Optional[List[str]], skipped: Collection[str] = ()) -> None:
+        """
+        Publishes the file listing. Files with valid extensions are selected for analysis, except `skipped` ones.
+        """
+        if not self.listing.done():
+            self.selected = [path for path in paths or [] if _has_valid_extension(path) and path not in skipped]
+            self.listing.set_result(paths)
+
+    def put(self, path: str, content: str) -> None:
+        self._queue.put_nowait((path, content))
+
+    def finish(self, files: Dict[str, Optional[str]] | None) -> None:
+        """
+        Ends the stream. `files` is the result of the fetch, `None` if it failed.
+        """
+        self.files = files or {}
+        self.set_listing(list(files) if files is not None else None)
+        self._queue.put_nowait(None)
+
+    async def batches(self) -> AsyncIterator[Dict[str, str]]:
+        """
+        Yields downloaded files with content, all files received since the previous batch at once.
+        """
+        while True:
+            items = [await self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            batch = dict(item for item in items if item is not None)
+            if batch:
+                yield batch
+            if None in items:
+                return
+
+    def cancel(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
 
 # Facade for analyze
-async def perform_analysis(files: dict, dev_level: str, description: str) -> str:
+async def perform_analysis(files: dict | FileStream,
+                           dev_level: str,
+                           description: str,
+                           analyses: Optional[Dict[str, str]] = None,
+                           on_event: Optional[EventCallback] = None,
+                           reuse: Optional[Callable[[str, str], Optional[str]]] = None,
+                           deadline: Optional[Deadline] = None,
+                           metrics: Optional[Dict[str, FileMetrics]] = None
+                           ) -> str:
     """
      Performs a comprehensive analysis of the provided files, generates individual file analyses,
      and creates a summary of the results.
 
      Args:
-     files (dict): A dictionary where keys are file paths and values are file contents.
+     files (dict | FileStream): A dictionary where keys are file paths and values are file contents,
+     or a `FileStream` of files that are still being downloaded.
      dev_level (str): The developer's proficiency level (e.g., "junior", "mid", "senior").
      description (str): A description of the project or task to guide the analysis.
+     analyses (Optional[Dict[str, str]]): Per-file analyses to reuse (e.g. unchanged files of an incremental
+     re-review). Files present in it are not analysed again, new analyses are added to it.
+     on_event (Optional[EventCallback]): Receives progress events: "structure", "file" (in completion order),
+     "reduce" and "field" (a field of the final review as soon as it is complete).
+     reuse (Optional[Callable[[str, str], Optional[str]]]): Returns a stored analysis of a file by its path and
+     content, or `None` if the file has to be analysed (e.g. it changed since the previous snapshot).
+     deadline (Optional[Deadline]): At its cutoff the download and the file analyses still running are cancelled
+     and the analyses completed so far are summarized (`deadline.partial` is set).
+     metrics (Optional[Dict[str, FileMetrics]]): Static analysis metrics computed earlier (e.g. by the offline
+     batch), the files present in it are not analysed by `static_analyzer` again.
 
      Returns:
      str: A summary of the analysis results in JSON format.
@@ -29,46 +166,420 @@ async def perform_analysis(files: dict, dev_level: str, description: str) -> str
      Exception: If any error occurs during the analysis process, it is logged and re-raised.
 
      Workflow:
-     1. Make analysis the project structure by calling `analyze_structure`.
-     2. Clean the input files to exclude any with `None` content.
-     3. Perform content analysis on each file asynchronously using `analyze_file_content`.
-     4. Summarize the analysis results along with the project structure using `summarize_analysis`.
+     1. Waits for the file listing. A small repository (at most `FAST_PATH_MAX_FILES` files, within
+        `FAST_PATH_TOKEN_BUDGET` tokens with the structure) with no stored analysis (in `analyses`, from `reuse`
+        or in `analysis_cache`) is reviewed with a single request (`analyze_repository`), only "field" events
+        are sent then. Otherwise starts the project structure analysis (`analyze_structure`).
+     2. Analyzes files with content as they arrive, skipping reused ones, using `iter_file_analyses`.
+     3. Summarize the analysis results along with the project structure using `summarize_analysis`.
+        Reduction starts while file analyses are still running, as soon as enough of them are ready.
+        The static analysis metrics of the Python files (`metrics_report`) join the results once the map
+        stage is done.
      """
 
+    stream = files if isinstance(files, FileStream) else FileStream.from_files(files)
+    structure_task = None
+    cutoff = None
+    if deadline is not None and deadline.cutoff is not None:
+        def stop_download() -> None:
+            if stream.task is not None and not stream.task.done():
+                logger.warning("Review deadline: the download is cancelled")
+                deadline.partial = True
+                stream.cancel()
+
+        cutoff = asyncio.get_running_loop().call_at(deadline.cutoff, stop_download)
     try:
-        results_structure = await analyze_structure(files, description)
-        cleaned_files = {file_path: content for file_path, content in files.items() if content is not None}
-        logger.info(f"Files to analyze: {len(cleaned_files)}")
+        paths = await stream.listing or []
+        batches = stream.batches()
+        if analyses is None:
+            analyses = {}
+        if FAST_PATH_ENABLED and 0 < len(stream.selected) <= FAST_PATH_MAX_FILES:
+            downloaded = {}
+            async for batch in batches:
+                downloaded.update(batch)
+            batches = _iterate([downloaded] if downloaded else [])
+            stored = _stored_analyses(downloaded, analyses, reuse, dev_level, description)
+            if stored:
+                # Stored analyses cost no requests, only the changed files go through the map stage
+                logger.info(f"Fast path skipped: {len(stored)} of {len(downloaded)} files have stored analyses")
+                analyses.update(stored)
+            else:
+                review = await _review_small_repository(
+                    downloaded, paths, dev_level, description, on_event, metrics, deadline
+                )
+                if review is not None:
+                    return review
+        structure_task = asyncio.ensure_future(_analyze_structure(paths, description, on_event))
+        reused = 0
+
+        def reuse_analysis(name: str, content: str) -> Optional[str]:
+            nonlocal reused
+            analysis = analyses.get(name)
+            if analysis is None and reuse is not None:
+                analysis = reuse(name, content)
+            reused += analysis is not None
+            return analysis
 
-        # File analyze
-        analysis_tasks = [
-            analyze_file_content(name, content, dev_level, description)
-            for name, content in cleaned_files.items()
-        ]
-        analysis_results = await asyncio.gather(*analysis_tasks)
+        map_finished = None
+        file_metrics: Dict[str, FileMetrics] = dict(metrics or {})
+
+        async def analysis_results() -> AsyncIterator[str]:
+            nonlocal map_finished
+            # File analyze
+            start = time.perf_counter()
+            async with aclosing(
+                iter_file_analyses(batches, dev_level, description, on_event, reuse_analysis, file_metrics)
+            ) as results:
+                async for name, analysis in results:
+                    analyses[name] = analysis
+                    yield analysis
+            map_finished = time.perf_counter()
+            STAGE_SECONDS.observe(map_finished - start, stage="map")
+            logger.info(f"Files analyzed: {len(analyses) - reused}, reused: {reused}")
+            logger.info(f"Analysis cache: {analysis_cache.stats()}")
+            if file_metrics:
+                yield metrics_report(file_metrics)
 
         # Summary of results
-        return await summarize_analysis(analysis_results, results_structure, dev_level, description)
+        total = len(stream.selected)
+        if STATIC_ANALYSIS_ENABLED and any(path.endswith(".py") for path in stream.selected):
+            total += 1  # The metrics report
+        async with aclosing(analysis_results()) as results:
+            summary = await summarize_analysis(
+                results, structure_task, dev_level, description, on_event, total=total, deadline=deadline
+            )
+        # Reduction overlaps the map stage, only the part after the last file analysis is on the critical path
+        if map_finished is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - map_finished, stage="reduce")
+        return summary
 
     except Exception as e:
         logger.exception(f"Analysis failed: {e}")
         raise
+    finally:
+        if structure_task is not None:
+            structure_task.cancel()
+        if cutoff is not None:
+            cutoff.cancel()
+
+
+async def _review_small_repository(files: Dict[str, str], paths: List[str], dev_level: str, description: str,
+                                   on_event: Optional[EventCallback] = None,
+                                   known: Optional[Dict[str, FileMetrics]] = None,
+                                   deadline: Optional[Deadline] = None) -> Optional[str]:
+    """
+    Fast path of `perform_analysis`: reviews a small repository with one `analyze_repository` request.
+    The fields of the review are sent as "field" events as they complete.
+
+    Returns `None` if the files are over `FAST_PATH_TOKEN_BUDGET` or the response is not a valid review,
+    the files then go through the map and reduce stages.
+
+    Notes:
+    - The request is the final summary of the review, it may run until the `deadline` expires.
+      `DeadlineExceeded` is raised if it is not done by then.
+    - No per-file analyses are produced, so a snapshot of a fast path review has none to reuse and
+      the next review of the repository takes the fast path again.
+    """
+    tokens = estimate_tokens(", ".join(paths)) + sum(estimate_tokens(content) for content in files.values())
+    if not files or tokens > FAST_PATH_TOKEN_BUDGET:
+        logger.info(f"Fast path skipped: {len(files)} files, {tokens} tokens")
+        return None
+
+    metrics = await _static_metrics(files, known)
+    timeout = deadline.remaining() if deadline is not None else None
+    with STAGE_SECONDS.time(stage="review"):
+        try:
+            result = await asyncio.wait_for(analyze_repository(
+                files, paths, metrics_report(metrics) if metrics else "", dev_level, description, field_events(on_event)
+            ), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Review deadline exceeded before the repository was reviewed.")
+    try:
+        review = json.loads(result)
+        valid = isinstance(review, dict) and RESPONSE_REQUIRED_KEYS <= review.keys()
+    except json.JSONDecodeError:
+        valid = False
+    if not valid:
+        logger.warning(f"Fast path review is not valid, falling back to the map and reduce stages: {result[:200]}")
+        return None
+    logger.info(f"Fast path: {len(files)} files reviewed with one request ({tokens} tokens)")
+    return result
+
+
+def _stored_analyses(files: Dict[str, str],
+                     analyses: Dict[str, str],
+                     reuse: Optional[Callable[[str, str], Optional[str]]],
+                     dev_level: str,
+                     description: str) -> Dict[str, str]:
+    """
+    Returns the analyses of `files` that need no request: given in `analyses`, returned by `reuse`
+    or in `analysis_cache`.
+    """
+    stored = {}
+    for name, content in files.items():
+        analysis = analyses.get(name)
+        if analysis is None and reuse is not None:
+            analysis = reuse(name, content)
+        if analysis is None and CACHE_ENABLED:
+            analysis = analysis_cache.get_any(file_analysis_keys(name, content, dev_level, description))
+        if analysis is not None:
+            stored[name] = analysis
+    return stored
+
+
+async def _static_metrics(files: Dict[str, str],
+                          known: Optional[Dict[str, FileMetrics]] = None) -> Dict[str, FileMetrics]:
+    """
+    Returns the static analysis metrics of the Python files among `files`, the ones in `known` are not computed
+    again.
+    """
+    if not STATIC_ANALYSIS_ENABLED:
+        return {}
+    known = {name: known[name] for name in files if known and name in known}
+    pending = {name: content for name, content in files.items() if name not in known}
+    return {**known, **await static_analyzer.analyze(pending)}
+
+
+async def _analyze_structure(paths: List[str], description: str, on_event: Optional[EventCallback]) -> str:
+    with STAGE_SECONDS.time(stage="structure"):
+        results_structure = await analyze_structure(dict.fromkeys(paths), description)
+    await emit(on_event, "structure", {"analysis": results_structure})
+    return results_structure
+
+
+async def iter_file_analyses(batches: AsyncIterator[Dict[str, str]],
+                             dev_level: str,
+                             description: str,
+                             on_event: Optional[EventCallback] = None,
+                             reuse: Optional[Callable[[str, str], Optional[str]]] = None,
+                             metrics: Optional[Dict[str, FileMetrics]] = None
+                             ) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Map stage: yields (file name, analysis) pairs in completion order.
+
+    Args:
+    batches (AsyncIterator[Dict[str, str]]): File name to content of the files to analyze, in batches as they
+    are downloaded (e.g. `FileStream.batches()`).
+    dev_level (str): The developer's proficiency level.
+    description (str): A description of the project or task to guide the analysis.
+    on_event (Optional[EventCallback]): Receives a "file" event for every file as soon as its analysis is done.
+    reuse (Optional[Callable[[str, str], Optional[str]]]): Returns a stored analysis of a file, if any.
+    metrics (Optional[Dict[str, FileMetrics]]): Receives the static analysis metrics of the Python files.
+    Files already present in it are not analyzed again.
+
+    Yields:
+    Tuple[str, str]: File name and analysis, one per file of all batches.
+
+    Workflow:
+    1. Takes stored analyses from `reuse` and analyses of unchanged content from `analysis_cache`.
+       Python files of the batch are analyzed locally by `static_analyzer`.
+    2. Plans the remaining files of each batch with `plan_map_requests`: small files are packed into shared
+       requests, files over the budget are split into chunks on function/class boundaries. Large Python
+       files are sent as their skeleton with the full source of the hotspots only.
+    3. Runs the planned requests concurrently, while further batches arrive, and maps the results back
+       to file names in completion order.
+    4. Stores successful analyses in `analysis_cache`.
+
+    Notes:
+    - Closing the generator early cancels the requests still running.
+    """
+    tasks: Dict[asyncio.Future, MapRequest] = {}
+    misses: Dict[str, str] = {}
+    chunks: Dict[str, List[Optional[str]]] = {}
+    next_batch: Optional[asyncio.Future] = asyncio.ensure_future(anext(batches))
+    try:
+        while next_batch is not None or tasks:
+            waiting = set(tasks) | ({next_batch} if next_batch is not None else set())
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is next_batch:
+                    try:
+                        batch = task.result()
+                    except StopAsyncIteration:
+                        next_batch = None
+                        continue
+                    next_batch = asyncio.ensure_future(anext(batches))
+
+                    batch_metrics = await _static_metrics(batch, metrics)
+                    if metrics is not None:
+                        metrics.update(batch_metrics)
+
+                    batch_misses = {}
+                    for name, content in batch.items():
+                        stored = reuse(name, content) if reuse is not None else None
+                        if stored is None and CACHE_ENABLED:
+                            stored = analysis_cache.get_any(file_analysis_keys(name, content, dev_level, description))
+                        if stored is not None:
+                            await emit(on_event, "file", {"name": name, "analysis": stored, "cached": True})
+                            yield name, stored
+                        else:
+                            batch_misses[name] = content
+                    misses.update(batch_misses)
+                    # Cache keys are computed from the full content, requests carry the skeletons
+                    batch_misses = apply_skeletons(batch_misses, batch_metrics)
+
+                    if PLANNER_ENABLED:
+                        requests = plan_map_requests(batch_misses)
+                    else:
+                        requests = [MapRequest("single", [(name, content)]) for name, content in batch_misses.items()]
+                    for request in requests:
+                        tasks[asyncio.ensure_future(_run_map_request(request, dev_level, description))] = request
+                    continue
+
+                request, result = tasks.pop(task), task.result()
+                if request.kind == "chunk":
+                    name = request.files[0][0]
+                    part, total = request.part
+                    parts = chunks.setdefault(name, [None] * total)
+                    parts[part - 1] = result
+                    if None in parts:
+                        continue
+                    result = {name: "\n".join(parts)}
+                    failed = any(part.startswith("Error:") for part in parts)
+                else:
+                    failed = False
+                for name, analysis in result.items():
+                    if CACHE_ENABLED and not failed and not analysis.startswith("Error:"):
+                        key = file_analysis_key(name, misses[name], dev_level, description, request.kind)
+                        analysis_cache.set(key, analysis)
+                    await emit(on_event, "file", {"name": name, "analysis": analysis, "cached": False})
+                    yield name, analysis
+    finally:
+        for task in tasks:
+            task.cancel()
+        if next_batch is not None:
+            # Let the cancelled `anext` finish before the caller closes the iterator
+            next_batch.cancel()
+            await asyncio.gather(next_batch, return_exceptions=True)
+
+
+async def _run_map_request(request: MapRequest, dev_level: str, description: str) -> Dict[str, str] | str:
+    """
+    Runs one planned map request. Returns the analysis text of a chunk, otherwise file name to analysis.
+
+    Files missing in the response of a packed request are analyzed again one by one.
+    """
+    if request.kind == "chunk":
+        name, content = request.files[0]
+        return await _analyze_with_cascade(_chunk_name(name, request.part), content, dev_level, description)
+
+    if request.kind == "single":
+        name, content = request.files[0]
+        return {name: await _analyze_with_cascade(name, content, dev_level, description)}
+
+    result = await analyze_files_pack(request.files, dev_level, description)
+    analyses = unpack_analyses(result, [name for name, _ in request.files])
+    missing = [(name, content) for name, content in request.files if name not in analyses]
+    if missing:
+        logger.warning(f"Packed analysis is missing {len(missing)} of {len(request.files)} files, retrying one by one")
+        results = await asyncio.gather(*[
+            _analyze_with_cascade(name, content, dev_level, description) for name, content in missing
+        ])
+        analyses.update(zip([name for name, _ in missing], results))
+    invalid = [(name, content) for name, content in request.files if not _is_valid_analysis(analyses[name])]
+    if CASCADE_MODEL and invalid:
+        results = await asyncio.gather(*[
+            _escalate(name, content, analyses[name], dev_level, description) for name, content in invalid
+        ])
+        analyses.update(zip([name for name, _ in invalid], results))
+    return analyses
+
+
+def _is_valid_analysis(analysis: Optional[str]) -> bool:
+    """
+    Checks a file analysis: only a JSON review with all `RESPONSE_REQUIRED_KEYS` (optionally in a Markdown code
+    fence) is valid. An error result, an empty, truncated or free text response is not.
+    """
+    if not analysis or analysis.startswith("Error:"):
+        return False
+    try:
+        review = json.loads(_strip_code_fence(analysis))
+    except json.JSONDecodeError:
+        return False
+    return isinstance(review, dict) and RESPONSE_REQUIRED_KEYS <= review.keys()
+
+
+async def _analyze_with_cascade(name: str, content: str, dev_level: str, description: str) -> str:
+    """
+    Analyzes a file with the map stage model and escalates it to `CASCADE_MODEL` if the analysis is not valid.
+
+    The escalated analysis replaces the first one unless it fails with an error too, and is cached under the key
+    of the map stage model (`file_analysis_key`). Without `CASCADE_MODEL` this is `analyze_file_content`.
+    """
+    analysis = await analyze_file_content(name, content, dev_level, description)
+    if not CASCADE_MODEL or _is_valid_analysis(analysis):
+        return analysis
+    return await _escalate(name, content, analysis, dev_level, description)
+
+
+async def _escalate(name: str, content: str, analysis: str, dev_level: str, description: str) -> str:
+    logger.warning(f"Analysis of {name} is not valid, escalating to {CASCADE_MODEL}: {analysis[:200]}")
+    escalated = await analyze_file_content(name, content, dev_level, description, model=CASCADE_MODEL)
+    return analysis if escalated.startswith("Error:") else escalated
+
+
+def map_request_arguments(request: MapRequest, dev_level: str, description: str) -> dict:
+    """
+    Returns the `chat.completions.create` arguments of a planned map request, the same as `_run_map_request`
+    sends (used as batch request bodies by the offline mode).
+    """
+    if request.kind == "pack":
+        return files_pack_request(request.files, dev_level, description)
+    name, content = request.files[0]
+    if request.kind == "chunk":
+        name = _chunk_name(name, request.part)
+    return file_analysis_request(name, content, dev_level, description)
+
+
+def _chunk_name(name: str, part: Tuple[int, int]) -> str:
+    return f"{name} (part {part[0]}/{part[1]})"
+
+
+def unpack_analyses(result: str, names: List[str]) -> Dict[str, str]:
+    """
+    Parses the JSON object of a packed analysis into file name to analysis of the requested files.
+    """
+    try:
+        data = json.loads(_strip_code_fence(result))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        name: value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        for name, value in data.items()
+        if name in names
+    }
+
+
+def _strip_code_fence(text: str) -> str:
+    return text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
 
 
 # Summary analysis function of each file content analysis results
-async def summarize_analysis(analysis_results: List[str],
-                             results_structure: str,
+async def summarize_analysis(analysis_results: List[str] | AsyncIterator[str],
+                             results_structure: str | Awaitable[str],
                              dev_level: str,
-                             description: str
+                             description: str,
+                             on_event: Optional[EventCallback] = None,
+                             total: Optional[int] = None,
+                             deadline: Optional[Deadline] = None
                              ) -> str:
     """
     Summarizes the results of file analyses and combines them with the project structure analysis.
 
     Args:
-    analysis_results (List[str]): A list of analysis results for individual files.
-    results_structure (str): A summary of the project's overall structure.
+    analysis_results (List[str] | AsyncIterator[str]): Analysis results for individual files, either a list
+    or an async iterator yielding them as they complete.
+    results_structure (str | Awaitable[str]): A summary of the project's overall structure, or an awaitable
+    of the structure analysis still in progress.
     dev_level (str): The developer's proficiency level (e.g., "junior", "mid", "senior").
     description (str): A description of the project or task to guide the summary.
+    on_event (Optional[EventCallback]): Receives a "reduce" event for every finished reduce request and "field"
+    events with the fields of the final summary.
+    total (Optional[int]): The number of results an async iterator yields, required for an iterator.
+    deadline (Optional[Deadline]): At its cutoff the results still pending and the reduce requests in flight
+    are cancelled, and the results received so far are summarized.
 
     Returns:
     str: A summarized analysis in text format or JSON format if requested.
@@ -78,42 +589,208 @@ async def summarize_analysis(analysis_results: List[str],
 
     Workflow:
     1. Check if there are any results to summarize. Return a message if none exist.
-    2. If the number of results is below the batch size, directly summarize them using `analyze_summary`.
-    3. For larger result sets:
-        - Break the results into smaller batches for incremental reduction using `analyze_reduce`.
-        - Perform batch reductions until the results fit into a single batch.
-    4. Return the final summarized reduction.
+    2. Reduce the results in a pipeline with `analyze_reduce`, the tree is shaped by measured token size:
+        - Results are packed into reduce requests of up to `REDUCE_TOKEN_BUDGET` estimated input tokens,
+          derived from the context windows of the reduce and summary models and their max_tokens.
+        - While other files are still being analyzed, a reduce request starts as soon as the results of one
+          level fill `REDUCE_EARLY_SHARE` of the budget, so the reduce stage overlaps the map stage. The smaller
+          early batches may add a reduce level compared to packing full requests only.
+        - When all results are in, the leftovers of all levels are packed the same way until they fit into
+          a single request.
+    3. If everything fits into a single request from the start, summarize it with `analyze_summary`,
+       otherwise return the final reduction.
     """
 
     try:
-        if len(analysis_results) == 0:
+        if isinstance(analysis_results, list):
+            total = len(analysis_results)
+            analysis_results = _iterate(analysis_results)
+
+        if total == 0:
             logger.info("No file content to summarize")
             return "No file content to summarize."
 
-        if len(analysis_results) <= BATCH_SIZE:
-            logger.info("Summary starts for < 7 files")
-            return await analyze_summary(analysis_results, results_structure, dev_level, description)
-
-        logger.info(f"Summary starts for > 7 files. Total: {len(analysis_results)}")
-        analysis_results.append(results_structure)
-
-        # Loop of summary results
-        while len(analysis_results) >= BATCH_SIZE:
-            logger.info(f"Reducing batch. Current size: {len(analysis_results)}")
-            tasks = [
-                analyze_reduce(analysis_results[i:i + BATCH_SIZE], dev_level, description)
-                for i in range(0, len(analysis_results), BATCH_SIZE)
-            ]
-            analysis_results = await asyncio.gather(*tasks)
-
-        logger.info("Final reduction")
-        return await analyze_reduce(analysis_results, dev_level, description) if analysis_results else "No results"
+        logger.info(f"Summary starts for {total} results, reduce budget: {REDUCE_TOKEN_BUDGET} tokens")
+        return await _reduce_pipeline(
+            analysis_results, results_structure, dev_level, description, on_event, deadline
+        )
 
     except Exception as e:
         logger.exception(f"Summarization failed: {e}")
         raise
 
 
+async def _iterate(results: List[str]) -> AsyncIterator[str]:
+    for result in results:
+        yield result
+
+
+def _take_reduce_batch(ready: List[str], budget: int) -> Optional[List[str]]:
+    """
+    Takes the next full batch to reduce from the front of `ready`, or returns `None` if there is none yet.
+
+    A batch is the longest prefix of `ready` within `budget` estimated tokens, it is full once the next result
+    does not fit. A batch holds at least two results, even if they exceed the budget together.
+    """
+    tokens, size = 0, 0
+    while size < len(ready) and (size < 2 or tokens + estimate_tokens(ready[size]) <= budget):
+        tokens += estimate_tokens(ready[size])
+        size += 1
+    if size == len(ready):
+        return None
+    batch = ready[:size]
+    del ready[:size]
+    return batch
+
+
+async def _reduce_pipeline(analysis_results: AsyncIterator[str],
+                           results_structure: str | Awaitable[str],
+                           dev_level: str,
+                           description: str,
+                           on_event: Optional[EventCallback] = None,
+                           deadline: Optional[Deadline] = None
+                           ) -> str:
+    """
+    Streaming reduction of `summarize_analysis`: overlaps `analyze_reduce` requests with the map stage.
+
+    Results wait in per-level buffers (level 0 - file analyses and the structure analysis, level n - results
+    of reduce requests over level n - 1) and are sent to `analyze_reduce` as soon as a batch is full: a batch of
+    `REDUCE_EARLY_SHARE` of the token budget while results are still arriving, of the whole budget afterwards.
+
+    At the cutoff of the `deadline` the pending results and reduce requests are cancelled, the batches of the
+    cancelled reduce requests go back to their levels, and what fits into one request is summarized.
+    A cancelled structure analysis is replaced by `STRUCTURE_CUT_NOTE`.
+    Raises `DeadlineExceeded` if no result was received by then.
+    """
+    levels: Dict[int, List[str]] = {0: []}
+    reducing: Dict[asyncio.Future, int] = {}
+    batches_reducing: Dict[asyncio.Future, List[str]] = {}
+    structure_task = None
+    structure = ""
+    if isinstance(results_structure, str):
+        structure = results_structure
+        levels[0].append(structure)
+    else:
+        # The structure analysis joins level 0 when it is done
+        structure_task = asyncio.ensure_future(results_structure)
+        reducing[structure_task] = 0
+    received, reduced = 0, 0
+    expired = False
+    early_budget = max(1, int(REDUCE_TOKEN_BUDGET * REDUCE_EARLY_SHARE))
+
+    def reduce(batch: List[str], level: int) -> None:
+        nonlocal reduced
+        reduced += 1
+        logger.info(
+            f"Reducing batch of {len(batch)} results ({sum(map(estimate_tokens, batch))} tokens), level {level}"
+        )
+        task = asyncio.ensure_future(analyze_reduce(batch, dev_level, description))
+        reducing[task] = level
+        batches_reducing[task] = batch
+
+    next_result: Optional[asyncio.Future] = asyncio.ensure_future(anext(analysis_results))
+    try:
+        while True:
+            while next_result is not None or reducing:
+                waiting = set(reducing) | ({next_result} if next_result is not None else set())
+                timeout = deadline.until_cutoff() if deadline is not None else None
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    expired = True
+                    break
+                for task in done:
+                    if task is next_result:
+                        try:
+                            levels[0].append(task.result())
+                            received += 1
+                            next_result = asyncio.ensure_future(anext(analysis_results))
+                        except StopAsyncIteration:
+                            next_result = None
+                    else:
+                        level = reducing.pop(task)
+                        batches_reducing.pop(task, None)
+                        levels.setdefault(level, []).append(task.result())
+                        if task is structure_task:
+                            structure = task.result()
+                        elif level > 0:
+                            await emit(on_event, "reduce", {"level": level, "results": len(levels[level])})
+
+                budget = early_budget if next_result is not None else REDUCE_TOKEN_BUDGET
+                for level, ready in list(levels.items()):
+                    while (batch := _take_reduce_batch(ready, budget)) is not None:
+                        reduce(batch, level + 1)
+
+            if expired:
+                structure_cut = structure_task is not None and structure_task in reducing
+                leftovers = _cut_at_deadline(levels, reducing, batches_reducing, received)
+                # Reduce results among the leftovers, cancelled reduce requests returned their batches
+                reduced = sum(len(results) for level, results in levels.items() if level > 0)
+                if structure_cut:
+                    logger.warning("Review deadline: the structure analysis is cancelled")
+                    structure = STRUCTURE_CUT_NOTE
+                    if reduced:
+                        leftovers.append(structure)
+                break
+
+            # All results are in: reduce the leftovers of all levels until they fit into a single request
+            top = max(levels)
+            leftovers = [result for level in sorted(levels, reverse=True) for result in levels[level]]
+            levels = {top: leftovers}
+            if sum(map(estimate_tokens, leftovers)) <= REDUCE_TOKEN_BUDGET:
+                break
+            batches = 0
+            while (batch := _take_reduce_batch(leftovers, REDUCE_TOKEN_BUDGET)) is not None:
+                reduce(batch, top + 1)
+                batches += 1
+            if not batches:
+                logger.warning(f"Final reduction of {len(leftovers)} results is over the token budget")
+                break
+    finally:
+        for task in reducing:
+            task.cancel()
+        if next_result is not None:
+            # Let the cancelled `anext` finish before the caller closes the iterator
+            next_result.cancel()
+            await asyncio.gather(next_result, return_exceptions=True)
+
+    if not received:
+        logger.info("No file content to summarize")
+        return "No file content to summarize."
+    if expired:
+        deadline.partial = True
+    if not reduced:
+        # All results fit into one request: a single summary without reduce levels
+        if structure in leftovers:
+            leftovers.remove(structure)
+        return await analyze_summary(leftovers, structure, dev_level, description, field_events(on_event))
+
+    logger.info("Final reduction")
+    return await analyze_reduce(leftovers, dev_level, description, field_events(on_event))
+
+
+def _cut_at_deadline(levels: Dict[int, List[str]],
+                     reducing: Dict[asyncio.Future, int],
+                     batches_reducing: Dict[asyncio.Future, List[str]],
+                     received: int) -> List[str]:
+    """
+    Stops the reduce requests in flight at the cutoff of the review deadline and returns the results to summarize:
+    everything received, higher levels first, as far as it fits into one request.
+    """
+    if not received:
+        raise DeadlineExceeded("Review deadline exceeded before any file was analyzed.")
+    for task, level in reducing.items():
+        task.cancel()
+        if task in batches_reducing:
+            levels.setdefault(level - 1, []).extend(batches_reducing[task])
+    leftovers = [result for level in sorted(levels, reverse=True) for result in levels[level]]
+    logger.warning(f"Review deadline: summarizing {received} results received so far")
+    kept = _take_reduce_batch(leftovers, REDUCE_TOKEN_BUDGET)
+    if kept is not None:
+        logger.warning(f"Review deadline: {len(leftovers)} results over the token budget are left out")
+        leftovers = kept
+    return leftovers
+
+
 def repo_url_to_git_api_url(input_url: str) -> str | None:
     """
     Converts a GitHub repository URL to its corresponding GitHub API URL.
@@ -140,39 +817,108 @@ def repo_url_to_git_api_url(input_url: str) -> str | None:
     return None
 
 
-async def get_all_files(url: str, client: httpx.AsyncClient) -> Dict[str, Optional[str]] | None:
+async def get_head_commit_sha(url: str, client: httpx.AsyncClient) -> str | None:
+    """
+    Resolves the HEAD commit SHA of a repository with a single lightweight request.
+
+    Args:
+    url (str): The GitHub API contents URL returned by `repo_url_to_git_api_url`.
+    client (httpx.AsyncClient): An asynchronous HTTP client for making requests.
+
+    Returns:
+    str | None: The 40-character commit SHA, or `None` if the request fails.
+    """
+    repo_url = url.removesuffix("/contents")
+    try:
+        response = await client.get(
+            f"{repo_url}/commits/HEAD", headers={"Accept": "application/vnd.github.sha"}
+        )
+        response.raise_for_status()
+        return response.text.strip() or None
+    except httpx.HTTPError as e:
+        logger.warning(f"Failed to resolve HEAD commit of {repo_url}: {e}")
+        return None
+
+
+async def get_all_files(url: str,
+                        client: httpx.AsyncClient,
+                        concurrency: int = FETCH_CONCURRENCY,
+                        stream: Optional[FileStream] = None,
+                        file_filter: Optional[FileFilter] = None
+                        ) -> Dict[str, Optional[str]] | None:
     """
     Fetches and returns a dictionary of file names and their contents from a given GitHub repository URL.
 
     Args:
     url (str): The GitHub API URL to fetch the repository's file data.
     client (httpx.AsyncClient): An asynchronous HTTP client for making requests.
+    concurrency (int): Max number of simultaneous GitHub requests (`FETCH_CONCURRENCY` by default).
+    stream (Optional[FileStream]): Receives the listing once every directory is listed and each file as soon
+    as it is downloaded.
+    file_filter (Optional[FileFilter]): Skips denied, generated, vendored, oversized, binary and duplicate files.
+    A new `FileFilter` is used by default if filters are enabled in config.ini.
 
     Returns:
     Dict[str, Optional[str]] | None:
     - A dictionary where keys are file names and values are their respective text content
       if they have valid extensions (defined by `VALID_EXTENSIONS`).
-    - For files with invalid extensions, their value is `None`.
+    - For files with invalid extensions or skipped by the filter, their value is `None`.
+      Excluded, generated and vendored files and the contents of denied directories are left out.
     - Returns `None` if the request or processing fails.
 
     Workflow:
-    1. Sends a GET request to the provided URL to retrieve repository data.
-    2. Parses the JSON response to determine the type of each item (file or directory).
-    3. Downloads and stores the content of files with valid extensions in the result dictionary.
-    4. Recursively processes directories to fetch their contents.
-    5. Logs and handles exceptions for HTTP requests, JSON parsing, and file fetching.
+    1. Lists the root directory and schedules every file download and subdirectory listing at once.
+       The root .gitattributes, if any, is read first for its linguist attributes; denied directories
+       are not crawled.
+    2. A shared semaphore bounds the number of requests in flight to `concurrency`.
+    3. Subdirectories are crawled the same way, so the whole tree is fetched in parallel.
+    4. Logs fetch time and fan-out (directories, downloaded and ignored files) once the crawl is done.
 
     Notes:
     - The function ignores files with extensions not in the `VALID_EXTENSIONS` set.
-    - Files in nested directories are recursively fetched and included in the dictionary.
-    - If an error occurs (e.g., a request fails or JSON parsing fails), the function logs the error and returns `None`.
+    - The order of the result keys matches the order of the sequential crawl.
+    - If the root request fails the function returns `None`; failed subdirectories are logged and skipped.
     """
 
-    files_dict = {}
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"dirs": 0, "downloaded": 0, "ignored": 0, "failed": 0, "filtered": 0, "unlisted": 1}
+    if file_filter is None and FILTERS_ENABLED:
+        file_filter = FileFilter()
+
+    files_dict = await _get_directory_files(url, client, semaphore, stats, stream, file_filter)
 
+    if files_dict is not None:
+        logger.info(
+            f"Fetched {len(files_dict)} files from {stats['dirs']} directories in {time.time() - start_time:.2f}s "
+            f"(downloaded: {stats['downloaded']}, ignored: {stats['ignored']}, failed: {stats['failed']}, "
+            f"filtered: {stats['filtered']}, concurrency: {concurrency})"
+        )
+        if file_filter is not None:
+            file_filter.log_summary(url)
+    return files_dict
+
+
+async def _get_directory_files(url: str,
+                               client: httpx.AsyncClient,
+                               semaphore: asyncio.Semaphore,
+                               stats: dict,
+                               stream: Optional[FileStream] = None,
+                               file_filter: Optional[FileFilter] = None
+                               ) -> Dict[str, Optional[str]] | None:
+    """
+    Lists one repository directory and fetches its files and subdirectories concurrently.
+
+    Returns `None` if the directory listing fails, otherwise a dictionary in the format of `get_all_files`.
+    """
+
+    listed = False
     try:
-        response = await client.get(url)
+        # The semaphore is held only for the listing itself, children acquire it on their own
+        async with semaphore:
+            response = await client.get(url)
         response.raise_for_status()  # Raise exception for status code 4xx/5xx
+        stats["dirs"] += 1
         logger.info(f"Fetched data from {url} with status {response.status_code}")
 
         try:
@@ -180,33 +926,22 @@ async def get_all_files(url: str, client: httpx.AsyncClient) -> Dict[str, Option
         except ValueError as e:
             logger.error(f"Failed to parse JSON from {url}: {e}")
             return None
+        if file_filter is not None:
+            items = await _filter_items(items, client, semaphore, file_filter)
+        _directory_listed(items, stats, stream, file_filter)
+        listed = True
 
         # Processing each item
+        tasks = []
         for item in items:
             if item['type'] == 'file':
-                file_name = item['path']
-                file_extension = file_name[file_name.rfind("."):]
-
-                if file_extension in VALID_EXTENSIONS:
-                    try:
-                        file_response = await client.get(item['download_url'])
-                        file_response.raise_for_status()
-                        files_dict[file_name] = file_response.text
-                        logger.info(f"Downloaded file: {file_name}")
-                    except httpx.RequestError as e:
-                        logger.error(f"Failed to fetch file {file_name} from {item['download_url']}: {e}")
-                        files_dict[file_name] = None
-                else:
-                    logger.info(f"Ignored file due to invalid extension: {file_name}")
-                    files_dict[file_name] = None
-
+                tasks.append(_get_file(item, client, semaphore, stats, stream, file_filter))
             elif item['type'] == 'dir':
-                try:
-                    subdir_files = await get_all_files(item['_links']['self'], client)
-                    if subdir_files:
-                        files_dict.update(subdir_files)
-                except Exception as e:
-                    logger.error(f"Error processing directory {item['path']}: {e}")
+                tasks.append(_get_subdirectory_files(item, client, semaphore, stats, stream, file_filter))
+
+        files_dict = {}
+        for result in await asyncio.gather(*tasks):
+            files_dict.update(result)
 
     except httpx.RequestError as e:
         logger.error(f"Failed to fetch data from {url}: {e}")
@@ -214,5 +949,394 @@ async def get_all_files(url: str, client: httpx.AsyncClient) -> Dict[str, Option
     except Exception as e:
         logger.exception(f"Unexpected error while fetching files: {e}")
         return None
+    finally:
+        if not listed:
+            _directory_listed([], stats, stream, file_filter)
 
     return files_dict
+
+
+async def _filter_items(items: list,
+                        client: httpx.AsyncClient,
+                        semaphore: asyncio.Semaphore,
+                        file_filter: FileFilter
+                        ) -> list:
+    """
+    Drops denied directories and excluded files from a directory listing.
+    The linguist attributes of the root .gitattributes are loaded before the listing is filtered.
+    """
+    for item in items:
+        if item.get('type') == 'file' and item['path'] == '.gitattributes':
+            try:
+                async with semaphore:
+                    response = await client.get(item['download_url'])
+                response.raise_for_status()
+                file_filter.add_gitattributes(response.text)
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to fetch .gitattributes: {e}")
+
+    kept = []
+    for item in items:
+        if item.get('type') == 'dir':
+            if file_filter.skip_directory(item['path']) is None:
+                kept.append(item)
+        elif item.get('type') != 'file' or _keep_listed(item['path'], item.get('size'), file_filter):
+            kept.append(item)
+    return kept
+
+
+def _keep_listed(path: str, size: Optional[int], file_filter: Optional[FileFilter]) -> bool:
+    """
+    Returns False for files left out of the listing (excluded, generated, vendored).
+    """
+    if file_filter is None:
+        return True
+    file_filter.skip_path(path, size)
+    return not file_filter.excludes(path)
+
+
+def _directory_listed(items: list,
+                      stats: dict,
+                      stream: Optional[FileStream],
+                      file_filter: Optional[FileFilter] = None
+                      ) -> None:
+    """
+    Records a finished directory listing. Once no directory listing is left, resolves duplicate files from
+    their blob SHAs and publishes the file list.
+    """
+    stats["unlisted"] += sum(item.get('type') == 'dir' for item in items) - 1
+    files = [item for item in items if item.get('type') == 'file']
+    if file_filter is not None:
+        file_filter.add_blobs({
+            item['path']: item['sha'] for item in files if item.get('sha') and _has_valid_extension(item['path'])
+        })
+    if stream is not None:
+        stream.listed.extend(item['path'] for item in files)
+    if stats["unlisted"] == 0:
+        if file_filter is not None:
+            file_filter.resolve_duplicates()
+        if stream is not None:
+            stream.set_listing(list(stream.listed), file_filter.skipped if file_filter is not None else ())
+
+
+async def _get_file(item: dict,
+                    client: httpx.AsyncClient,
+                    semaphore: asyncio.Semaphore,
+                    stats: dict,
+                    stream: Optional[FileStream] = None,
+                    file_filter: Optional[FileFilter] = None
+                    ) -> Dict[str, Optional[str]]:
+    """
+    Downloads one file of a directory listing. Files with invalid extension, skipped by the filter or failed
+    download map to `None`.
+    """
+
+    file_name = item['path']
+    file_extension = file_name[file_name.rfind("."):]
+
+    if file_extension not in VALID_EXTENSIONS:
+        logger.info(f"Ignored file due to invalid extension: {file_name}")
+        stats["ignored"] += 1
+        return {file_name: None}
+
+    if file_filter is not None and file_filter.skipped.get(file_name) in (TOO_LARGE, DUPLICATE):
+        logger.info(f"Skipped file ({file_filter.skipped[file_name]}): {file_name}")
+        stats["filtered"] += 1
+        return {file_name: None}
+
+    try:
+        async with semaphore:
+            file_response = await client.get(item['download_url'])
+        file_response.raise_for_status()
+        logger.info(f"Downloaded file: {file_name}")
+        stats["downloaded"] += 1
+        if file_filter is not None:
+            # Copies of a file are known once the whole tree is listed
+            await file_filter.resolved.wait()
+            if file_filter.skipped.get(file_name) == DUPLICATE:
+                reason = DUPLICATE
+            else:
+                reason = file_filter.skip_content(file_name, file_response.content)
+            if reason is not None:
+                logger.info(f"Skipped file ({reason}): {file_name}")
+                stats["filtered"] += 1
+                return {file_name: None}
+        if stream is not None:
+            stream.put(file_name, file_response.text)
+        return {file_name: file_response.text}
+    except httpx.RequestError as e:
+        logger.error(f"Failed to fetch file {file_name} from {item['download_url']}: {e}")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Failed to fetch file {file_name}: {e}")
+    stats["failed"] += 1
+    return {file_name: None}
+
+
+async def _get_subdirectory_files(item: dict,
+                                  client: httpx.AsyncClient,
+                                  semaphore: asyncio.Semaphore,
+                                  stats: dict,
+                                  stream: Optional[FileStream] = None,
+                                  file_filter: Optional[FileFilter] = None
+                                  ) -> Dict[str, Optional[str]]:
+    """
+    Crawls a subdirectory of a listing. Errors are logged and the subdirectory is skipped.
+    """
+
+    try:
+        subdir_files = await _get_directory_files(
+            item['_links']['self'], client, semaphore, stats, stream, file_filter
+        )
+        if subdir_files:
+            return subdir_files
+    except Exception as e:
+        logger.error(f"Error processing directory {item['path']}: {e}")
+    return {}
+
+
+async def get_repository_files(url: str, client: httpx.AsyncClient) -> Dict[str, Optional[str]] | None:
+    """
+    Fetches repository files using the fetch mode selected by `FETCH_MODE` in config.ini.
+
+    Args:
+    url (str): The GitHub API contents URL returned by `repo_url_to_git_api_url`.
+    client (httpx.AsyncClient): An asynchronous HTTP client for making requests.
+
+    Returns:
+    Dict[str, Optional[str]] | None: The same contract as `get_all_files`.
+    """
+    if FETCH_MODE == "archive":
+        return await get_all_files_archive(url, client)
+    return await get_all_files(url, client)
+
+
+def stream_repository_files(url: str, client: httpx.AsyncClient) -> FileStream:
+    """
+    Starts fetching repository files in the background with the fetch mode selected by `FETCH_MODE`.
+
+    Args:
+    url (str): The GitHub API contents URL returned by `repo_url_to_git_api_url`.
+    client (httpx.AsyncClient): An asynchronous HTTP client for making requests.
+
+    Returns:
+    FileStream: The listing resolves as soon as the tree is known and files are delivered as they are
+    downloaded, so the analysis overlaps the download. `FileStream.cancel()` stops the fetch.
+    """
+    stream = FileStream()
+
+    async def fetch() -> None:
+        files = None
+        start = time.perf_counter()
+        try:
+            if FETCH_MODE == "archive":
+                files = await get_all_files_archive(url, client, stream)
+            else:
+                files = await get_all_files(url, client, stream=stream)
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="fetch")
+            stream.finish(files)
+
+    stream.task = asyncio.create_task(fetch())
+    return stream
+
+
+async def get_all_files_archive(url: str,
+                                client: httpx.AsyncClient,
+                                stream: Optional[FileStream] = None,
+                                file_filter: Optional[FileFilter] = None
+                                ) -> Dict[str, Optional[str]] | None:
+    """
+    Fetches repository files with one recursive Git Trees request and one streamed tarball download.
+
+    Args:
+    url (str): The GitHub API contents URL returned by `repo_url_to_git_api_url`.
+    client (httpx.AsyncClient): An asynchronous HTTP client for making requests.
+    stream (Optional[FileStream]): Receives the tree listing and each file as soon as it is unpacked.
+    file_filter (Optional[FileFilter]): The same as in `get_all_files`.
+
+    Returns:
+    Dict[str, Optional[str]] | None: The same contract as `get_all_files`:
+    - text content for files with valid extensions (defined by `VALID_EXTENSIONS`),
+    - `None` for all other files,
+    - `None` instead of a dictionary if the request or processing fails.
+
+    Workflow:
+    1. Requests `/git/trees/HEAD?recursive=1` to get the full file list in a single call.
+    2. Streams `/tarball/HEAD` and gunzips it chunk by chunk in memory.
+    3. Reads the bodies of files with valid extensions that pass the filter; every other archive member is
+       skipped as it streams, so its content is never buffered as a whole.
+
+    Notes:
+    - Any files of the archive that are missing in the (possibly truncated) tree listing are added as well.
+    """
+
+    start_time = time.time()
+    repo_url = url.removesuffix("/contents")
+    if file_filter is None and FILTERS_ENABLED:
+        file_filter = FileFilter()
+
+    def keep(file_name: str) -> bool:
+        if not _has_valid_extension(file_name):
+            return False
+        if file_filter is None:
+            return True
+        return file_name not in file_filter.skipped and file_filter.skip_path(file_name) is None
+
+    try:
+        response = await client.get(f"{repo_url}/git/trees/HEAD", params={"recursive": "1"})
+        response.raise_for_status()
+        tree = response.json()
+        if tree.get("truncated"):
+            logger.warning(f"Tree listing of {repo_url} is truncated, file list is completed from the archive")
+
+        blobs = [item for item in tree.get("tree", []) if item["type"] == "blob"]
+        if file_filter is not None and any(item["path"] == ".gitattributes" for item in blobs):
+            file_filter.add_gitattributes(await _get_gitattributes(url, client))
+        files_dict = {
+            item["path"]: None for item in blobs if _keep_listed(item["path"], item.get("size"), file_filter)
+        }
+        if stream is not None:
+            stream.set_listing(list(files_dict), file_filter.skipped if file_filter is not None else ())
+
+        async with client.stream("GET", f"{repo_url}/tarball/HEAD", follow_redirects=True) as archive:
+            archive.raise_for_status()
+            async for file_name, data in _iter_tar_files(archive.aiter_bytes(), keep):
+                if file_filter is not None and file_filter.skip_content(file_name, data) is not None:
+                    files_dict[file_name] = None
+                    continue
+                files_dict[file_name] = data.decode("utf-8", errors="replace")
+                if stream is not None:
+                    stream.put(file_name, files_dict[file_name])
+
+    except httpx.RequestError as e:
+        logger.error(f"Failed to fetch data from {repo_url}: {e}")
+        return None
+    except Exception as e:
+        logger.exception(f"Unexpected error while fetching archive: {e}")
+        return None
+
+    downloaded = sum(content is not None for content in files_dict.values())
+    logger.info(
+        f"Fetched {len(files_dict)} files from archive in {time.time() - start_time:.2f}s "
+        f"(downloaded: {downloaded}, ignored: {len(files_dict) - downloaded})"
+    )
+    if file_filter is not None:
+        file_filter.log_summary(repo_url)
+    return files_dict
+
+
+async def _get_gitattributes(url: str, client: httpx.AsyncClient) -> str:
+    """
+    Returns the content of the root .gitattributes file, or an empty string if it cannot be fetched.
+    """
+    try:
+        response = await client.get(f"{url}/.gitattributes", headers={"Accept": "application/vnd.github.raw"})
+        response.raise_for_status()
+        return response.text
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch .gitattributes: {e}")
+        return ""
+
+
+def _has_valid_extension(file_name: str) -> bool:
+    return file_name[file_name.rfind("."):] in VALID_EXTENSIONS
+
+
+async def _iter_tar_files(chunks: AsyncIterator[bytes],
+                          keep: Callable[[str], bool]
+                          ) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Unpacks a gzipped tarball from a stream of compressed chunks and yields `(path, content)` of regular files.
+
+    Args:
+    chunks (AsyncIterator[bytes]): Compressed archive bytes, e.g. `httpx.Response.aiter_bytes()`.
+    keep (Callable[[str], bool]): Predicate on the file path; content of rejected files is skipped unread.
+
+    Yields:
+    Tuple[str, bytes]: File path without the archive root directory and the file content.
+
+    Notes:
+    - Supports ustar headers, pax extended headers (long paths) and GNU long names.
+    - At most `TAR_DECOMPRESS_CHUNK` bytes are decompressed ahead of the current read position.
+    """
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    iterator = chunks.__aiter__()
+    buffer = bytearray()
+    finished = False
+
+    async def fill(size: int) -> bool:
+        nonlocal finished
+        while len(buffer) < size and not finished:
+            if decompressor.unconsumed_tail:
+                data = decompressor.unconsumed_tail
+            else:
+                try:
+                    data = await iterator.__anext__()
+                except StopAsyncIteration:
+                    buffer.extend(decompressor.flush())
+                    finished = True
+                    break
+            buffer.extend(decompressor.decompress(data, TAR_DECOMPRESS_CHUNK))
+        return len(buffer) >= size
+
+    async def read(size: int) -> bytes:
+        if not await fill(size):
+            raise ValueError("Unexpected end of archive")
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        return data
+
+    async def skip(size: int) -> None:
+        while size > 0:
+            if not buffer and not await fill(1):
+                raise ValueError("Unexpected end of archive")
+            step = min(size, len(buffer))
+            del buffer[:step]
+            size -= step
+
+    long_path = None
+    while await fill(TAR_BLOCK_SIZE):
+        header = await read(TAR_BLOCK_SIZE)
+        if not header.strip(b"\0"):
+            break  # End of archive marker
+
+        path = header[0:100].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+        if header[257:262] == b"ustar":
+            prefix = header[345:500].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+            if prefix:
+                path = f"{prefix}/{path}"
+        if header[124] & 0x80:
+            size = int.from_bytes(header[125:136], "big")  # GNU base-256 size
+        else:
+            size = int(header[124:136].split(b"\0", 1)[0].strip() or b"0", 8)
+        padding = -size % TAR_BLOCK_SIZE
+        type_flag = header[156:157]
+
+        if type_flag == b"x":
+            # pax extended header for the next member: "<length> <key>=<value>\n" records
+            records = (await read(size)).decode("utf-8", errors="replace")
+            await skip(padding)
+            for record in records.splitlines():
+                key, _, value = record.partition(" ")[2].partition("=")
+                if key == "path":
+                    long_path = value
+        elif type_flag == b"L":
+            long_path = (await read(size)).rstrip(b"\0").decode("utf-8", errors="replace")
+            await skip(padding)
+        elif type_flag in (b"0", b"\0", b"7"):
+            path = long_path or path
+            long_path = None
+            # Drop the "<owner>-<repo>-<sha>/" root directory of the archive
+            file_name = path.split("/", 1)[1] if "/" in path else path
+            if keep(file_name):
+                data = await read(size)
+                await skip(padding)
+                yield file_name, data
+            else:
+                await skip(size + padding)
+        else:
+            # Directories, links and pax global headers
+            if type_flag != b"g":
+                long_path = None
+            await skip(size + padding)
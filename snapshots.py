@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from config import SNAPSHOTS_MAX_REPOSITORIES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RepositorySnapshot:
+    """
+    State of a finished review of a repository.
+
+    Attributes:
+    commit_sha (Optional[str]): HEAD commit SHA at review time, `None` if it could not be resolved.
+    blob_shas (Dict[str, str]): Git blob SHA of every analysed file.
+    analyses (Dict[str, str]): Per-file analysis results.
+    result (str): The final summary returned by `perform_analysis`.
+    created (float): Creation timestamp.
+    """
+    commit_sha: Optional[str]
+    blob_shas: Dict[str, str]
+    analyses: Dict[str, str]
+    result: str
+    created: float = field(default_factory=time.time)
+
+
+class SnapshotStore:
+    """
+    In-memory LRU store of the latest `RepositorySnapshot` per repository and review parameters.
+
+    Args:
+    max_repositories (int): Max number of stored snapshots, least recently used are evicted first.
+    """
+
+    def __init__(self, max_repositories: int):
+        self.max_repositories = max_repositories
+        self._snapshots: OrderedDict[str, RepositorySnapshot] = OrderedDict()
+
+    def get(self, key: str) -> Optional[RepositorySnapshot]:
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            self._snapshots.move_to_end(key)
+        return snapshot
+
+    def set(self, key: str, snapshot: RepositorySnapshot) -> None:
+        self._snapshots[key] = snapshot
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self.max_repositories:
+            self._snapshots.popitem(last=False)
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+
+
+def snapshot_key(git_api_url: str, dev_level: str, description: str) -> str:
+    """
+    Builds the snapshot key. Analyses depend on the developer level and description, so both are part of it.
+    """
+    return hashlib.sha256(f"{git_api_url}\0{dev_level}\0{description}".encode("utf-8")).hexdigest()
+
+
+def git_blob_sha(content: str) -> str:
+    """
+    Computes the Git blob SHA-1 of a file content, the same value Git and the GitHub API use for blobs.
+    """
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def reusable_analysis(snapshot: Optional[RepositorySnapshot], path: str, content: str) -> Optional[str]:
+    """
+    Returns the stored analysis of a file if its blob SHA equals the stored one, otherwise `None`.
+    """
+    if snapshot is None or path not in snapshot.analyses:
+        return None
+    if snapshot.blob_shas.get(path) != git_blob_sha(content):
+        return None
+    return snapshot.analyses[path]
+
+
+def build_snapshot(commit_sha: Optional[str],
+                   files: Dict[str, Optional[str]],
+                   analyses: Dict[str, str],
+                   result: str
+                   ) -> RepositorySnapshot:
+    """
+    Builds a snapshot from a finished review. Failed analyses are not stored so that they are retried next time.
+    """
+    analyses = {
+        path: analysis for path, analysis in analyses.items()
+        if files.get(path) is not None and not analysis.startswith("Error:")
+    }
+    blob_shas = {path: git_blob_sha(files[path]) for path in analyses}
+    return RepositorySnapshot(commit_sha=commit_sha, blob_shas=blob_shas, analyses=analyses, result=result)
+
+
+snapshot_store = SnapshotStore(SNAPSHOTS_MAX_REPOSITORIES)
@@ -0,0 +1,359 @@
+import ast
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import STATIC_WORKERS, STATIC_SKELETON_MIN_BYTES, STATIC_HOTSPOT_COMPLEXITY, STATIC_MAX_HOTSPOTS
+from config import STATIC_LONG_FUNCTION_LINES, STATIC_DUPLICATE_MIN_LINES
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+# Nodes that add one branch to the cyclomatic complexity
+DECISIONS = (ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.Assert, ast.match_case)
+# Compound statements that add one level of nesting
+BLOCKS = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith,
+    ast.Try, getattr(ast, "TryStar", ast.Try), ast.Match,
+)
+# Max entries of one list in the metrics report
+REPORT_LIMIT = 5
+# Smaller batches are parsed in the calling process, faster than the round trip to a worker
+POOL_MIN_BYTES = 32 * 1024
+
+
+@dataclass
+class FunctionMetrics:
+    """
+    Metrics of one function or method.
+
+    Attributes:
+    name (str): Qualified name, e.g. "Class.method".
+    line (int): Line of the `def`.
+    lines (int): Length in lines, decorators excluded.
+    complexity (int): Cyclomatic complexity, nested functions excluded.
+    nesting (int): Max depth of nested compound statements.
+    typed (bool): All parameters (except self/cls) and the return value are annotated.
+    body_hash (Optional[str]): Hash of the body AST, set for bodies of at least `duplicate_min_lines`.
+    """
+    name: str
+    line: int
+    lines: int
+    complexity: int
+    nesting: int
+    typed: bool
+    body_hash: Optional[str] = None
+
+
+@dataclass
+class FileMetrics:
+    """
+    Static analysis result of one Python file.
+
+    Attributes:
+    name (str): The file name.
+    lines (int): Number of lines.
+    functions (List[FunctionMetrics]): Functions and methods in file order.
+    bare_excepts (List[int]): Lines of `except:` clauses.
+    error (Optional[str]): The syntax error if the file could not be parsed.
+    skeleton (Optional[str]): The compressed representation sent instead of the content of large files.
+    """
+    name: str
+    lines: int = 0
+    functions: List[FunctionMetrics] = field(default_factory=list)
+    bare_excepts: List[int] = field(default_factory=list)
+    error: Optional[str] = None
+    skeleton: Optional[str] = None
+
+    def hotspots(self, complexity: int = STATIC_HOTSPOT_COMPLEXITY, limit: int = STATIC_MAX_HOTSPOTS
+                 ) -> List[FunctionMetrics]:
+        """
+        Returns up to `limit` most complex functions of at least `complexity`.
+        """
+        candidates = [function for function in self.functions if function.complexity >= complexity]
+        return sorted(candidates, key=lambda function: (-function.complexity, function.line))[:limit]
+
+
+def analyze_source(name: str, content: str, skeleton_min_bytes: int = STATIC_SKELETON_MIN_BYTES) -> FileMetrics:
+    """
+    Parses a Python file and computes its metrics. Runs in a worker process of `StaticAnalyzer`.
+
+    Args:
+    name (str): The file name.
+    content (str): The file content.
+    skeleton_min_bytes (int): A skeleton is built for larger files, 0 - for every file.
+
+    Returns:
+    FileMetrics: The metrics, with `error` set instead if the file is not valid Python.
+    """
+    metrics = FileMetrics(name, lines=content.count("\n") + 1)
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError) as e:
+        metrics.error = f"line {getattr(e, 'lineno', None)}: {getattr(e, 'msg', e)}"
+        return metrics
+
+    _collect_functions(tree, "", False, metrics.functions)
+    metrics.bare_excepts = [
+        node.lineno for node in ast.walk(tree) if isinstance(node, ast.ExceptHandler) and node.type is None
+    ]
+    if len(content.encode("utf-8")) > skeleton_min_bytes:
+        skeleton = build_skeleton(name, content, tree, metrics)
+        if len(skeleton) < len(content):
+            metrics.skeleton = skeleton
+    return metrics
+
+
+def _collect_functions(parent: ast.AST, prefix: str, in_class: bool, functions: List[FunctionMetrics]) -> None:
+    for node in ast.iter_child_nodes(parent):
+        if isinstance(node, FUNCTIONS):
+            complexity, nesting = _complexity(node, 0)
+            function = FunctionMetrics(
+                name=f"{prefix}{node.name}",
+                line=node.lineno,
+                lines=node.end_lineno - node.lineno + 1,
+                complexity=complexity + 1,
+                nesting=nesting,
+                typed=_is_typed(node, in_class),
+            )
+            if function.lines >= STATIC_DUPLICATE_MIN_LINES:
+                body = ast.dump(ast.Module(body=node.body, type_ignores=[]))
+                function.body_hash = hashlib.sha1(body.encode("utf-8")).hexdigest()
+            functions.append(function)
+            _collect_functions(node, f"{prefix}{node.name}.", False, functions)
+        elif isinstance(node, ast.ClassDef):
+            _collect_functions(node, f"{prefix}{node.name}.", True, functions)
+        else:
+            _collect_functions(node, prefix, in_class and isinstance(node, ast.stmt), functions)
+
+
+def _complexity(node: ast.AST, depth: int) -> tuple:
+    """
+    Returns (decision points, max nesting depth) of a node without nested functions and classes.
+    """
+    complexity, nesting = 0, depth
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, FUNCTIONS + (ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(child, DECISIONS):
+            complexity += 1
+        elif isinstance(child, ast.comprehension):
+            complexity += 1 + len(child.ifs)
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+        # An elif stays on the level of its if
+        is_elif = isinstance(node, ast.If) and node.orelse == [child]
+        deeper = isinstance(child, BLOCKS) and not is_elif
+        child_complexity, child_nesting = _complexity(child, depth + deeper)
+        complexity += child_complexity
+        nesting = max(nesting, child_nesting)
+    return complexity, nesting
+
+
+def _is_typed(node: ast.FunctionDef | ast.AsyncFunctionDef, is_method: bool) -> bool:
+    args = node.args
+    parameters = args.posonlyargs + args.args + args.kwonlyargs
+    if is_method and parameters and not any(
+            isinstance(decorator, ast.Name) and decorator.id == "staticmethod" for decorator in node.decorator_list):
+        parameters = parameters[1:]
+    parameters += [arg for arg in (args.vararg, args.kwarg) if arg is not None]
+    if any(parameter.annotation is None for parameter in parameters):
+        return False
+    return node.returns is not None or node.name == "__init__"
+
+
+def build_skeleton(name: str, content: str, tree: ast.Module, metrics: FileMetrics) -> str:
+    """
+    Builds the "skeleton plus hotspots" representation of a Python file.
+
+    Imports, short module and class level statements, class headers, signatures and the first docstring
+    lines are kept, function bodies are replaced by "..." with their size and complexity, except the bodies
+    of hotspots (`FileMetrics.hotspots`), which are kept in full.
+    """
+    lines = content.splitlines()
+    functions = {function.line: function for function in metrics.functions}
+    hotspots = {function.line for function in metrics.hotspots()}
+    out = [
+        f"# Skeleton of {name}: {metrics.lines} lines, {len(metrics.functions)} functions. "
+        f"Function bodies are elided (...) except the hotspots, which are shown in full."
+    ]
+    _skeleton(tree.body, lines, functions, hotspots, out)
+    return "\n".join(out) + "\n"
+
+
+def _start(node: ast.stmt) -> int:
+    decorators = getattr(node, "decorator_list", None)
+    return decorators[0].lineno if decorators else node.lineno
+
+
+def _skeleton(nodes: List[ast.stmt], lines: List[str], functions: Dict[int, FunctionMetrics], hotspots: set,
+              out: List[str]) -> None:
+    for node in nodes:
+        start, end = _start(node), node.end_lineno
+        indent = lines[node.lineno - 1][:node.col_offset]
+        body = getattr(node, "body", None)
+        if not isinstance(body, list) or not body or body[0].lineno == node.lineno:
+            # Simple statements and one-liners, long ones (e.g. data literals) are shortened
+            if end - start < 3 or isinstance(node, (ast.Import, ast.ImportFrom)):
+                out.extend(lines[start - 1:end])
+            else:
+                out.append(f"{lines[start - 1].rstrip()}  ...  # {end - start + 1} lines")
+            continue
+
+        header = lines[start - 1:_start(body[0]) - 1]
+        body_indent = lines[body[0].lineno - 1][:body[0].col_offset]
+        docstring = ast.get_docstring(node) if isinstance(node, FUNCTIONS + (ast.ClassDef,)) else None
+        if isinstance(node, FUNCTIONS):
+            function = functions[node.lineno]
+            summary = f"{function.lines} lines, complexity {function.complexity}, nesting {function.nesting}"
+            if node.lineno in hotspots:
+                out.append(f"{indent}# Hotspot: {summary}")
+                out.extend(lines[start - 1:end])
+                continue
+            out.extend(header)
+            if docstring:
+                out.append(f'{body_indent}"""{docstring.splitlines()[0]}"""')
+            out.append(f"{body_indent}...  # {summary}")
+        elif isinstance(node, ast.ClassDef):
+            out.extend(header)
+            if docstring:
+                out.append(f'{body_indent}"""{docstring.splitlines()[0]}"""')
+            _skeleton(body[1:] if docstring else body, lines, functions, hotspots, out)
+        else:
+            # if/try/with/for blocks: the header and the definitions inside are kept
+            out.extend(header)
+            inner = [child for child in body if isinstance(child, FUNCTIONS + (ast.ClassDef,))]
+            if inner:
+                _skeleton(inner, lines, functions, hotspots, out)
+            else:
+                out.append(f"{body_indent}...  # {end - start + 1} lines")
+
+
+def apply_skeletons(files: Dict[str, str], metrics: Dict[str, FileMetrics]) -> Dict[str, str]:
+    """
+    Returns `files` with the content of large files replaced by their skeletons.
+    """
+    return {
+        name: metrics[name].skeleton if name in metrics and metrics[name].skeleton else content
+        for name, content in files.items()
+    }
+
+
+def metrics_report(metrics: Dict[str, FileMetrics]) -> str:
+    """
+    Formats the metrics of a project as a short text for the reduce stage.
+    """
+    functions = [(name, function) for name, file in metrics.items() for function in file.functions]
+    long_functions = sorted(
+        ((name, function) for name, function in functions if function.lines > STATIC_LONG_FUNCTION_LINES),
+        key=lambda item: -item[1].lines,
+    )
+    complex_functions = sorted(
+        ((name, function) for name, function in functions if function.complexity >= STATIC_HOTSPOT_COMPLEXITY),
+        key=lambda item: -item[1].complexity,
+    )
+    typed = sum(function.typed for _, function in functions)
+    bare_excepts = [f"{name}:{line}" for name, file in metrics.items() for line in file.bare_excepts]
+    groups: Dict[str, List[str]] = {}
+    for name, function in functions:
+        if function.body_hash is not None:
+            groups.setdefault(function.body_hash, []).append(f"{name}:{function.name}")
+    duplicates = [" = ".join(group) for group in groups.values() if len(group) > 1]
+    errors = [f"{name} ({file.error})" for name, file in metrics.items() if file.error]
+
+    def listed(items: List[str]) -> str:
+        more = f", ... {len(items) - REPORT_LIMIT} more" if len(items) > REPORT_LIMIT else ""
+        return f" ({', '.join(items[:REPORT_LIMIT])}{more})" if items else ""
+
+    report = [
+        f"Static analysis of {len(metrics)} Python files "
+        f"({sum(file.lines for file in metrics.values())} lines, exact local measurements):",
+        f"- functions: {len(functions)}, average length "
+        f"{sum(function.lines for _, function in functions) / max(len(functions), 1):.1f} lines, "
+        f"over {STATIC_LONG_FUNCTION_LINES} lines: {len(long_functions)}"
+        + listed([f"{name}:{function.name} {function.lines}" for name, function in long_functions]),
+        f"- cyclomatic complexity: average "
+        f"{sum(function.complexity for _, function in functions) / max(len(functions), 1):.1f}, "
+        f"{STATIC_HOTSPOT_COMPLEXITY} or more: {len(complex_functions)}"
+        + listed([f"{name}:{function.name} {function.complexity}" for name, function in complex_functions]),
+        f"- max nesting depth: {max((function.nesting for _, function in functions), default=0)}",
+        f"- functions with full type hints: {typed} of {len(functions)}",
+        f"- bare except clauses: {len(bare_excepts)}" + listed(bare_excepts),
+        f"- duplicated function bodies: {len(duplicates)}" + listed(duplicates),
+    ]
+    if errors:
+        report.append(f"- files with syntax errors: {len(errors)}" + listed(errors))
+    return "\n".join(report)
+
+
+class StaticAnalyzer:
+    """
+    Runs `analyze_source` for Python files in a process pool, so parsing large repositories does not block
+    the event loop.
+
+    Args:
+    workers (int): Worker processes, 0 - the number of CPUs. The pool is started on first use.
+
+    Notes:
+    - Batches under `POOL_MIN_BYTES` are analyzed in the calling process.
+    - If the pool breaks (e.g. a worker is killed), the files are analyzed in the calling process and a new
+      pool is started on the next call.
+    """
+
+    def __init__(self, workers: int = STATIC_WORKERS):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def analyze(self, files: Dict[str, str]) -> Dict[str, FileMetrics]:
+        """
+        Returns the metrics of the `.py` files among `files`, other files are left out.
+        """
+        sources = {name: content for name, content in files.items() if name.endswith(".py")}
+        if not sources:
+            return {}
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        results = None
+        if sum(len(content) for content in sources.values()) >= POOL_MIN_BYTES:
+            try:
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(self.pool, analyze_source, name, content)
+                    for name, content in sources.items()
+                ))
+            except BrokenProcessPool as e:
+                logger.error(f"Static analysis pool failed, analyzing in process: {e}")
+                self.close()
+        if results is None:
+            results = [analyze_source(name, content) for name, content in sources.items()]
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="static")
+
+        metrics = dict(zip(sources, results))
+        skeletons = {name: file.skeleton for name, file in metrics.items() if file.skeleton}
+        if skeletons:
+            logger.info(
+                f"Static analysis: {len(metrics)} files, {len(skeletons)} sent as skeletons "
+                f"({sum(len(sources[name]) for name in skeletons)} -> "
+                f"{sum(len(skeleton) for skeleton in skeletons.values())} characters)"
+            )
+        return metrics
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+static_analyzer = StaticAnalyzer()
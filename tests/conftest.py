@@ -0,0 +1,9 @@
+from unittest.mock import Mock
+
+
+class MockOpenAIResponse:
+    """Mock response for OpenAI API."""
+    def __init__(self, content: str):
+        self.choices = [
+            Mock(message=Mock(role="assistant", content=content))
+        ]
@@ -1,24 +1,17 @@
 import pytest
 import json
 
-from unittest.mock import patch, AsyncMock, Mock
+from unittest.mock import patch, AsyncMock
 from openai._exceptions import OpenAIError
 
-from api_requests import analyze_structure
+from api_requests import analyze_structure, analyze_summary, analyze_file_content
 from config import GPT_MODEL, MAX_TOKENS, TEMPERATURE
 from config import PROMPT_SYS, PROMPT_USER_STRUCTURE, PROMPT_USER_FILE_ANALYZE
 from config import PROMPT_USER_SUMMARY_TASK, PROMPT_USER_SUMMARY_SOLUTIONS
 from config import PROMPT_USER_SUMMARY_SKILLS, PROMPT_USER_SUMMARY_RATING
 from config import PROMPT_USER_REDUCE_TASK, PROMPT_USER_REDUCE_SOLUTIONS
 from config import PROMPT_USER_REDUCE_SKILLS, PROMPT_USER_REDUCE_RATING
-
-
-class MockOpenAIResponse:
-    """Mock response for OpenAI API."""
-    def __init__(self, content: str):
-        self.choices = [
-            Mock(message=Mock(role="assistant", content=content))
-        ]
+from tests.conftest import MockOpenAIResponse
 
 
 @pytest.mark.asyncio
@@ -85,4 +78,29 @@ async def test_analyze_structure_unexpected_exception(mock_create):
 
     # Assert
     assert "Error: Unexpected failure in analyze_structure" in response
-    assert "Unexpected test error" in response
\ No newline at end of file
+    assert "Unexpected test error" in response
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_requests_use_their_stage_settings(mock_create):
+    mock_create.return_value = MockOpenAIResponse("Analysis")
+    settings = {
+        "map": {"model": "gpt-4o-mini", "max_tokens": 200, "temperature": 0.2},
+        "summary": {"model": "gpt-4-turbo", "max_tokens": 800, "temperature": 0.5},
+    }
+
+    with patch.dict("api_requests.STAGE_SETTINGS", settings):
+        await analyze_file_content("a.py", "x = 1", "junior", "task")
+        await analyze_file_content("a.py", "x = 1", "junior", "task", model="gpt-4-turbo")
+        await analyze_summary(["Analysis"], "Structure", "junior", "task")
+
+    options = [
+        {key: call.kwargs[key] for key in ("model", "max_tokens", "temperature")}
+        for call in mock_create.await_args_list
+    ]
+    assert options == [
+        settings["map"],
+        {**settings["map"], "model": "gpt-4-turbo"},
+        settings["summary"],
+    ]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from batch import BatchLimiter, run_batch, run_batch_file
+from main import app
+from schemas import ReviewRequest
+
+
+FINAL = [{"Solutions": "Mocked solution", "Skills": "Mocked skills", "Rating": 4}]
+
+
+def fake_review(calls: list, delay: float = 0.0):
+    async def run_review(request: ReviewRequest):
+        calls.append(request)
+        await asyncio.sleep(delay)
+        if "missing" in request.git_url:
+            raise HTTPException(status_code=404, detail="Repository, branch or valid files not found.")
+        return FINAL
+    return run_review
+
+
+def test_batch_endpoint_streams_ndjson():
+    calls = []
+    body = {
+        "description": "Assignment",
+        "dev_level": "middle",
+        "reviews": [
+            {"git_url": "https://github.com/a/repo", "id": "a"},
+            {"git_url": "https://github.com/b/missing", "id": "b"},
+            {"git_url": "https://github.com/c/repo", "id": "c", "description": "Own", "dev_level": "strong"},
+        ],
+    }
+
+    with patch("batch.run_review", fake_review(calls)):
+        with TestClient(app) as client:
+            response = client.post("/review/batch", json=body)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = {item["id"]: item for item in map(json.loads, response.text.splitlines())}
+    assert items["a"]["status"] == "done" and items["a"]["result"] == FINAL
+    assert items["b"]["status"] == "failed" and items["b"]["error"]["status_code"] == 404
+    assert [(request.description, request.dev_level) for request in sorted(calls, key=lambda r: r.git_url)] == [
+        ("Assignment", "middle"), ("Assignment", "middle"), ("Own", "strong")
+    ]
+
+
+def test_batch_endpoint_rejects_empty_batch():
+    with TestClient(app) as client:
+        response = client.post("/review/batch", json={"reviews": []})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_batches_share_the_concurrency_budget_and_take_turns():
+    calls = []
+    active, peak = 0, 0
+
+    async def run_review(request: ReviewRequest):
+        nonlocal active, peak
+        calls.append(request.git_url)
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return FINAL
+
+    async def consume(prefix: str) -> list:
+        requests = [ReviewRequest(description="", git_url=f"https://github.com/{prefix}/{i}") for i in range(4)]
+        return [item async for item in run_batch(requests)]
+
+    with patch("batch.run_review", run_review), patch("batch.batch_limiter", BatchLimiter(2)):
+        first, second = await asyncio.gather(consume("a"), consume("b"))
+
+    assert len(first) == len(second) == 4
+    assert peak == 2
+    # The second batch does not wait until the first one is finished
+    assert any("/b/" in url for url in calls[:4])
+
+
+@pytest.mark.asyncio
+async def test_closing_the_batch_cancels_running_reviews():
+    limiter = BatchLimiter(2)
+    requests = [ReviewRequest(description="", git_url=f"https://github.com/a/{i}") for i in range(4)]
+
+    with patch("batch.run_review", fake_review([], delay=10)), patch("batch.batch_limiter", limiter):
+        results = run_batch(requests)
+        waiting = asyncio.ensure_future(results.__anext__())
+        await asyncio.sleep(0.01)
+        assert limiter.in_flight == 2
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await results.aclose()
+        await asyncio.sleep(0)
+
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_run_batch_file(tmp_path):
+    source = tmp_path / "cohort.jsonl"
+    source.write_text(
+        '{"git_url": "https://github.com/a/repo", "id": "a"}\n'
+        "\n"
+        '{"id": "no url"}\n'
+        '{"git_url": "https://github.com/b/missing"}\n'
+    )
+    output = tmp_path / "results.jsonl"
+    calls = []
+
+    with patch("batch.run_review", fake_review(calls)):
+        counts = await run_batch_file(source, output, description="Assignment")
+
+    assert counts == {"done": 1, "failed": 2}
+    results = {item["line"]: item for item in map(json.loads, output.read_text().splitlines())}
+    assert results[1]["status"] == "done" and results[1]["id"] == "a"
+    assert results[3]["error"]["status_code"] == 422
+    assert results[4]["error"]["status_code"] == 404
+    assert {request.description for request in calls} == {"Assignment"}
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks import fake_github, fake_openai
+from benchmarks.microbench import compare, measure, fetch_case, reduce_case
+from benchmarks.common import Latency, parse_latency, percentile, synthetic_repository, synthetic_directories
+
+
+def test_parse_latency():
+    assert parse_latency("50") == Latency("fixed", 50)
+    assert parse_latency("uniform:20:200") == Latency("uniform", 20, 200)
+    assert 0.01 <= parse_latency("uniform:10:20").sample() <= 0.02
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1:2")
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == pytest.approx(50.5)
+    assert percentile(values, 99) == pytest.approx(99.01)
+    assert percentile([], 95) == 0.0
+
+
+def test_synthetic_repository_shape():
+    assert synthetic_directories(4, depth=2) == ["d0", "d0/d1", "d2", "d2/d3"]
+
+    repository = synthetic_repository("user/repo", files=20, dirs=4, depth=2, file_size=500)
+
+    assert len(repository) == 20
+    assert {path.rsplit("/", 1)[0] for path in repository if "/" in path} == {"d0", "d0/d1", "d2", "d2/d3"}
+    assert repository != synthetic_repository("user/other", files=20, dirs=4, depth=2, file_size=500)
+
+
+def test_fake_github_serves_contents_tree():
+    client = TestClient(fake_github.create_app(files=6, dirs=2))
+
+    root = client.get("/repos/user/repo/contents").json()
+    directory = next(item for item in root if item["type"] == "dir")
+    file = next(item for item in root if item["type"] == "file")
+
+    assert client.get(directory["_links"]["self"]).status_code == 200
+    assert client.get(file["download_url"]).text
+    assert client.get("/stats").json() == {"requests": 3, "contents": 2, "raw": 1}
+
+
+def test_fake_openai_answers_by_prompt_kind():
+    client = TestClient(fake_openai.create_app())
+
+    def complete(prompt: str) -> str:
+        response = client.post("/v1/chat/completions", json={
+            "model": "fake", "messages": [{"role": "system", "content": "sys"}, {"role": "user", "content": prompt}]
+        })
+        return response.json()["choices"][0]["message"]["content"]
+
+    assert json.loads(complete("File name: a.py\nx\nFile name: b.py\ny\nAnalyze")) == {
+        "a.py": "Fake analysis of a.py.", "b.py": "Fake analysis of b.py."
+    }
+    assert set(json.loads(complete("Make summary review"))) == {"Solutions", "Skills", "Rating"}
+    assert set(json.loads(complete("Project structure:a.py\nFile name: a.py\nx\nReview"))) == {
+        "Solutions", "Skills", "Rating"
+    }
+    assert client.get("/stats").json()["pack"] == 1
+
+
+def test_fake_openai_injects_rate_limits():
+    client = TestClient(fake_openai.create_app(rate_limit_ratio=1.0))
+
+    response = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "x"}]})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after-ms"] == "500"
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
+
+
+def test_microbench_compare_reports_regressions_over_threshold():
+    baseline = {"case": {"calls": 10, "wall_s": 1.0, "peak_kb": 1000}}
+
+    assert compare({"case": {"calls": 10, "wall_s": 1.1, "peak_kb": 1100}}, baseline, 0.2) == []
+    assert compare({"case": {"calls": 11, "wall_s": 1.5, "peak_kb": 1000}}, baseline, 0.2) == [
+        "case: wall_s 1.0 -> 1.5 (+50%)"
+    ]
+    assert compare({"case": {"calls": 13, "wall_s": 1.0, "peak_kb": 1000}}, baseline, 0.2) == [
+        "case: calls 10 -> 13 (+30%)"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_microbench_cases_count_upstream_calls():
+    fetch = await measure(fetch_case(files=7, dirs=2, depth=1, latency=0), repeat=1)
+    reduce = await measure(reduce_case(results=10, budget=100, result_size=100, latency=0), repeat=1)
+
+    # Root + 2 directory listings + 6 files (the ignored .txt file is never downloaded)
+    assert fetch["calls"] == 9
+    assert reduce["calls"] > 1 and reduce["wall_s"] > 0 and reduce["peak_kb"] > 0
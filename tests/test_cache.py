@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+from unittest.mock import patch, AsyncMock
+
+from cache import AnalysisCache, file_analysis_key, file_analysis_keys, analysis_cache
+from services import perform_analysis
+from tests.conftest import MockOpenAIResponse
+
+
+def test_memory_tier_lru_eviction():
+    cache = AnalysisCache(max_entries=2, ttl=0)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "a" becomes most recently used
+
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["memory_hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_expiry():
+    cache = AnalysisCache(max_entries=10, ttl=60)
+    with patch("cache.time.time", return_value=1000.0):
+        cache.set("a", "1")
+    with patch("cache.time.time", return_value=1059.0):
+        assert cache.get("a") == "1"
+    with patch("cache.time.time", return_value=1061.0):
+        assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(max_entries=10, ttl=0, sqlite_path=path, max_disk_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.set("c", "3")
+
+    restarted = AnalysisCache(max_entries=10, ttl=0, sqlite_path=path, max_disk_entries=2)
+
+    assert restarted.get("c") == "3"
+    assert restarted.get("a") is None  # evicted by max_disk_entries
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get("c") == "3"
+    assert restarted.stats()["memory_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_disk_writes_are_batched_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(max_entries=10, ttl=0, sqlite_path=path, max_disk_entries=2)
+    threads = []
+    write_rows = cache._writer._write
+
+    def record(db, rows):
+        threads.append((threading.get_ident(), len(rows)))
+        write_rows(db, rows)
+
+    cache._writer._write = record
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert cache.get("c") == "C"  # served from memory before the write
+    await cache.flush()
+
+    # One batch with one eviction pass, written in a worker thread
+    assert len(threads) == 1 and threads[0][1] == 3
+    assert threads[0][0] != threading.get_ident()
+    restarted = AnalysisCache(max_entries=10, ttl=0, sqlite_path=path, max_disk_entries=2)
+    assert restarted.get("c") == "C"
+    assert restarted.get("a") is None
+
+
+def test_file_analysis_key_depends_on_review_parameters():
+    key = file_analysis_key("main.py", "print(1)", "junior", "task")
+
+    assert key == file_analysis_key("main.py", "print(1)", "junior", "task")
+    assert key != file_analysis_key("main.py", "print(2)", "junior", "task")
+    assert key != file_analysis_key("main.py", "print(1)", "middle", "task")
+    assert key != file_analysis_key("main.py", "print(1)", "junior", "other task")
+
+
+def test_file_analysis_key_depends_on_the_map_request_prompt():
+    single = file_analysis_key("main.py", "print(1)", "junior", "task")
+    pack = file_analysis_key("main.py", "print(1)", "junior", "task", "pack")
+
+    assert single != pack
+    with patch.dict("cache.MAP_PROMPTS", {"pack": "A changed pack prompt"}):
+        assert file_analysis_key("main.py", "print(1)", "junior", "task", "pack") != pack
+        assert file_analysis_key("main.py", "print(1)", "junior", "task") == single
+    assert file_analysis_keys("main.py", "print(1)", "junior", "task")[:2] == [single, pack]
+
+
+def test_get_any_counts_one_lookup():
+    cache = AnalysisCache(max_entries=10, ttl=0)
+    cache.set("b", "2")
+
+    assert cache.get_any(["a", "b"]) == "2"
+    assert cache.get_any(["a", "c"]) is None
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_hits_cache(mock_create):
+    analysis_cache.clear()
+    mock_create.return_value = MockOpenAIResponse("Good code")
+
+    with patch("services.FAST_PATH_ENABLED", False):
+        first, second = {}, {}
+        await perform_analysis({"main.py": "print(1)"}, "junior", "task", first)
+        await perform_analysis({"main.py": "print(1)"}, "junior", "task", second)
+
+    assert first == second == {"main.py": "Good code"}
+    prompts = [call.kwargs["messages"][1]["content"] for call in mock_create.await_args_list]
+    assert sum(prompt.startswith("File name: main.py") for prompt in prompts) == 1
+    analysis_cache.clear()
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_skips_caching_errors(mock_create):
+    analysis_cache.clear()
+
+    async def create(**kwargs):
+        if kwargs["messages"][1]["content"].startswith("File name:"):
+            raise Exception("Unexpected test error")
+        return MockOpenAIResponse("Summary")
+
+    mock_create.side_effect = create
+    with patch("services.FAST_PATH_ENABLED", False):
+        analyses = {}
+        await perform_analysis({"main.py": "print(1)"}, "junior", "task", analyses)
+        await perform_analysis({"main.py": "print(1)"}, "junior", "task")
+
+    assert analyses["main.py"].startswith("Error:")
+    prompts = [call.kwargs["messages"][1]["content"] for call in mock_create.await_args_list]
+    assert sum(prompt.startswith("File name: main.py") for prompt in prompts) == 2
+    analysis_cache.clear()
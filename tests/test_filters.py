@@ -0,0 +1,159 @@
+import pytest
+from httpx import AsyncClient
+
+from filters import FileFilter, GlobPattern, parse_gitattributes, BINARY, DUPLICATE, MINIFIED, TOO_LARGE
+from services import get_all_files, get_all_files_archive, FileStream
+from tests.test_services import make_tarball
+
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    ("node_modules/", "node_modules/lib/index.js", True),
+    ("node_modules/", "web/node_modules/lib/index.js", True),
+    ("node_modules/", "node_modules.py", False),
+    ("*.min.js", "static/app.min.js", True),
+    ("*.min.js", "static/app.js", False),
+    ("docs/*.py", "docs/conf.py", True),
+    ("docs/*.py", "src/docs/conf.py", False),
+    ("src/**/gen/", "src/a/b/gen/x.py", True),
+    ("*_pb2.py", "api/service_pb2.py", True),
+])
+def test_glob_pattern(pattern, path, expected):
+    assert GlobPattern(pattern).match(path) is expected
+
+
+def test_parse_gitattributes():
+    rules = parse_gitattributes(
+        "# comment\n"
+        "*.py text eol=lf\n"
+        "gen/** linguist-generated\n"
+        "third/ linguist-vendored=true\n"
+        "gen/keep.py -linguist-generated\n"
+    )
+
+    assert [(pattern.pattern, attributes) for pattern, attributes in rules] == [
+        ("gen/**", {"linguist-generated": True}),
+        ("third/", {"linguist-vendored": True}),
+        ("gen/keep.py", {"linguist-generated": False}),
+    ]
+    file_filter = FileFilter(deny=[], gitattributes="gen/** linguist-generated\ngen/keep.py -linguist-generated\n")
+    assert file_filter.skip_path("gen/api.py") == "generated"
+    assert file_filter.skip_path("gen/keep.py") is None
+    assert file_filter.skip_directory("gen") == "generated"
+
+
+def test_skip_content():
+    file_filter = FileFilter(deny=[], max_file_bytes=1000, max_line_length=100)
+
+    assert file_filter.skip_content("a.py", b"x = 1\n") is None
+    assert file_filter.skip_content("copy/a.py", b"x = 1\n") == DUPLICATE
+    assert file_filter.skip_content("big.py", b"x = 1\n" * 200) == TOO_LARGE
+    assert file_filter.skip_content("image.py", b"\x89PNG\x00\x00") == BINARY
+    assert file_filter.skip_content("bundle.js", b"var a=1;" * 100) == MINIFIED
+    assert file_filter.skip_path("huge.py", size=5000) == TOO_LARGE
+    assert file_filter.duplicates == {"copy/a.py": "a.py"}
+    assert file_filter.stats() == {DUPLICATE: 1, TOO_LARGE: 2, BINARY: 1, MINIFIED: 1}
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_filters_listing_and_content(httpx_mock):
+    root_url = "https://api.github.com/repos/user/repo/contents"
+    httpx_mock.add_response(
+        url=root_url,
+        json=[
+            {"type": "file", "path": ".gitattributes", "download_url": "https://mock.gitattributes"},
+            {"type": "file", "path": "main.py", "download_url": "https://mock.main.py"},
+            {"type": "file", "path": "copy.py", "download_url": "https://mock.copy.py"},
+            {"type": "file", "path": "blob.py", "download_url": "https://mock.blob.py"},
+            {"type": "file", "path": "huge.py", "size": 10 ** 6, "download_url": "https://mock.huge.py"},
+            {"type": "file", "path": "schema.py", "download_url": "https://mock.schema.py"},
+            {"type": "dir", "path": "node_modules", "_links": {"self": "https://mock.node_modules"}},
+        ],
+    )
+    httpx_mock.add_response(url="https://mock.gitattributes", text="schema.py linguist-generated\n")
+    httpx_mock.add_response(url="https://mock.main.py", text="print('hello world')")
+    httpx_mock.add_response(url="https://mock.copy.py", text="print('hello world')")
+    httpx_mock.add_response(url="https://mock.blob.py", content=b"\x00\x01\x02")
+    stream = FileStream()
+
+    async with AsyncClient() as client:
+        result = await get_all_files(root_url, client, stream=stream)
+
+    assert result == {
+        ".gitattributes": None,
+        "main.py": "print('hello world')",
+        "copy.py": None,
+        "blob.py": None,
+        "huge.py": None,
+    }
+    requested = {str(request.url) for request in httpx_mock.get_requests()}
+    assert not requested & {"https://mock.node_modules", "https://mock.huge.py", "https://mock.schema.py"}
+    # The oversized file is listed, but not selected for the analysis
+    assert "huge.py" not in stream.selected
+
+
+def test_resolve_duplicates_keeps_the_smallest_path():
+    file_filter = FileFilter(deny=[])
+    file_filter.add_blobs({"z.py": "sha1", "b/util.py": "sha2"})
+    file_filter.add_blobs({"a/z.py": "sha1", "m.py": "sha1"})
+
+    file_filter.resolve_duplicates()
+
+    assert file_filter.resolved.is_set()
+    assert file_filter.duplicates == {"m.py": "a/z.py", "z.py": "a/z.py"}
+    assert file_filter.stats() == {DUPLICATE: 2}
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_keeps_the_smallest_path_of_copies(httpx_mock):
+    root_url = "https://api.github.com/repos/user/repo/contents"
+    httpx_mock.add_response(
+        url=root_url,
+        json=[
+            {"type": "file", "path": "z.py", "sha": "sha1", "download_url": "https://mock.z.py"},
+            {"type": "dir", "path": "a", "_links": {"self": "https://mock.a"}},
+        ],
+    )
+    httpx_mock.add_response(
+        url="https://mock.a",
+        json=[{"type": "file", "path": "a/z.py", "sha": "sha1", "download_url": "https://mock.a.z.py"}],
+    )
+    # The copy listed first is downloaded before the whole tree is listed, or not at all
+    httpx_mock.add_response(url="https://mock.z.py", text="print(1)", is_optional=True)
+    httpx_mock.add_response(url="https://mock.a.z.py", text="print(1)")
+    stream = FileStream()
+    file_filter = FileFilter(deny=[])
+
+    async with AsyncClient() as client:
+        result = await get_all_files(root_url, client, stream=stream, file_filter=file_filter)
+
+    assert result == {"z.py": None, "a/z.py": "print(1)"}
+    assert file_filter.duplicates == {"z.py": "a/z.py"}
+    assert stream.selected == ["a/z.py"]
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_archive_filters(httpx_mock):
+    repo_url = "https://api.github.com/repos/user/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/git/trees/HEAD?recursive=1",
+        json={"sha": "abc", "truncated": False, "tree": [
+            {"path": ".gitattributes", "type": "blob", "size": 30},
+            {"path": "main.py", "type": "blob", "size": 20},
+            {"path": "lib/vendored.py", "type": "blob", "size": 20},
+            {"path": "venv/site.py", "type": "blob", "size": 20},
+        ]},
+    )
+    httpx_mock.add_response(url=f"{repo_url}/contents/.gitattributes", text="lib/** linguist-vendored\n")
+    httpx_mock.add_response(
+        url=f"{repo_url}/tarball/HEAD",
+        content=make_tarball({
+            "main.py": b"print('hello world')",
+            "lib/vendored.py": b"x = 1",
+            "venv/site.py": b"x = 2",
+        }),
+    )
+
+    async with AsyncClient() as client:
+        result = await get_all_files_archive(f"{repo_url}/contents", client)
+
+    assert result == {".gitattributes": None, "main.py": "print('hello world')"}
@@ -0,0 +1,115 @@
+import gzip
+
+import pytest
+import httpx
+
+from http_cache import HttpCache, CachedResponse, CachingTransport
+
+
+def make_client(cache: HttpCache, max_entry_bytes: int = 1024) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=CachingTransport(httpx.AsyncHTTPTransport(), cache, max_entry_bytes))
+
+
+@pytest.mark.asyncio
+async def test_conditional_request_served_from_cache(httpx_mock):
+    url = "https://api.github.com/repos/user/repo/contents"
+    cache = HttpCache(max_bytes=10000)
+    body = gzip.compress(b'[{"type": "file"}]')
+    httpx_mock.add_response(
+        url=url, content=body, headers={"ETag": '"v1"', "Content-Encoding": "gzip"}, match_headers={}
+    )
+    httpx_mock.add_response(url=url, status_code=304, match_headers={"If-None-Match": '"v1"'})
+
+    async with make_client(cache) as client:
+        first = await client.get(url)
+        second = await client.get(url)
+
+    assert first.json() == second.json() == [{"type": "file"}]
+    assert second.status_code == 200
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["stored"] == 1
+
+
+@pytest.mark.asyncio
+async def test_last_modified_replayed(httpx_mock):
+    url = "https://mock.file1.py"
+    cache = HttpCache(max_bytes=10000)
+    modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    httpx_mock.add_response(url=url, text="print(1)", headers={"Last-Modified": modified})
+    httpx_mock.add_response(url=url, status_code=304, match_headers={"If-Modified-Since": modified})
+
+    async with make_client(cache) as client:
+        await client.get(url)
+        response = await client.get(url)
+
+    assert response.text == "print(1)"
+
+
+@pytest.mark.asyncio
+async def test_large_and_unvalidated_responses_not_cached(httpx_mock):
+    cache = HttpCache(max_bytes=10000)
+    httpx_mock.add_response(url="https://mock.large", content=b"x" * 2000, headers={"ETag": '"big"'})
+    httpx_mock.add_response(url="https://mock.plain", text="no validators")
+
+    async with make_client(cache, max_entry_bytes=1024) as client:
+        large = await client.get("https://mock.large")
+        plain = await client.get("https://mock.plain")
+
+    assert large.content == b"x" * 2000
+    assert plain.text == "no validators"
+    assert cache.stats()["stored"] == 0
+
+
+def test_memory_bound_evicts_least_recently_used():
+    cache = HttpCache(max_bytes=10)
+    cache.set("a", CachedResponse(200, [], b"12345", '"a"', None))
+    cache.set("b", CachedResponse(200, [], b"12345", '"b"', None))
+    cache.get("a")
+    cache.set("c", CachedResponse(200, [], b"12345", '"c"', None))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["memory_bytes"] == 10
+
+
+def test_disk_tier_bounded_by_bytes(tmp_path):
+    path = str(tmp_path / "http_cache.sqlite3")
+    cache = HttpCache(max_bytes=100, sqlite_path=path, max_disk_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.set(key, CachedResponse(200, [("etag", key)], b"12345", key, None))
+
+    restarted = HttpCache(max_bytes=100, sqlite_path=path, max_disk_bytes=10)
+
+    assert restarted.get("a") is None
+    assert restarted.get("c").headers == [("etag", "c")]
+
+
+@pytest.mark.asyncio
+async def test_disk_writes_wait_for_flush_on_the_event_loop(tmp_path):
+    path = str(tmp_path / "http_cache.sqlite3")
+    cache = HttpCache(max_bytes=100, sqlite_path=path, max_disk_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.set(key, CachedResponse(200, [("etag", key)], b"12345", key, None))
+
+    # Queued for the worker thread, nothing is written before the loop runs it
+    assert HttpCache(max_bytes=100, sqlite_path=path).get("c") is None
+    await cache.flush()
+
+    restarted = HttpCache(max_bytes=100, sqlite_path=path, max_disk_bytes=10)
+    assert restarted.get("a") is None
+    assert restarted.get("c").headers == [("etag", "c")]
+
+
+@pytest.mark.asyncio
+async def test_malformed_content_length_not_cached():
+    cache = HttpCache(max_bytes=10000)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"ETag": '"v1"', "Content-Length": "abc"}, content=b"body")
+
+    transport = CachingTransport(httpx.MockTransport(handler), cache, max_entry_bytes=1024)
+    async with httpx.AsyncClient(transport=transport) as client:
+        response = await client.get("https://mock.file1.py")
+
+    assert response.content == b"body"
+    assert cache.stats()["stored"] == 0
@@ -0,0 +1,71 @@
+import pytest
+import httpx
+from fastapi.testclient import TestClient
+
+import http_client
+from config import HTTP_MAX_CONNECTIONS, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from http_client import create_http_client, start_http_client, close_http_client, get_http_client, get_pool_stats
+from http_client import PoolStatsTransport
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_create_http_client_uses_config():
+    client = create_http_client()
+
+    assert client.timeout.connect == HTTP_CONNECT_TIMEOUT
+    assert client.timeout.read == HTTP_READ_TIMEOUT
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_shared_client_lifecycle(httpx_mock):
+    httpx_mock.add_response(url="https://mock.file1.py", text="print('hello')")
+
+    client = await start_http_client()
+    assert get_http_client() is client
+    await client.get("https://mock.file1.py")
+
+    stats = get_pool_stats()
+    assert stats["running"] is True
+    assert stats["max_connections"] == HTTP_MAX_CONNECTIONS
+    assert stats["requests_total"] == 1
+    assert stats["requests_in_flight"] == 0
+
+    await close_http_client()
+    assert client.is_closed
+    assert http_client._client is None
+    assert get_pool_stats()["running"] is False
+
+
+def test_lifespan_starts_and_closes_client():
+    with TestClient(app) as test_client:
+        shared_client = http_client._client
+        response = test_client.get("/stats/http_pool")
+
+        assert response.status_code == 200
+        assert response.json()["running"] is True
+        assert response.json()["requests_in_flight"] == 0
+
+    assert shared_client.is_closed
+    assert isinstance(shared_client, httpx.AsyncClient)
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_transport_counts_requests_and_connections():
+    async def handler(request):
+        # Stand-in for the connection pool, which reports new connections through the trace extension
+        if request.url.path == "/new":
+            await request.extensions["trace"]("connection.connect_tcp.complete", {})
+        return httpx.Response(200, content=b"body", extensions={"http_version": b"HTTP/2"})
+
+    transport = PoolStatsTransport(httpx.MockTransport(handler))
+    async with httpx.AsyncClient(transport=transport) as client:
+        async with client.stream("GET", "https://mock.host/new") as response:
+            assert transport.stats()["requests_in_flight"] == 1
+            assert await response.aread() == b"body"
+        await client.get("https://mock.host/reused")
+
+    assert transport.stats() == {
+        "requests_in_flight": 0, "requests_total": 2, "connections_opened": 1, "http2_requests": 2
+    }
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from jobs import JobManager, JobQueueFull, JOB_DONE, JOB_FAILED, JOB_CANCELLED
+from main import app
+from schemas import ReviewRequest
+
+
+RESULT = [{"Solutions": "Mocked solution", "Skills": "Mocked skills", "Rating": 4}]
+REQUEST = ReviewRequest(description="task", git_url="https://github.com/user/repo")
+
+
+async def wait_for_status(manager: JobManager, job_id: str, statuses: set) -> None:
+    for _ in range(200):
+        if manager.get(job_id).status in statuses:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is still {manager.get(job_id).status}")
+
+
+@pytest.mark.asyncio
+async def test_job_runs_review_and_tracks_progress():
+    async def fake_review(request, on_event):
+        await on_event("files", {"files": ["a.py", "b.py"], "analyzed": ["a.py", "b.py"]})
+        await on_event("structure", {"result": "structure"})
+        await on_event("file", {"name": "a.py"})
+        await on_event("file", {"name": "b.py"})
+        return RESULT
+
+    manager = JobManager(workers=2, queue_size=10, retention=60)
+    await manager.start()
+    try:
+        with patch("jobs.run_review", side_effect=fake_review):
+            job = manager.submit(REQUEST)
+            await wait_for_status(manager, job.id, {JOB_DONE})
+    finally:
+        await manager.stop()
+
+    assert job.result == RESULT
+    assert job.progress == {"stage": JOB_DONE, "files_total": 2, "files_done": 2}
+    assert job.started is not None and job.finished >= job.started
+
+
+@pytest.mark.asyncio
+async def test_job_failure_keeps_http_error():
+    manager = JobManager(workers=1, queue_size=10, retention=60)
+    await manager.start()
+    try:
+        error = HTTPException(status_code=404, detail="Incorrect repository url")
+        with patch("jobs.run_review", new_callable=AsyncMock, side_effect=error):
+            job = manager.submit(REQUEST)
+            await wait_for_status(manager, job.id, {JOB_FAILED})
+    finally:
+        await manager.stop()
+
+    assert job.error == {"status_code": 404, "detail": "Incorrect repository url"}
+    assert job.result is None
+
+
+@pytest.mark.asyncio
+async def test_queue_full_and_cancellation():
+    started = asyncio.Event()
+
+    async def blocking_review(request, on_event):
+        started.set()
+        await asyncio.sleep(60)
+
+    manager = JobManager(workers=1, queue_size=1, retention=60)
+    await manager.start()
+    try:
+        with patch("jobs.run_review", side_effect=blocking_review):
+            running = manager.submit(REQUEST)
+            await started.wait()
+            queued = manager.submit(REQUEST)
+            with pytest.raises(JobQueueFull):
+                manager.submit(REQUEST)
+
+            assert manager.cancel(queued.id).status == JOB_CANCELLED
+            manager.cancel(running.id)
+            await asyncio.sleep(0.01)
+            assert running.status == JOB_CANCELLED
+            assert manager.stats()["cancelled"] == 2
+            # The worker is free again and skips the cancelled queued job
+            assert manager.submit(REQUEST).status == "queued"
+    finally:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_expire():
+    manager = JobManager(workers=1, queue_size=10, retention=60)
+    await manager.start()
+    try:
+        with patch("jobs.run_review", new_callable=AsyncMock, return_value=RESULT):
+            job = manager.submit(REQUEST)
+            await wait_for_status(manager, job.id, {JOB_DONE})
+    finally:
+        await manager.stop()
+
+    job.finished = time.time() - 61
+    assert manager.get(job.id) is None
+
+
+@patch("jobs.run_review", new_callable=AsyncMock, return_value=RESULT)
+def test_reviews_endpoints(mock_review):
+    with TestClient(app) as client:
+        response = client.post("/reviews", json={"description": "task", "git_url": "https://github.com/user/repo"})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        for _ in range(200):
+            job = client.get(f"/reviews/{job_id}").json()
+            if job["status"] == JOB_DONE:
+                break
+            time.sleep(0.01)
+
+        assert job["result"] == RESULT
+        assert client.get("/reviews/unknown").status_code == 404
+        assert client.delete(f"/reviews/{job_id}").json()["status"] == JOB_DONE
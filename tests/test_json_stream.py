@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from unittest.mock import patch
+
+from api_requests import analyze_files_pack, analyze_summary
+from benchmarks import fake_openai
+from json_stream import JSONFieldParser
+from tests.test_offline import fake_openai_client, fake_stats
+
+
+def test_parser_returns_each_field_once_as_it_completes():
+    text = '```json\n{"Solutions": "a, {b} \\" c", "Skills": ["x", {"y": 1}], "Rating": 4}\n```\nThanks'
+    parser = JSONFieldParser()
+
+    completed = {}
+    for end in range(1, len(text) + 1):
+        for name, value in parser.update(text[:end]):
+            completed[name] = end
+    assert parser.fields == {"Solutions": 'a, {b} " c', "Skills": ["x", {"y": 1}], "Rating": 4}
+    assert completed["Solutions"] < completed["Skills"] < completed["Rating"] == text.index("}\n") + 1
+    assert parser.complete
+
+    # A retried request starts over, the fields already returned are not returned again
+    assert parser.update('{"Solutions": "other", "Extra": 1}') == [("Extra", 1)]
+
+    free_text = JSONFieldParser()
+    assert free_text.update("The code {is} fine") == [] and free_text.is_object is False
+
+
+@pytest.mark.asyncio
+async def test_streamed_responses_emit_fields_and_stop_early():
+    client = fake_openai_client(fake_openai.create_app())
+    fields = []
+
+    async def on_field(name, value):
+        fields.append((name, value))
+
+    with patch("config.client", client), patch("api_requests.STREAM_ENABLED", True):
+        summary = await analyze_summary(["Analysis"], "Structure", "junior", "task", on_field)
+        pack = await analyze_files_pack([("a.py", "x = 1"), ("b.py", "y = 2")], "junior", "task")
+
+    assert json.loads(summary) == fake_openai.REVIEW
+    assert fields == list(fake_openai.REVIEW.items())
+    assert json.loads(pack) == {"a.py": "Fake analysis of a.py.", "b.py": "Fake analysis of b.py."}
+    stats = await fake_stats(client)
+    assert stats["streamed"] == 2
@@ -0,0 +1,142 @@
+import json
+
+import httpx
+import openai
+import pytest
+from unittest.mock import patch, AsyncMock, Mock
+
+from fastapi.testclient import TestClient
+
+from cache import analysis_cache
+from main import app
+from metrics import Counter, Gauge, Histogram, MetricsRegistry, InstrumentedTransport, registry
+from metrics import STAGE_SECONDS, GITHUB_REQUESTS, OPENAI_REQUESTS, OPENAI_TOKENS, ERRORS, REVIEWS_IN_FLIGHT
+from scheduler import OpenAIScheduler
+from services import FileStream
+from snapshots import snapshot_store
+
+
+FINAL = {"Solutions": "Mocked solution", "Skills": "Mocked skills", "Rating": 4}
+FILES = {"main.py": "print('hello')", "README.md": "# Project"}
+
+
+def make_response(content: str, prompt_tokens: int = 100, completion_tokens: int = 20) -> Mock:
+    usage = Mock(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                 total_tokens=prompt_tokens + completion_tokens)
+    return Mock(choices=[Mock(message=Mock(role="assistant", content=content))], usage=usage)
+
+
+def test_exposition_format():
+    test_registry = MetricsRegistry()
+    counter = test_registry.register(Counter("test_requests_total", "Requests.", ["status"]))
+    gauge = test_registry.register(Gauge("test_in_flight", "In flight."))
+    histogram = test_registry.register(Histogram("test_seconds", "Duration.", ["stage"], buckets=[0.1, 1]))
+
+    counter.inc(status='a"b')
+    counter.inc(2, status="ok")
+    with gauge.track_inprogress():
+        assert gauge.value() == 1
+    histogram.observe(0.05, stage="map")
+    histogram.observe(0.5, stage="map")
+    histogram.observe(5, stage="map")
+
+    assert test_registry.render().splitlines() == [
+        "# HELP test_requests_total Requests.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{status="a\\"b"} 1.0',
+        'test_requests_total{status="ok"} 2.0',
+        "# HELP test_in_flight In flight.",
+        "# TYPE test_in_flight gauge",
+        "test_in_flight 0.0",
+        "# HELP test_seconds Duration.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="map",le="0.1"} 1.0',
+        'test_seconds_bucket{stage="map",le="1.0"} 2.0',
+        'test_seconds_bucket{stage="map",le="+Inf"} 3.0',
+        'test_seconds_sum{stage="map"} 5.55',
+        'test_seconds_count{stage="map"} 3.0',
+    ]
+
+
+def test_labels_must_match():
+    counter = Counter("test_total", "Test.", ["model"])
+
+    with pytest.raises(ValueError):
+        counter.inc(stage="map")
+    with pytest.raises(ValueError):
+        counter.inc(-1, model="m")
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_scheduler_counts_requests_tokens_and_errors(mock_create):
+    registry.clear()
+    scheduler = OpenAIScheduler(1000, 1000000, max_concurrency=4, max_retries=0)
+    mock_create.return_value = make_response("ok", prompt_tokens=120, completion_tokens=30)
+
+    await scheduler.create(stage="map", model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=10)
+
+    # The stage is a metrics label only
+    mock_create.assert_awaited_once_with(model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=10)
+    assert OPENAI_REQUESTS.value(model="m", stage="map", status="ok") == 1
+    assert OPENAI_TOKENS.value(model="m", stage="map", kind="prompt") == 120
+    assert OPENAI_TOKENS.value(model="m", stage="map", kind="completion") == 30
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    mock_create.side_effect = openai.BadRequestError(
+        "Simulated error", response=httpx.Response(400, request=request), body=None
+    )
+    with pytest.raises(openai.BadRequestError):
+        await scheduler.create(stage="reduce", model="m", messages=[])
+
+    assert OPENAI_REQUESTS.value(model="m", stage="reduce", status="BadRequestError") == 1
+    assert ERRORS.value(source="openai", type="BadRequestError") == 1
+
+
+@pytest.mark.asyncio
+async def test_instrumented_transport_counts_github_requests():
+    registry.clear()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if request.url.path == "/down":
+            raise httpx.ConnectError("Simulated error", request=request)
+        return httpx.Response(200)
+
+    transport = InstrumentedTransport(httpx.MockTransport(handler))
+    async with httpx.AsyncClient(transport=transport, base_url="https://api.github.com") as client:
+        await client.get("/repos")
+        await client.get("/missing")
+        with pytest.raises(httpx.ConnectError):
+            await client.get("/down")
+
+    assert GITHUB_REQUESTS.value(method="GET", status="200") == 1
+    assert GITHUB_REQUESTS.value(method="GET", status="404") == 1
+    assert GITHUB_REQUESTS.value(method="GET", status="error") == 1
+    assert ERRORS.value(source="github", type="http_404") == 1
+    assert ERRORS.value(source="github", type="ConnectError") == 1
+
+
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+@patch("review.get_head_commit_sha", new_callable=AsyncMock, return_value=None)
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files(dict(FILES)))
+def test_metrics_endpoint_reports_review(mock_files, mock_sha, mock_create):
+    analysis_cache.clear()
+    snapshot_store.clear()
+    registry.clear()
+    mock_create.return_value = make_response(json.dumps(FINAL))
+
+    with patch("services.FAST_PATH_ENABLED", False), TestClient(app) as client:
+        review = client.post("/review", json={"description": "task", "git_url": "https://github.com/user/repo"})
+        response = client.get("/metrics")
+
+    assert review.status_code == 200
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for stage in ("structure", "map", "reduce", "total"):
+        assert STAGE_SECONDS.count(stage=stage) == 1
+    assert REVIEWS_IN_FLIGHT.value() == 0
+    assert 'codereview_openai_tokens_total{model="' in response.text
+    assert 'stage="summary",kind="completion"} 20.0' in response.text
+    assert 'codereview_stage_duration_seconds_count{stage="total"} 1.0' in response.text
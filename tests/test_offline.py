@@ -0,0 +1,111 @@
+import httpx
+import openai
+import pytest
+from unittest.mock import patch, AsyncMock, Mock
+
+from api_requests import analyze_file_content
+from benchmarks import fake_openai
+from cache import analysis_cache
+from offline import OfflineReview, build_batch_requests, run_offline_batch
+from schemas import ReviewRequest
+from services import map_request_arguments
+from static_analysis import static_analyzer
+from planner import MapRequest
+
+
+BIG = "".join(f"def function_{i}():\n" + "    value = 1\n" * 80 + "\n" for i in range(20))
+FILES = {"a.py": "print('a')", "b.py": "print('b')", "c.py": "x = 1\n" * 300, "big.py": BIG, "data.txt": None}
+
+
+def fake_openai_client(app) -> openai.AsyncOpenAI:
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://fake")
+    return openai.AsyncOpenAI(api_key="test", base_url="http://fake/v1", http_client=http_client, max_retries=0)
+
+
+async def fake_stats(client: openai.AsyncOpenAI) -> dict:
+    return (await client._client.get("http://fake/stats")).json()
+
+
+async def run(requests, client, openai_client=None) -> dict:
+    with patch("config.client", client), \
+            patch("offline.get_repository_files", new_callable=AsyncMock, side_effect=lambda url, http: dict(FILES)), \
+            patch("offline.OFFLINE_POLL_INTERVAL", 0.01):
+        return {item["index"]: item async for item in run_offline_batch(requests, openai_client=openai_client)}
+
+
+@pytest.mark.asyncio
+async def test_offline_batch_sends_map_stage_as_one_batch_job():
+    analysis_cache.clear()
+    client = fake_openai_client(fake_openai.create_app())
+    requests = [
+        ReviewRequest(description="Assignment", git_url="https://github.com/user/repo"),
+        ReviewRequest(description="Assignment", git_url="not a url"),
+    ]
+
+    results = await run(requests, client)
+
+    assert results[0]["status"] == "done"
+    assert results[0]["result"][0]["Rating"] == 3
+    assert results[1]["status"] == "failed" and results[1]["error"]["status_code"] == 404
+    stats = await fake_stats(client)
+    assert stats["batches"] == 1
+    # a.py and b.py packed, c.py single, big.py as its skeleton
+    assert stats["batch_requests"] == 3
+    # Only the structure analysis and the summary are sent online
+    assert stats["requests"] == 2
+
+    # The batch results are cached, an online review of the same files costs no map requests
+    again = await run(requests[:1], client)
+    assert again[0]["status"] == "done"
+    assert (await fake_stats(client))["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_offline_reduce_reuses_static_metrics():
+    analysis_cache.clear()
+    client = fake_openai_client(fake_openai.create_app())
+    analyzed = []
+
+    async def analyze(files):
+        analyzed.extend(name for name in files if name.endswith(".py"))
+        return await original(files)
+
+    original = static_analyzer.analyze
+    with patch.object(static_analyzer, "analyze", side_effect=analyze):
+        results = await run([ReviewRequest(description="", git_url="https://github.com/user/repo")], client)
+
+    assert results[0]["status"] == "done"
+    assert sorted(analyzed) == ["a.py", "b.py", "big.py", "c.py"]
+
+
+@pytest.mark.asyncio
+async def test_map_requests_fall_back_online_when_the_batch_job_fails():
+    analysis_cache.clear()
+    client = fake_openai_client(fake_openai.create_app())
+    failing = Mock()
+    failing.files.create = AsyncMock(side_effect=openai.APIConnectionError(request=httpx.Request("POST", "http://x")))
+
+    results = await run([ReviewRequest(description="", git_url="https://github.com/user/repo")], client, failing)
+
+    assert results[0]["status"] == "done"
+    stats = await fake_stats(client)
+    assert "batches" not in stats
+    assert stats["requests"] == 5
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_batch_request_bodies_match_online_requests(mock_create):
+    analysis_cache.clear()
+    mock_create.return_value = Mock(choices=[Mock(message=Mock(content="analysis"))], usage=None)
+    request = ReviewRequest(description="Assignment", dev_level="middle")
+    review = OfflineReview(0, request, files={"c.py": "x = 1\n" * 300})
+
+    lines, plan = build_batch_requests([review])
+    await analyze_file_content("c.py", "x = 1\n" * 300, "middle", "Assignment")
+
+    assert [line["custom_id"] for line in lines] == list(plan) == ["review-0-0"]
+    assert lines[0]["url"] == "/v1/chat/completions"
+    assert lines[0]["body"] == mock_create.await_args.kwargs
+    chunk = MapRequest("chunk", [("big.py", "def f(): pass")], (2, 3))
+    assert "File name: big.py (part 2/3)" in map_request_arguments(chunk, "junior", "")["messages"][1]["content"]
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from unittest.mock import patch, AsyncMock
+
+from cache import analysis_cache, file_analysis_key
+from planner import estimate_tokens, split_content, plan_map_requests
+from services import iter_file_analyses, _iterate, _is_valid_analysis
+from tests.conftest import MockOpenAIResponse
+
+
+async def map_stage(files: dict) -> dict:
+    return {name: analysis async for name, analysis in iter_file_analyses(_iterate([files]), "junior", "task")}
+
+
+def test_split_content_on_python_boundaries():
+    functions = [f"def func{i}():\n" + "    x = 1\n" * 20 for i in range(6)]
+    content = "import os\n\n" + "@decorator\n" + "\n".join(functions)
+
+    chunks = split_content("module.py", content, budget=120)
+
+    assert "".join(chunks) == content
+    assert all(estimate_tokens(chunk) <= 120 for chunk in chunks)
+    assert len(chunks) > 1
+    # every chunk after the first starts at a top-level function, the decorator stays with its function
+    assert all(chunk.startswith("def func") for chunk in chunks[1:])
+    assert "@decorator\ndef func0" in chunks[0]
+
+
+def test_split_content_huge_line():
+    content = "x" * 2000
+
+    chunks = split_content("data.md", content, budget=100)
+
+    assert "".join(chunks) == content
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_plan_map_requests_packs_and_splits():
+    files = {
+        "a/__init__.py": "",
+        "b/__init__.py": "",
+        "config.ini": "[a]\nb=1\n",
+        "medium.py": "x = 1\n" * 100,
+        "large.py": "def f():\n    return 1\n\n" * 300,
+    }
+
+    requests = plan_map_requests(files, budget=500, pack_file_tokens=50, max_files_per_pack=2)
+
+    kinds = [(request.kind, [name for name, _ in request.files]) for request in requests]
+    assert kinds[:3] == [
+        ("pack", ["a/__init__.py", "b/__init__.py"]),
+        ("single", ["medium.py"]),
+        ("chunk", ["large.py"]),
+    ]
+    assert kinds[-1] == ("single", ["config.ini"])
+    chunks = [request for request in requests if request.kind == "chunk"]
+    assert [request.part for request in chunks] == [(i, len(chunks)) for i in range(1, len(chunks) + 1)]
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_map_stage_maps_packed_results_back(mock_create):
+    analysis_cache.clear()
+    mock_create.return_value = MockOpenAIResponse(json.dumps({
+        "a.py": {"Solutions": "A", "Skills": "S", "Rating": 3},
+        "b.py": "B",
+    }))
+
+    result = await map_stage({"a.py": "x = 1", "b.py": "y = 2"})
+
+    mock_create.assert_awaited_once()
+    assert json.loads(result["a.py"]) == {"Solutions": "A", "Skills": "S", "Rating": 3}
+    assert result["b.py"] == "B"
+    # Cached under the key of the pack prompt, found by the lookup of any kind
+    assert analysis_cache.get(file_analysis_key("b.py", "y = 2", "junior", "task", "pack")) == "B"
+    assert analysis_cache.get(file_analysis_key("b.py", "y = 2", "junior", "task")) is None
+    assert await map_stage({"a.py": "x = 1", "b.py": "y = 2"}) == result
+    mock_create.assert_awaited_once()
+    analysis_cache.clear()
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_map_stage_retries_missing_packed_files(mock_create):
+    analysis_cache.clear()
+    mock_create.side_effect = [
+        MockOpenAIResponse(json.dumps({"a.py": "A"})),
+        MockOpenAIResponse("B alone"),
+    ]
+
+    result = await map_stage({"a.py": "x = 1", "b.py": "y = 2"})
+
+    assert result == {"a.py": "A", "b.py": "B alone"}
+    assert mock_create.await_count == 2
+    analysis_cache.clear()
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_map_stage_escalates_invalid_analyses_to_cascade_model(mock_create):
+    analysis_cache.clear()
+    review = {"Solutions": "Clear code.", "Skills": "Fine.", "Rating": 4}
+    good = json.dumps(review)
+
+    async def create(**kwargs):
+        if kwargs["model"] == "gpt-4-turbo":
+            return MockOpenAIResponse(good)
+        if "a.py" in kwargs["messages"][1]["content"]:
+            # b.py is free text instead of a review
+            return MockOpenAIResponse(json.dumps({"a.py": review, "b.py": "A detailed analysis, but not JSON."}))
+        return MockOpenAIResponse("")
+
+    mock_create.side_effect = create
+    with patch("services.CASCADE_MODEL", "gpt-4-turbo"):
+        result = await map_stage({"a.py": "x = 1", "b.py": "y = 2", "c.md": "z" * 2000})
+
+    assert result == {"a.py": good, "b.py": good, "c.md": good}
+    models = sorted(call.kwargs["model"] for call in mock_create.await_args_list)
+    assert models == ["gpt-3.5-turbo", "gpt-3.5-turbo", "gpt-4-turbo", "gpt-4-turbo"]
+    analysis_cache.clear()
+
+
+def test_only_json_reviews_are_valid_analyses():
+    review = '{"Solutions": "Clear code.", "Skills": "Fine.", "Rating": 4}'
+
+    assert _is_valid_analysis(review)
+    assert _is_valid_analysis(f"```json\n{review}\n```")
+    assert not _is_valid_analysis('{"Solutions": "Clear code.", "Rating": 4}')
+    assert not _is_valid_analysis("A detailed analysis of the file with weaknesses and good solutions.")
+    assert not _is_valid_analysis("Error: timeout")
+    assert not _is_valid_analysis("")
@@ -0,0 +1,225 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from fastapi.testclient import TestClient
+
+from cache import analysis_cache
+from fastapi import HTTPException
+
+from main import app
+from review import run_review_shared, _inflight
+from schemas import ReviewRequest
+from services import FileStream
+from snapshots import snapshot_store
+from tests.conftest import MockOpenAIResponse
+
+
+FINAL = {"Solutions": "Mocked solution", "Skills": "Mocked skills", "Rating": 4}
+FILES = {"main.py": "print('hello')", "README.md": "# Project", "data.txt": None}
+
+
+def parse_sse(text: str) -> list:
+    events = []
+    for message in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+@patch("review.get_head_commit_sha", new_callable=AsyncMock, return_value=None)
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files(dict(FILES)))
+def test_review_returns_final_payload(mock_files, mock_sha, mock_create):
+    analysis_cache.clear()
+    snapshot_store.clear()
+    mock_create.return_value = MockOpenAIResponse(json.dumps(FINAL))
+
+    with TestClient(app) as client:
+        response = client.post("/review", json={"description": "task", "git_url": "https://github.com/user/repo"})
+
+    assert response.status_code == 200
+    assert response.json() == [FINAL]
+
+
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+@patch("review.get_head_commit_sha", new_callable=AsyncMock, return_value=None)
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files(dict(FILES)))
+def test_review_stream_emits_progress_events(mock_files, mock_sha, mock_create):
+    analysis_cache.clear()
+    snapshot_store.clear()
+    mock_create.return_value = MockOpenAIResponse(json.dumps(FINAL))
+
+    with patch("services.PLANNER_ENABLED", False), patch("services.FAST_PATH_ENABLED", False):
+        with TestClient(app) as client:
+            response = client.post(
+                "/review/stream", json={"description": "task", "git_url": "https://github.com/user/repo"}
+            )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [event for event, _ in events]
+    # The structure and file analyses run concurrently
+    assert names[0] == "files" and names[-1] == "result"
+    assert sorted(names[1:-4]) == ["file", "file", "structure"]
+    # The fields of the final review arrive before the whole result
+    assert [(event, data["name"]) for event, data in events[-4:-1]] == [
+        ("field", "Solutions"), ("field", "Skills"), ("field", "Rating")
+    ]
+    assert events[-2][1]["value"] == FINAL["Rating"]
+    assert events[0][1]["analyzed"] == ["main.py", "README.md"]
+    assert {data["name"] for event, data in events if event == "file"} == {"main.py", "README.md"}
+    assert events[-1][1] == [FINAL]
+
+
+@patch("review.get_head_commit_sha", new_callable=AsyncMock, return_value=None)
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files({}))
+def test_review_stream_reports_errors(mock_files, mock_sha):
+    snapshot_store.clear()
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/review/stream", json={"description": "task", "git_url": "https://github.com/user/repo"}
+        )
+
+    assert parse_sse(response.text) == [
+        ("error", {"status_code": 404, "detail": "Repository, branch or valid files not found."})
+    ]
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_review():
+    release = asyncio.Event()
+
+    async def slow_review(request, timeout=None):
+        await release.wait()
+        return [FINAL]
+
+    request = ReviewRequest(description="task", git_url="https://github.com/user/repo")
+    other = ReviewRequest(description="other task", git_url="https://github.com/user/repo")
+    with patch("review.run_review", side_effect=slow_review) as mock_review:
+        waiters = [asyncio.create_task(run_review_shared(request)) for _ in range(3)]
+        waiters.append(asyncio.create_task(run_review_shared(other)))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+    assert mock_review.call_count == 2
+    assert results == [[FINAL]] * 4
+    assert not _inflight
+
+
+@pytest.mark.asyncio
+async def test_shared_review_error_reaches_every_caller():
+    async def failing_review(request, timeout=None):
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=503, detail="Error communicating with Git repository.")
+
+    request = ReviewRequest(description="task", git_url="https://github.com/user/repo")
+    with patch("review.run_review", side_effect=failing_review) as mock_review:
+        results = await asyncio.gather(*[run_review_shared(request) for _ in range(2)], return_exceptions=True)
+
+    assert mock_review.call_count == 1
+    assert all(isinstance(result, HTTPException) and result.status_code == 503 for result in results)
+
+
+@pytest.mark.asyncio
+async def test_disconnected_caller_does_not_cancel_shared_review():
+    release = asyncio.Event()
+
+    async def slow_review(request, timeout=None):
+        await release.wait()
+        return [FINAL]
+
+    request = ReviewRequest(description="task", git_url="https://github.com/user/repo")
+    with patch("review.run_review", side_effect=slow_review):
+        leader = asyncio.create_task(run_review_shared(request))
+        follower = asyncio.create_task(run_review_shared(request))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await follower == [FINAL]
+    assert leader.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_shared_review_is_cancelled_when_its_last_caller_disconnects():
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def slow_review(request, timeout=None):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    request = ReviewRequest(description="task", git_url="https://github.com/user/repo")
+    with patch("review.run_review", side_effect=slow_review):
+        caller = asyncio.create_task(run_review_shared(request, timeout=30))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+    assert not _inflight
+
+
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+@patch("review.get_head_commit_sha", new_callable=AsyncMock, return_value="abc")
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files(dict(FILES)))
+def test_review_returns_partial_summary_at_the_deadline(mock_files, mock_sha, mock_create):
+    analysis_cache.clear()
+    snapshot_store.clear()
+
+    async def create(**kwargs):
+        if "main.py" in kwargs["messages"][1]["content"]:
+            await asyncio.sleep(60)  # Outlives the deadline
+        return MockOpenAIResponse(json.dumps(FINAL))
+
+    mock_create.side_effect = create
+    with patch("services.PLANNER_ENABLED", False), patch("services.FAST_PATH_ENABLED", False), \
+            patch("review.DEADLINE_SUMMARY_RESERVE", 0.5):
+        with TestClient(app) as client:
+            response = client.post(
+                "/review", json={"description": "task", "git_url": "https://github.com/user/repo"},
+                headers={"X-Review-Timeout": "1"},
+            )
+
+    assert response.status_code == 200
+    assert response.json() == [{**FINAL, "Partial": True}]
+    # A partial review is not stored as the review of the commit
+    assert not snapshot_store._snapshots
+    analysis_cache.clear()
+
+
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+@patch("review.stream_repository_files", side_effect=lambda url, client: FileStream.from_files(dict(FILES)))
+def test_review_fetch_starts_with_the_head_commit_request(mock_files, mock_create):
+    analysis_cache.clear()
+    snapshot_store.clear()
+    mock_create.return_value = MockOpenAIResponse(json.dumps(FINAL))
+    fetch_started = []
+
+    async def head_commit(url, client):
+        fetch_started.append(mock_files.called)
+        return "abc"
+
+    with patch("review.get_head_commit_sha", side_effect=head_commit), patch("services.FAST_PATH_ENABLED", False):
+        with TestClient(app) as client:
+            counts = []
+            for _ in range(2):
+                response = client.post(
+                    "/review", json={"description": "task", "git_url": "https://github.com/user/repo"}
+                )
+                assert response.json() == [FINAL]
+                counts.append(mock_create.await_count)
+
+    # The second review of the same commit reuses the snapshot, its fetch is cancelled
+    assert fetch_started == [True, True]
+    assert counts[0] == counts[1]
+    analysis_cache.clear()
+    snapshot_store.clear()
@@ -0,0 +1,154 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from unittest.mock import patch, AsyncMock, Mock
+
+from scheduler import OpenAIScheduler, TokenBucket
+
+
+def make_status_error(error_class, status_code: int, headers: dict = None, body: dict = None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class("Simulated error", response=response, body=body)
+
+
+def make_scheduler(**kwargs) -> OpenAIScheduler:
+    options = dict(requests_per_minute=1000, tokens_per_minute=1000000, max_concurrency=4,
+                   min_concurrency=1, max_retries=3, backoff_base=0.01, backoff_max=5)
+    options.update(kwargs)
+    return OpenAIScheduler(**options)
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_retry_after_honoured_and_concurrency_halved(mock_create):
+    scheduler = make_scheduler()
+    response = Mock(usage=None)
+    mock_create.side_effect = [
+        make_status_error(openai.RateLimitError, 429, headers={"retry-after": "2"}),
+        response,
+    ]
+
+    with patch("scheduler.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        result = await scheduler.create(model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=10)
+
+    assert result is response
+    mock_sleep.assert_awaited_once_with(2.0)
+    assert scheduler.counters["retries"] == 1
+    assert scheduler.counters["throttled"] == 1
+    assert scheduler.stats()["concurrency_limit"] == 2
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_server_errors_retried_until_exhausted(mock_create):
+    scheduler = make_scheduler(max_retries=2)
+    mock_create.side_effect = make_status_error(openai.InternalServerError, 503)
+
+    with patch("scheduler.asyncio.sleep", new_callable=AsyncMock):
+        with pytest.raises(openai.InternalServerError):
+            await scheduler.create(model="m", messages=[])
+
+    assert mock_create.await_count == 3
+    assert scheduler.counters["failed"] == 1
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_failed_attempts_refund_token_estimate(mock_create):
+    scheduler = make_scheduler(max_retries=2, tokens_per_minute=1000)
+    mock_create.side_effect = make_status_error(openai.InternalServerError, 503)
+
+    with patch("scheduler.asyncio.sleep", new_callable=AsyncMock):
+        with pytest.raises(openai.InternalServerError):
+            await scheduler.create(model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=400)
+
+    assert mock_create.await_count == 3
+    assert scheduler.tokens.available > 900
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_client_errors_and_exhausted_quota_not_retried(mock_create):
+    scheduler = make_scheduler()
+    mock_create.side_effect = [
+        make_status_error(openai.BadRequestError, 400),
+        make_status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"}),
+    ]
+
+    with pytest.raises(openai.BadRequestError):
+        await scheduler.create(model="m", messages=[])
+    with pytest.raises(openai.RateLimitError):
+        await scheduler.create(model="m", messages=[])
+
+    assert mock_create.await_count == 2
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_concurrency_capped(mock_create):
+    scheduler = make_scheduler(max_concurrency=2)
+    in_flight = {"current": 0, "max": 0}
+
+    async def slow_create(**kwargs):
+        in_flight["current"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+        return Mock(usage=None)
+
+    mock_create.side_effect = slow_create
+
+    await asyncio.gather(*[scheduler.create(model="m", messages=[]) for _ in range(6)])
+
+    assert in_flight["max"] == 2
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)  # 1 unit per second
+    bucket.available = 0
+
+    with patch("scheduler.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        mock_sleep.side_effect = lambda delay: setattr(bucket, "available", bucket.available + delay)
+        await bucket.acquire(3)
+
+    assert mock_sleep.await_args_list[0].args[0] == pytest.approx(3, abs=0.1)
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.closed = False
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            yield Mock(usage=None, choices=[Mock(delta=Mock(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_stream_stops_early_and_closes_the_stream(mock_create):
+    scheduler = make_scheduler()
+    stream = FakeStream(['{"a": ', '1}', ' trailing', ' text'])
+    mock_create.return_value = stream
+    seen = []
+
+    async def on_text(text):
+        seen.append(text)
+        return text.endswith("}")
+
+    completion = await scheduler.stream(on_text=on_text, model="m", messages=[{"role": "user", "content": "hi"}])
+
+    assert completion.text == '{"a": 1}' and completion.stopped
+    assert seen == ['{"a": ', '{"a": 1}']
+    assert stream.closed
+    assert mock_create.await_args.kwargs["stream"] is True
+    assert scheduler.in_flight == 0
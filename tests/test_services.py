@@ -1,8 +1,21 @@
+import asyncio
+import io
+import re
+import tarfile
+
+import httpx
 import pytest
 from httpx import AsyncClient
+from unittest.mock import patch, AsyncMock
 
 from config import GITHUB_ROOT, GITHUB_API_URL
-from services import repo_url_to_git_api_url, get_all_files
+from services import repo_url_to_git_api_url, get_all_files, get_all_files_archive, _iter_tar_files
+from services import summarize_analysis, perform_analysis, stream_repository_files, FileStream
+from services import STRUCTURE_CUT_NOTE
+from planner import estimate_tokens
+from deadline import Deadline, DeadlineExceeded
+from cache import analysis_cache, file_analysis_key
+from tests.conftest import MockOpenAIResponse
 
 
 @pytest.fixture
@@ -97,3 +110,423 @@ async def test_get_all_files_request_error(httpx_mock):
         result = await get_all_files(root_url, client)
 
     assert result is None  # None for raise an exception
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_bounded_concurrency(httpx_mock):
+    # Mock for root request with many files
+    root_url = "https://api.github.com/repos/user/repo/contents"
+    httpx_mock.add_response(
+        url=root_url,
+        json=[
+            {"type": "file", "path": f"file{i}.py", "download_url": f"https://mock.file{i}.py"}
+            for i in range(6)
+        ],
+    )
+    in_flight = {"current": 0, "max": 0}
+
+    async def slow_download(request: httpx.Request) -> httpx.Response:
+        in_flight["current"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+        return httpx.Response(200, text=f"# {request.url.host}")
+
+    httpx_mock.add_callback(slow_download, url=re.compile(r"https://mock\.file\d\.py"), is_reusable=True)
+
+    async with AsyncClient() as client:
+        result = await get_all_files(root_url, client, concurrency=2)
+
+    assert list(result) == [f"file{i}.py" for i in range(6)]
+    assert in_flight["max"] == 2
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_subdir_and_file_errors(httpx_mock):
+    # Failed subdirectory is skipped, failed file maps to None
+    root_url = "https://api.github.com/repos/user/repo/contents"
+    httpx_mock.add_response(
+        url=root_url,
+        json=[
+            {"type": "file", "path": "file1.py", "download_url": "https://mock.file1.py"},
+            {"type": "dir", "path": "subdir", "_links": {"self": "https://mock.subdir"}}
+        ],
+    )
+    httpx_mock.add_response(url="https://mock.file1.py", status_code=500)
+    httpx_mock.add_exception(url="https://mock.subdir", exception=httpx.ConnectError("Connection refused"))
+
+    async with AsyncClient() as client:
+        result = await get_all_files(root_url, client)
+
+    assert result == {"file1.py": None}
+
+
+def make_tarball(files: dict, root: str = "user-repo-abc1234") -> bytes:
+    """Builds a gzipped tarball in the GitHub archive layout."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", format=tarfile.PAX_FORMAT) as archive:
+        archive.addfile(_dir_info(root))
+        for path, content in files.items():
+            info = tarfile.TarInfo(f"{root}/{path}")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _dir_info(name: str) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    return info
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_archive_success(httpx_mock):
+    repo_url = "https://api.github.com/repos/user/repo"
+    long_path = "deep/" * 30 + "module.py"
+    httpx_mock.add_response(
+        url=f"{repo_url}/git/trees/HEAD?recursive=1",
+        json={"sha": "abc", "truncated": False, "tree": [
+            {"path": "file1.py", "type": "blob"},
+            {"path": "data.bin", "type": "blob"},
+            {"path": "subdir", "type": "tree"},
+            {"path": "subdir/file3.ini", "type": "blob"},
+            {"path": long_path, "type": "blob"},
+        ]},
+    )
+    httpx_mock.add_response(
+        url=f"{repo_url}/tarball/HEAD",
+        content=make_tarball({
+            "file1.py": b"print('hello world')",
+            "data.bin": b"\x00" * 5000,
+            "subdir/file3.ini": b"[config]\nkey=value",
+            long_path: b"x = 1",
+        }),
+    )
+
+    async with AsyncClient() as client:
+        result = await get_all_files_archive(f"{repo_url}/contents", client)
+
+    assert result == {
+        "file1.py": "print('hello world')",
+        "data.bin": None,
+        "subdir/file3.ini": "[config]\nkey=value",
+        long_path: "x = 1",
+    }
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_all_files_archive_request_error(httpx_mock):
+    repo_url = "https://api.github.com/repos/user/repo"
+    httpx_mock.add_response(url=f"{repo_url}/git/trees/HEAD?recursive=1", status_code=404)
+
+    async with AsyncClient() as client:
+        result = await get_all_files_archive(f"{repo_url}/contents", client)
+
+    assert result is None
+
+
+@pytest.mark.asyncio
+async def test_iter_tar_files_skips_rejected_members():
+    archive = make_tarball({"keep.py": b"a" * 1000, "skip.md": b"b" * 200000})
+
+    async def chunks():
+        for i in range(0, len(archive), 100):
+            yield archive[i:i + 100]
+
+    result = [item async for item in _iter_tar_files(chunks(), lambda path: path.endswith(".py"))]
+
+    assert result == [("keep.py", b"a" * 1000)]
+
+
+async def fake_reduce(batch, dev_level, description, on_field=None):
+    await asyncio.sleep(0)
+    return "(" + "+".join(batch) + ")"
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_reduces_every_result_once():
+    results = [f"r{i}" for i in range(20)]
+
+    with patch("services.REDUCE_TOKEN_BUDGET", 12), \
+            patch("services.analyze_reduce", side_effect=fake_reduce) as mock_reduce:
+        summary = await summarize_analysis(list(results), "structure", "junior", "task")
+
+    assert sorted(re.findall(r"r\d+|structure", summary)) == sorted(results + ["structure"])
+    # Every request is within the budget, except pairs of results that are larger than the budget together
+    assert all(
+        sum(map(estimate_tokens, call.args[0])) <= 12 or len(call.args[0]) == 2
+        for call in mock_reduce.call_args_list
+    )
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_packs_results_by_tokens():
+    short, long = ["ok"] * 30, ["x" * 4000] * 4
+
+    with patch("services.REDUCE_TOKEN_BUDGET", 3000), patch("services.REDUCE_EARLY_SHARE", 1.0), \
+            patch("services.analyze_summary", new_callable=AsyncMock, return_value="summary") as mock_summary, \
+            patch("services.analyze_reduce", side_effect=fake_reduce) as mock_reduce:
+        # Thirty one-liners fit into a single summary request
+        assert await summarize_analysis(list(short), "structure", "junior", "task") == "summary"
+        assert len(mock_summary.await_args.args[0]) == 30
+        assert not mock_reduce.called
+
+        # Four results of 1000 tokens need two reduce requests and the final one
+        await summarize_analysis(list(long), "structure", "junior", "task")
+    assert [len(call.args[0]) for call in mock_reduce.call_args_list] == [3, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_reduces_while_results_are_pending():
+    release = asyncio.Event()
+    reduced_early = []
+
+    async def results():
+        for i in range(6):
+            yield f"r{i}"
+        await release.wait()  # A slow file analysis
+        yield "slow"
+
+    async def reduce_and_release(batch, dev_level, description, on_field=None):
+        reduced_early.append(not release.is_set())
+        release.set()
+        return await fake_reduce(batch, dev_level, description)
+
+    with patch("services.REDUCE_TOKEN_BUDGET", 5), patch("services.analyze_reduce", side_effect=reduce_and_release):
+        summary = await summarize_analysis(results(), "structure", "junior", "task", total=7)
+
+    assert reduced_early[0] is True
+    assert sorted(re.findall(r"r\d+|slow|structure", summary)) == sorted(
+        [f"r{i}" for i in range(6)] + ["slow", "structure"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_starts_early_reduces_below_the_full_budget():
+    release = asyncio.Event()
+    early_batches = []
+
+    async def results():
+        for i in range(3):
+            yield f"r{i}" + "x" * 1600  # 400 tokens each, far below the budget together
+        await release.wait()
+        yield "slow"
+
+    async def reduce_and_release(batch, dev_level, description, on_field=None):
+        if not release.is_set():
+            early_batches.append(len(batch))
+        release.set()
+        return await fake_reduce(batch, dev_level, description)
+
+    with patch("services.REDUCE_TOKEN_BUDGET", 3000), patch("services.REDUCE_EARLY_SHARE", 0.25), \
+            patch("services.analyze_reduce", side_effect=reduce_and_release):
+        await summarize_analysis(results(), "structure", "junior", "task", total=4)
+
+    # A quarter of the budget starts the first reduce while the slow analysis is pending
+    assert early_batches == [2]
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_reduces_early_on_token_budget():
+    results = ["x" * 8000] + ["y"] * 9
+
+    with patch("services.REDUCE_TOKEN_BUDGET", 1500):
+        with patch("services.analyze_reduce", side_effect=fake_reduce) as mock_reduce:
+            await summarize_analysis(results, "structure", "junior", "task")
+
+    # The structure and the large result exceed the budget, they are reduced before the other results are ready
+    assert mock_reduce.call_args_list[0].args[0] == ["structure", "x" * 8000]
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_notes_a_structure_cut_off_by_the_deadline():
+    async def results():
+        yield "r0"
+        yield "r1"
+        await asyncio.sleep(60)
+        yield "late"
+
+    async def slow_structure():
+        await asyncio.sleep(60)
+        return "structure"
+
+    deadline = Deadline(timeout=0.2, reserve=0.1)
+    with patch("services.REDUCE_TOKEN_BUDGET", 100), \
+            patch("services.analyze_summary", new_callable=AsyncMock, return_value="summary") as mock_summary:
+        summary = await summarize_analysis(
+            results(), slow_structure(), "junior", "task", total=3, deadline=deadline
+        )
+
+    assert summary == "summary"
+    assert deadline.partial
+    analyses, structure = mock_summary.await_args.args[:2]
+    assert analyses == ["r0", "r1"]
+    assert structure == STRUCTURE_CUT_NOTE
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_summarizes_completed_results_at_the_deadline():
+    cancelled = asyncio.Event()
+
+    async def results():
+        yield "r0"
+        yield "r1"
+        try:
+            await asyncio.sleep(60)  # A file analysis that would outlive the deadline
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        yield "late"
+
+    async def slow_reduce(batch, dev_level, description, on_field=None):
+        await asyncio.sleep(60)
+
+    deadline = Deadline(timeout=0.2, reserve=0.1)
+    with patch("services.REDUCE_TOKEN_BUDGET", 100), \
+            patch("services.analyze_summary", new_callable=AsyncMock, return_value="summary") as mock_summary, \
+            patch("services.analyze_reduce", side_effect=slow_reduce):
+        summary = await summarize_analysis(results(), "structure", "junior", "task", total=3, deadline=deadline)
+
+    assert summary == "summary"
+    assert deadline.partial and cancelled.is_set()
+    assert sorted(mock_summary.await_args.args[0]) == ["r0", "r1"]
+
+
+@pytest.mark.asyncio
+async def test_summarize_analysis_fails_if_nothing_completed_by_the_deadline():
+    async def results():
+        await asyncio.sleep(60)
+        yield "late"
+
+    with pytest.raises(DeadlineExceeded):
+        await summarize_analysis(results(), "structure", "junior", "task", total=1, deadline=Deadline(0.05))
+
+
+@pytest.mark.asyncio
+async def test_stream_repository_files_lists_before_downloading(httpx_mock):
+    root_url = "https://api.github.com/repos/user/repo/contents"
+    httpx_mock.add_response(
+        url=root_url,
+        json=[
+            {"type": "file", "path": "file1.py", "download_url": "https://mock.file1.py"},
+            {"type": "file", "path": "file2.txt", "download_url": "https://mock.file2.txt"},
+            {"type": "dir", "path": "subdir", "_links": {"self": "https://mock.subdir"}}
+        ],
+    )
+    httpx_mock.add_response(
+        url="https://mock.subdir",
+        json=[{"type": "file", "path": "subdir/file3.md", "download_url": "https://mock.file3.md"}],
+    )
+    release = asyncio.Event()
+
+    async def slow_download(request: httpx.Request) -> httpx.Response:
+        await release.wait()
+        return httpx.Response(200, text=f"# {request.url.host}")
+
+    httpx_mock.add_callback(slow_download, url=re.compile(r"https://mock\.file\d\.(py|md)"), is_reusable=True)
+
+    async with AsyncClient() as client:
+        with patch("services.FETCH_MODE", "contents"):
+            stream = stream_repository_files(root_url, client)
+        # The listing is known while the file bodies are still downloading
+        assert sorted(await stream.listing) == ["file1.py", "file2.txt", "subdir/file3.md"]
+        assert sorted(stream.selected) == ["file1.py", "subdir/file3.md"]
+        release.set()
+        received = {}
+        async for batch in stream.batches():
+            received.update(batch)
+
+    assert received == {"file1.py": "# mock.file1.py", "subdir/file3.md": "# mock.file3.md"}
+    assert stream.files == {**received, "file2.txt": None}
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_starts_before_download_finishes(mock_create):
+    mock_create.return_value = MockOpenAIResponse("Analysis")
+    stream = FileStream()
+    stream.set_listing(["a.py", "b.py"])
+
+    with patch("services.CACHE_ENABLED", False), patch("services.FAST_PATH_ENABLED", False):
+        task = asyncio.create_task(perform_analysis(stream, "junior", "task"))
+        stream.put("a.py", "x = 1")
+        for _ in range(20):
+            await asyncio.sleep(0)
+        prompts = [call.kwargs["messages"][1]["content"] for call in mock_create.await_args_list]
+        # The structure and the first file are analyzed while b.py is still downloading
+        assert any(prompt.startswith("Project structure:a.py, b.py") for prompt in prompts)
+        assert any(prompt.startswith("File name: a.py") for prompt in prompts)
+        assert not task.done()
+
+        stream.put("b.py", "x = 2")
+        stream.finish({"a.py": "x = 1", "b.py": "x = 2"})
+        assert await task == "Analysis"
+
+    # structure + 2 files + summary
+    assert mock_create.await_count == 4
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_reviews_small_repository_with_one_request(mock_create):
+    review = '{"Solutions": "Good", "Skills": "Fine", "Rating": 4}'
+    mock_create.return_value = MockOpenAIResponse(review)
+    files = {"main.py": "print('hello')", "README.md": "# Readme", "data.bin": None}
+
+    result = await perform_analysis(files, "junior", "task")
+
+    assert result == review
+    assert mock_create.await_count == 1
+    prompt = mock_create.await_args.kwargs["messages"][1]["content"]
+    assert prompt.startswith("Project structure:main.py, README.md, data.bin")
+    assert "File name: main.py\nprint('hello')" in prompt and "File name: README.md" in prompt
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_fast_path_falls_back_to_map_reduce(mock_create):
+    mock_create.return_value = MockOpenAIResponse("Not a review")
+    files = {"main.py": "print('hello')", "README.md": "# Readme"}
+
+    with patch("services.CACHE_ENABLED", False), patch("services.PLANNER_ENABLED", False):
+        # Over the budget: no fast path request
+        with patch("services.FAST_PATH_TOKEN_BUDGET", 5):
+            await perform_analysis(dict(files), "junior", "task")
+        assert mock_create.await_count == 4  # Structure, two files, summary
+
+        # An invalid fast path response: the files are analyzed separately
+        mock_create.reset_mock()
+        await perform_analysis(dict(files), "junior", "task")
+    assert mock_create.await_count == 5
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_fast_path_skipped_for_stored_analyses(mock_create):
+    mock_create.return_value = MockOpenAIResponse("Analysis")
+    files = {"main.py": "print('hello')", "README.md": "# Readme"}
+    analysis_cache.clear()
+    analysis_cache.set(file_analysis_key("main.py", files["main.py"], "junior", "task"), "Cached analysis")
+    analyses = {}
+
+    with patch("services.PLANNER_ENABLED", False):
+        await perform_analysis(dict(files), "junior", "task", analyses)
+    analysis_cache.clear()
+
+    prompts = [call.kwargs["messages"][1]["content"] for call in mock_create.await_args_list]
+    # Structure, README.md and summary: no single request review, main.py comes from the cache
+    assert mock_create.await_count == 3
+    assert not any(prompt.startswith("Project structure:") and "File name:" in prompt for prompt in prompts)
+    assert analyses == {"main.py": "Cached analysis", "README.md": "Analysis"}
+
+
+@pytest.mark.asyncio
+async def test_perform_analysis_fast_path_respects_the_deadline():
+    async def slow_review(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    deadline = Deadline(timeout=0.1, reserve=0.05)
+    with patch("services.CACHE_ENABLED", False), patch("services.analyze_repository", side_effect=slow_review):
+        with pytest.raises(DeadlineExceeded):
+            await perform_analysis({"main.py": "print('hello')"}, "junior", "task", deadline=deadline)
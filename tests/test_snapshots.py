@@ -0,0 +1,66 @@
+import pytest
+
+from unittest.mock import patch, AsyncMock
+
+from cache import analysis_cache
+from services import perform_analysis
+from snapshots import git_blob_sha, reusable_analysis, build_snapshot, snapshot_key, SnapshotStore
+from tests.conftest import MockOpenAIResponse
+
+
+def test_git_blob_sha_matches_git():
+    # git hash-object of "hello\n"
+    assert git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_reusable_analysis_returns_only_unchanged_files():
+    snapshot = build_snapshot(
+        "sha1",
+        {"same.py": "x = 1", "changed.py": "x = 1", "deleted.py": "y = 1"},
+        {"same.py": "Good", "changed.py": "Old", "deleted.py": "Gone"},
+        "{}"
+    )
+
+    assert reusable_analysis(snapshot, "same.py", "x = 1") == "Good"
+    assert reusable_analysis(snapshot, "changed.py", "x = 2") is None
+    assert reusable_analysis(snapshot, "new.py", "x = 1") is None
+    assert reusable_analysis(None, "same.py", "x = 1") is None
+
+
+def test_build_snapshot_skips_failed_analyses():
+    files = {"a.py": "x = 1", "b.py": "x = 2"}
+
+    snapshot = build_snapshot("sha1", files, {"a.py": "Good", "b.py": "Error: OpenAI API failed"}, "{}")
+
+    assert snapshot.analyses == {"a.py": "Good"}
+    assert set(snapshot.blob_shas) == {"a.py"}
+
+
+def test_snapshot_store_key_and_eviction():
+    store = SnapshotStore(max_repositories=1)
+    first = snapshot_key("https://api.github.com/repos/user/repo/contents", "junior", "task")
+    second = snapshot_key("https://api.github.com/repos/user/repo/contents", "middle", "task")
+    store.set(first, build_snapshot("sha1", {}, {}, "{}"))
+    store.set(second, build_snapshot("sha2", {}, {}, "{}"))
+
+    assert first != second
+    assert store.get(first) is None
+    assert store.get(second).commit_sha == "sha2"
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_perform_analysis_reuses_analyses(mock_create):
+    analysis_cache.clear()
+    mock_create.return_value = MockOpenAIResponse("Analysis")
+    files = {"same.py": "x = 1", "changed.py": "x = 2"}
+    analyses = {"same.py": "Stored analysis"}
+
+    await perform_analysis(files, "junior", "task", analyses)
+
+    # structure + changed.py + summary
+    assert mock_create.await_count == 3
+    assert analyses == {"same.py": "Stored analysis", "changed.py": "Analysis"}
+    summary_prompt = mock_create.await_args_list[-1].kwargs["messages"][1]["content"]
+    assert "Stored analysis" in summary_prompt
+    analysis_cache.clear()
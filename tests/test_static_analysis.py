@@ -0,0 +1,110 @@
+import ast
+
+import pytest
+from unittest.mock import patch, AsyncMock, Mock
+
+from static_analysis import StaticAnalyzer, analyze_source, apply_skeletons, build_skeleton, metrics_report
+from services import perform_analysis
+
+
+SOURCE = '''
+import os
+
+
+def complex_function(items, flag):
+    """Branches a lot."""
+    if not items:
+        return 0
+    total = 0
+    for item in items:
+        if item > 0 and flag:
+            while item:
+                item -= 1
+        elif item < 0:
+            total += 1
+    try:
+        os.remove("x")
+    except:
+        pass
+    return [value for value in items if value]
+
+
+class Service:
+    def method(self, value: int) -> int:
+        return value
+
+    def copy_one(self):
+        a = 1
+        b = 2
+        c = a + b
+        d = c * 2
+        return d
+
+    def copy_two(self):
+        a = 1
+        b = 2
+        c = a + b
+        d = c * 2
+        return d
+'''
+
+
+def test_analyze_source_metrics():
+    metrics = analyze_source("service.py", SOURCE)
+
+    functions = {function.name: function for function in metrics.functions}
+    assert set(functions) == {"complex_function", "Service.method", "Service.copy_one", "Service.copy_two"}
+    # if, for, if + and, while, elif, except, comprehension + its if
+    assert functions["complex_function"].complexity == 10
+    assert functions["complex_function"].nesting == 3
+    assert functions["Service.method"].typed and not functions["complex_function"].typed
+    assert metrics.bare_excepts == [18]
+    assert functions["Service.copy_one"].body_hash == functions["Service.copy_two"].body_hash
+    assert metrics.skeleton is None
+    assert analyze_source("broken.py", "def f(:\n").error.startswith("line 1")
+
+
+def test_skeleton_keeps_hotspots_and_elides_other_bodies():
+    metrics = analyze_source("service.py", SOURCE)
+
+    skeleton = build_skeleton("service.py", SOURCE, ast.parse(SOURCE), metrics)
+    assert "# Hotspot: 16 lines, complexity 10, nesting 3" in skeleton
+    assert "            while item:" in skeleton
+    assert "    def method(self, value: int) -> int:\n        ...  # 2 lines, complexity 1" in skeleton
+    assert "return d" not in skeleton
+    metrics.skeleton = skeleton
+    assert apply_skeletons({"service.py": SOURCE, "a.md": "text"}, {"service.py": metrics}) == {
+        "service.py": skeleton, "a.md": "text"
+    }
+
+    report = metrics_report({"service.py": metrics})
+    assert "- bare except clauses: 1 (service.py:18)" in report
+    assert "service.py:Service.copy_one = service.py:Service.copy_two" in report
+    assert "10 or more: 1 (service.py:complex_function 10)" in report
+
+
+@pytest.mark.asyncio
+async def test_static_analyzer_uses_the_process_pool_for_large_batches():
+    analyzer = StaticAnalyzer(workers=2)
+    files = {f"module_{i}.py": SOURCE * 20 for i in range(4)}
+    files["README.md"] = "# readme"
+    try:
+        metrics = await analyzer.analyze(files)
+        assert analyzer._pool is not None
+    finally:
+        analyzer.close()
+
+    assert set(metrics) == {f"module_{i}.py" for i in range(4)}
+    assert all(file.skeleton is not None for file in metrics.values())
+
+
+@pytest.mark.asyncio
+@patch("config.client.chat.completions.create", new_callable=AsyncMock)
+async def test_metrics_report_reaches_the_summary(mock_create):
+    mock_create.return_value = Mock(choices=[Mock(message=Mock(content="Analysis"))], usage=None)
+
+    with patch("services.CACHE_ENABLED", False):
+        await perform_analysis({"service.py": SOURCE, "README.md": "# readme"}, "junior", "task")
+
+    prompts = [call.kwargs["messages"][1]["content"] for call in mock_create.await_args_list]
+    assert any("Static analysis of 1 Python files" in prompt for prompt in prompts)